@@ -3,6 +3,9 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The async payment endpoints (payments.views.async_*) only pay off when served
+through an ASGI server, e.g. ``uvicorn config.asgi:application --workers 4``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
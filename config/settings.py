@@ -1,4 +1,4 @@
-from decouple import config as decouple_config
+from decouple import Csv, config as decouple_config
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -34,6 +34,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'payments.middleware.MetricsMiddleware',
+    'payments.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +76,58 @@ DATABASES = {
     }
 }
 
+# Réplicas de lecture : mêmes paramètres que `default`, sauf NAME (fichier SQLite, relatif à
+# BASE_DIR) ou HOST (serveur)
+for index, replica in enumerate(decouple_config('DATABASE_REPLICAS', default='', cast=Csv())):
+    if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+        replica = {'NAME': BASE_DIR / replica}
+    else:
+        replica = {'HOST': replica}
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], **replica, 'TEST': {'MIRROR': 'default'}}
+
+# Liste, détail, export et analytics lus sur un réplica à jour (payments.replicas)
+DATABASE_ROUTERS = ['payments.replicas.ReplicaRouter']
+
+PAYMENTS_DB_REPLICAS = {
+    "ALIASES": [alias for alias in DATABASES if alias != 'default'],
+    # Après une écriture, le client et le paiement écrits sont lus sur le primaire (>= MAX_LAG)
+    "PIN_SECONDS": decouple_config("DATABASE_REPLICA_PIN_SECONDS", default=5, cast=int),
+    # Au-delà, le réplica est écarté ; sans réplica à jour, tout est lu sur le primaire
+    "MAX_LAG": decouple_config("DATABASE_REPLICA_MAX_LAG", default=2.0, cast=float),
+    "LAG_CHECK_INTERVAL": decouple_config("DATABASE_REPLICA_LAG_CHECK_INTERVAL", default=5.0, cast=float),
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# L'alias `payments` doit être partagé entre workers (fichiers, Redis, Memcached...) :
+# il porte le token OAuth PayPal commun à tous les processus.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'payments': {
+        'BACKEND': decouple_config(
+            "PAYMENTS_CACHE_BACKEND", default='payments.cache_backends.AtomicFileBasedCache'
+        ),
+        'LOCATION': decouple_config("PAYMENTS_CACHE_LOCATION", default=str(BASE_DIR / '.cache' / 'payments')),
+    },
+    # Cache de lecture des paiements (PAYMENTS_STATUS_CACHE), séparé : ses évictions
+    # ne touchent ni le token, ni les verrous, ni les disjoncteurs de `payments`
+    'payments_status': {
+        'BACKEND': decouple_config(
+            "PAYMENTS_STATUS_CACHE_BACKEND", default='payments.cache_backends.AtomicFileBasedCache'
+        ),
+        'LOCATION': decouple_config(
+            "PAYMENTS_STATUS_CACHE_LOCATION", default=str(BASE_DIR / '.cache' / 'payments-status')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': decouple_config("PAYMENTS_STATUS_CACHE_MAX_ENTRIES", default=5000, cast=int),
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -111,6 +165,16 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+SWAGGER_SETTINGS = {
+    'DEFAULT_INFO': 'config.urls.api_info',
+}
+
+# Schéma OpenAPI précalculé par manage.py build_openapi_schema (payments.openapi)
+PAYMENTS_OPENAPI = {
+    "DIR": decouple_config("PAYMENTS_OPENAPI_DIR", default=str(BASE_DIR / 'openapi')),
+    "MAX_AGE": decouple_config("PAYMENTS_OPENAPI_MAX_AGE", default=300, cast=int),  # Cache-Control, secondes
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -127,5 +191,158 @@ PAYPAL_CONFIG = {
     "PAYPAL_CURRENCY": decouple_config("PAYPAL_CURRENCY"),
     "PAYPAL_SUCCESS_URL": decouple_config("PAYPAL_SUCCESS_URL"),
     "PAYPAL_CANCEL_URL": decouple_config("PAYPAL_CANCEL_URL"),
+    # URL de base de l'API REST (ex. serveur local `manage.py run_fake_paypal`) ; vide : selon PAYPAL_MODE
+    "PAYPAL_ENDPOINT": decouple_config("PAYPAL_ENDPOINT", default=''),
+    "PAYPAL_TIMEOUT": decouple_config("PAYPAL_TIMEOUT", default=30.0, cast=float),  # secondes
+    "PAYPAL_TOKEN_REFRESH_MARGIN": decouple_config("PAYPAL_TOKEN_REFRESH_MARGIN", default=300, cast=int),  # secondes
+    # Pool de connexions keep-alive vers PayPal (par processus)
+    "PAYPAL_POOL_CONNECTIONS": decouple_config("PAYPAL_POOL_CONNECTIONS", default=4, cast=int),
+    "PAYPAL_POOL_MAXSIZE": decouple_config("PAYPAL_POOL_MAXSIZE", default=20, cast=int),
+    "PAYPAL_POOL_BLOCK": decouple_config("PAYPAL_POOL_BLOCK", default=False, cast=bool),
+    "PAYPAL_KEEP_ALIVE": decouple_config("PAYPAL_KEEP_ALIVE", default=True, cast=bool),
+    # Api PayPal gardées par processus (une par marchand, LRU), et clients async par boucle
+    "PAYPAL_MERCHANT_POOL_SIZE": decouple_config("PAYPAL_MERCHANT_POOL_SIZE", default=64, cast=int),
+    # Execute regroupé par payment_id (single-flight) : verrou inter-workers et mémo du résultat, en secondes
+    "PAYPAL_EXECUTE_LOCK_TIMEOUT": decouple_config("PAYPAL_EXECUTE_LOCK_TIMEOUT", default=60, cast=int),
+    "PAYPAL_EXECUTE_MEMO_TIMEOUT": decouple_config("PAYPAL_EXECUTE_MEMO_TIMEOUT", default=60, cast=int),
+    # Création de paiements par lot
+    "PAYPAL_BATCH_CONCURRENCY": decouple_config("PAYPAL_BATCH_CONCURRENCY", default=8, cast=int),
+    "PAYPAL_BATCH_MAX_ITEMS": decouple_config("PAYPAL_BATCH_MAX_ITEMS", default=100, cast=int),
+    # Webhooks : PAYPAL_WEBHOOK_CERT_PATH épingle un certificat local (tests, fixtures)
+    "PAYPAL_WEBHOOK_ID": decouple_config("PAYPAL_WEBHOOK_ID", default=''),
+    "PAYPAL_WEBHOOK_CERT_PATH": decouple_config("PAYPAL_WEBHOOK_CERT_PATH", default=''),
+    # Écart maximal (secondes) entre Paypal-Transmission-Time et la réception
+    "PAYPAL_WEBHOOK_TOLERANCE": decouple_config("PAYPAL_WEBHOOK_TOLERANCE", default=300, cast=int),
+    "PAYPAL_WEBHOOK_BATCH_SIZE": decouple_config("PAYPAL_WEBHOOK_BATCH_SIZE", default=500, cast=int),
+    # Timeouts (connexion, lecture) en secondes par opération ; PAYPAL_TIMEOUT sert pour le reste
+    "PAYPAL_TIMEOUTS": {
+        operation: decouple_config(
+            f"PAYPAL_TIMEOUT_{operation.upper()}", default=default, cast=Csv(cast=float, post_process=tuple)
+        )
+        for operation, default in (
+            ('token', '3.05,10'),
+            ('create', '3.05,20'),
+            ('execute', '3.05,30'),
+            ('lookup', '3.05,10'),
+            ('refund', '3.05,30'),
+        )
+    },
+    # Disjoncteurs par opération (état partagé via le cache `payments`) et nouveaux essais
+    "PAYPAL_BREAKER_FAILURE_THRESHOLD": decouple_config("PAYPAL_BREAKER_FAILURE_THRESHOLD", default=5, cast=int),
+    "PAYPAL_BREAKER_WINDOW": decouple_config("PAYPAL_BREAKER_WINDOW", default=30, cast=int),  # secondes
+    "PAYPAL_BREAKER_RESET_TIMEOUT": decouple_config("PAYPAL_BREAKER_RESET_TIMEOUT", default=30, cast=int),  # secondes
+    "PAYPAL_RETRY_MAX_ATTEMPTS": decouple_config("PAYPAL_RETRY_MAX_ATTEMPTS", default=3, cast=int),
+    "PAYPAL_RETRY_BACKOFF_BASE": decouple_config("PAYPAL_RETRY_BACKOFF_BASE", default=0.2, cast=float),
+    "PAYPAL_RETRY_BACKOFF_MAX": decouple_config("PAYPAL_RETRY_BACKOFF_MAX", default=2.0, cast=float),
+    # Budget : nouveaux essais limités à ce ratio des appels (+ un minimum), par processus
+    "PAYPAL_RETRY_BUDGET_RATIO": decouple_config("PAYPAL_RETRY_BUDGET_RATIO", default=0.2, cast=float),
+    "PAYPAL_RETRY_BUDGET_MIN": decouple_config("PAYPAL_RETRY_BUDGET_MIN", default=10, cast=int),
+
+}
+
+# En-tête Idempotency-Key sur les écritures de PaymentViewSet (durées en secondes)
+PAYMENTS_IDEMPOTENCY = {
+    "TTL": decouple_config("PAYMENTS_IDEMPOTENCY_TTL", default=24 * 3600, cast=int),
+    "LOCK_TIMEOUT": decouple_config("PAYMENTS_IDEMPOTENCY_LOCK_TIMEOUT", default=120, cast=int),
+    "WAIT_TIMEOUT": decouple_config("PAYMENTS_IDEMPOTENCY_WAIT_TIMEOUT", default=30, cast=float),
+}
+
+# Métriques Prometheus (GET /metrics) ; avec TOKEN, exiger « Authorization: Bearer <TOKEN> »
+PAYMENTS_METRICS = {
+    "ENABLED": decouple_config("PAYMENTS_METRICS_ENABLED", default=True, cast=bool),
+    "TOKEN": decouple_config("PAYMENTS_METRICS_TOKEN", default=''),
+}
+
+# Chiffrement des secrets en base (Merchant.client_secret) : clés Fernet séparées par des virgules,
+# la première chiffre, toutes déchiffrent (rotation). Vide : clé dérivée de SECRET_KEY
+PAYMENTS_ENCRYPTION_KEYS = decouple_config("PAYMENTS_ENCRYPTION_KEYS", default='', cast=Csv())
+
+# Cache de lecture des paiements (GET /payments/{id}/) : LRU du processus devant le cache `payments_status`
+PAYMENTS_STATUS_CACHE = {
+    "ENABLED": decouple_config("PAYMENTS_STATUS_CACHE_ENABLED", default=True, cast=bool),
+    "CACHE_ALIAS": decouple_config("PAYMENTS_STATUS_CACHE_ALIAS", default='payments_status'),
+    "TIMEOUT": decouple_config("PAYMENTS_STATUS_CACHE_TIMEOUT", default=300, cast=int),
+    # Jetons de version et correspondances payment_id -> pk ; secondes
+    "KEY_TIMEOUT": decouple_config("PAYMENTS_STATUS_CACHE_KEY_TIMEOUT", default=24 * 3600, cast=int),
+    "LOCAL_MAX_ENTRIES": decouple_config("PAYMENTS_STATUS_CACHE_LOCAL_MAX_ENTRIES", default=10000, cast=int),
+}
+
+# Abonnements au statut d'un paiement (GET /api/async/payments/{id}/status/, via ASGI) ; secondes
+PAYMENTS_SUBSCRIPTIONS = {
+    # Relecture du cache de statut pour voir les écritures des autres workers
+    "POLL_INTERVAL": decouple_config("PAYMENTS_SUBSCRIPTIONS_POLL_INTERVAL", default=1.0, cast=float),
+    "LONG_POLL_TIMEOUT": decouple_config("PAYMENTS_SUBSCRIPTIONS_LONG_POLL_TIMEOUT", default=30.0, cast=float),
+    "SSE_TIMEOUT": decouple_config("PAYMENTS_SUBSCRIPTIONS_SSE_TIMEOUT", default=300.0, cast=float),
+    "HEARTBEAT": decouple_config("PAYMENTS_SUBSCRIPTIONS_HEARTBEAT", default=15.0, cast=float),
+    "SSE_RETRY_MS": decouple_config("PAYMENTS_SUBSCRIPTIONS_SSE_RETRY_MS", default=3000, cast=int),
+}
+
+# Balayage des paiements PENDING abandonnés (manage.py sweep_pending_payments)
+PAYMENTS_SWEEPER = {
+    # Âge minimal en secondes ; PayPal laisse 3 h à l'acheteur pour approuver
+    "MIN_AGE": decouple_config("PAYMENTS_SWEEPER_MIN_AGE", default=3 * 3600, cast=int),
+    "BATCH_SIZE": decouple_config("PAYMENTS_SWEEPER_BATCH_SIZE", default=200, cast=int),
+    "CONCURRENCY": decouple_config("PAYMENTS_SWEEPER_CONCURRENCY", default=8, cast=int),
+    "MAX_SECONDS": decouple_config("PAYMENTS_SWEEPER_MAX_SECONDS", default=300, cast=int),
+    "MAX_RATE": decouple_config("PAYMENTS_SWEEPER_MAX_RATE", default=20.0, cast=float),  # appels PayPal/s
+}
+
+# Archivage des paiements clos (manage.py archive_payments)
+PAYMENTS_ARCHIVE = {
+    # Au-delà de la fenêtre de remboursement PayPal (180 jours) : un paiement archivé n'est plus remboursable
+    "AFTER_MONTHS": decouple_config("PAYMENTS_ARCHIVE_AFTER_MONTHS", default=12, cast=int),
+    # archive_payments refuse une date limite plus récente que cette fenêtre
+    "REFUND_WINDOW_DAYS": decouple_config("PAYMENTS_ARCHIVE_REFUND_WINDOW_DAYS", default=180, cast=int),
+    "BATCH_SIZE": decouple_config("PAYMENTS_ARCHIVE_BATCH_SIZE", default=500, cast=int),
+    "MAX_SECONDS": decouple_config("PAYMENTS_ARCHIVE_MAX_SECONDS", default=600, cast=int),
+}
+
+# Journal d'événements de paiement (NDJSON, écrit par lots depuis un thread de fond)
+PAYMENTS_EVENTS = {
+    "LOG_FILE": decouple_config("PAYMENTS_EVENTS_LOG_FILE", default=str(BASE_DIR / 'logs' / 'payment-events.ndjson')),
+    "LEVEL": decouple_config("PAYMENTS_EVENTS_LEVEL", default='INFO'),
+    "MAX_BYTES": decouple_config("PAYMENTS_EVENTS_MAX_BYTES", default=50 * 1024 * 1024, cast=int),
+    "BACKUP_COUNT": decouple_config("PAYMENTS_EVENTS_BACKUP_COUNT", default=10, cast=int),
+    # Proportion conservée des événements DEBUG volumineux (charges PayPal complètes)
+    "SAMPLE_RATES": {
+        'paypal.request': decouple_config("PAYMENTS_EVENTS_SAMPLE_PAYPAL_REQUEST", default=0.01, cast=float),
+        'paypal.response': decouple_config("PAYMENTS_EVENTS_SAMPLE_PAYPAL_RESPONSE", default=0.01, cast=float),
+    },
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'payment_events': {
+            '()': 'payments.events.AsyncNDJSONHandler',
+            'filename': PAYMENTS_EVENTS['LOG_FILE'],
+            'max_bytes': PAYMENTS_EVENTS['MAX_BYTES'],
+            'backup_count': PAYMENTS_EVENTS['BACKUP_COUNT'],
+        },
+    },
+    'loggers': {
+        'payments.events': {
+            'handlers': ['payment_events'],
+            'level': PAYMENTS_EVENTS['LEVEL'],
+            'propagate': False,
+        },
+    },
+}
+
+# Agrégats journaliers : deltas reportés par le worker ou `manage.py fold_rollups`
+PAYMENTS_ROLLUPS = {
+    "FOLD_BATCH_SIZE": decouple_config("PAYMENTS_ROLLUPS_FOLD_BATCH_SIZE", default=1000, cast=int),
+}
 
+# File de jobs en base (manage.py run_payment_worker) ; durées en secondes
+PAYMENTS_JOBS = {
+    # True : POST /payments/ et /refund/ répondent 202 sans attendre PayPal
+    # (sinon seulement avec l'en-tête « Prefer: respond-async »)
+    "ASYNC_BY_DEFAULT": decouple_config("PAYMENTS_JOBS_ASYNC_BY_DEFAULT", default=False, cast=bool),
+    "CONCURRENCY": decouple_config("PAYMENTS_JOBS_CONCURRENCY", default=8, cast=int),
+    "MAX_ATTEMPTS": decouple_config("PAYMENTS_JOBS_MAX_ATTEMPTS", default=5, cast=int),
+    "BACKOFF_BASE": decouple_config("PAYMENTS_JOBS_BACKOFF_BASE", default=2.0, cast=float),
+    "BACKOFF_MAX": decouple_config("PAYMENTS_JOBS_BACKOFF_MAX", default=300.0, cast=float),
+    "LOCK_TIMEOUT": decouple_config("PAYMENTS_JOBS_LOCK_TIMEOUT", default=300, cast=int),
 }
@@ -6,16 +6,22 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from payments.openapi import precomputed
+from payments.views import metrics_view
+
+
+# Aussi lu par manage.py build_openapi_schema (SWAGGER_SETTINGS['DEFAULT_INFO'])
+api_info = openapi.Info(
+   title="API PAYMENTS",
+   default_version='v1',
+   description="Test description",
+   terms_of_service="https://www.google.com/policies/terms/",
+   contact=openapi.Contact(email="contact@snippets.local"),
+   license=openapi.License(name="BSD License"),
+)
 
 schema_view = get_schema_view(
-   openapi.Info(
-      title="API PAYMENTS",
-      default_version='v1',
-      description="Test description",
-      terms_of_service="https://www.google.com/policies/terms/",
-      contact=openapi.Contact(email="contact@snippets.local"),
-      license=openapi.License(name="BSD License"),
-   ),
+   api_info,
    public=True,
    permission_classes=(permissions.AllowAny,),
 )
@@ -23,8 +29,10 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('payments.urls')),
-    path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('metrics', metrics_view, name='metrics'),
+    # Schéma précalculé (manage.py build_openapi_schema) ; génération à la volée seulement en DEBUG
+    path('swagger<format>/', precomputed(schema_view.without_ui(cache_timeout=0)), name='schema-json'),
+    path('', precomputed(schema_view.with_ui('swagger', cache_timeout=0)), name='schema-swagger-ui'),
+    path('redoc/', precomputed(schema_view.with_ui('redoc', cache_timeout=0)), name='schema-redoc'),
 ]
 
@@ -1,3 +1,38 @@
+from django import forms
 from django.contrib import admin
 
-# Register your models here.
+from payments.models import Merchant
+
+
+class MerchantAdminForm(forms.ModelForm):
+    # Écriture seule : le secret enregistré n'est jamais renvoyé au navigateur
+    client_secret = forms.CharField(
+        widget=forms.PasswordInput(render_value=False),
+        required=False,
+        help_text="Laisser vide pour conserver le secret actuel.",
+    )
+
+    class Meta:
+        model = Merchant
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.initial.pop('client_secret', None)
+
+    def clean_client_secret(self):
+        secret = self.cleaned_data['client_secret']
+        if secret:
+            return secret
+        if not self.instance._state.adding:
+            return self.instance.client_secret
+        raise forms.ValidationError(self.fields['client_secret'].error_messages['required'], code='required')
+
+
+@admin.register(Merchant)
+class MerchantAdmin(admin.ModelAdmin):
+    form = MerchantAdminForm
+    list_display = ('name', 'slug', 'mode', 'currency', 'is_active', 'updated_at')
+    list_filter = ('mode', 'is_active')
+    search_fields = ('name', 'slug', 'client_id')
+    prepopulated_fields = {'slug': ('name',)}
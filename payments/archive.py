@@ -0,0 +1,152 @@
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from payments import metrics, status_cache
+from payments.exceptions import PaymentValidationError
+from payments.models import Payment, PaymentArchive, PaymentRefund, PaymentRefundArchive
+
+logger = logging.getLogger(__name__)
+
+# Tout sauf PENDING ; un paiement dont un remboursement est en cours reste en place
+CLOSED_STATUSES = [status for status in Payment.Status if status != Payment.Status.PENDING]
+PAYMENT_FIELDS = [field.attname for field in PaymentArchive._meta.concrete_fields if field.name != 'archived_at']
+REFUND_FIELDS = [field.attname for field in PaymentRefundArchive._meta.concrete_fields]
+
+archived_rows = metrics.registry.counter(
+    'payments_archived_rows_total', "Lignes déplacées vers les tables d'archive, par table", ('table',),
+)
+
+
+def month_start(moment, months=0):
+    """Premier jour (UTC) du mois de `moment`, décalé de `months` mois."""
+    moment = moment.astimezone(dt_timezone.utc)
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def is_partitioned():
+    return connection.vendor == 'postgresql'
+
+
+def ensure_partitions(since, until):
+    """Crée les partitions mensuelles manquantes de l'archive pour [since, until[ (PostgreSQL).
+
+    Exécuté avant les lots, hors de leurs transactions : le verrou pris sur la table
+    d'archive par CREATE TABLE ... PARTITION OF ne touche pas les tables chaudes.
+    """
+    if not is_partitioned():
+        return
+    month = month_start(since)
+    with connection.cursor() as cursor:
+        while month < until:
+            next_month = month_start(month, 1)
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS payments_paymentarchive_{month:%Y_%m} '
+                f'PARTITION OF payments_paymentarchive '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+            )
+            month = next_month
+
+
+def _candidates(cutoff):
+    return (
+        Payment.objects.filter(status__in=CLOSED_STATUSES, created_at__lt=cutoff)
+        .exclude(refunds__status=Payment.Status.PENDING)
+    )
+
+
+def _next_batch(cutoff, cursor, batch_size):
+    queryset = _candidates(cutoff)
+    if cursor is not None:
+        created_at, pk = cursor
+        queryset = queryset.filter(created_at__gte=created_at).exclude(created_at=created_at, id__lte=pk)
+    return list(queryset.order_by('created_at', 'id').values_list('created_at', 'pk')[:batch_size])
+
+
+def _move(pks, cutoff):
+    """Copie les paiements `pks` encore archivables et leurs remboursements, puis les supprime.
+
+    Une transaction courte par lot ; les lignes verrouillées par une écriture en cours
+    sont laissées pour le prochain passage. Renvoie (paiements, remboursements) déplacés.
+    """
+    with transaction.atomic():
+        payments = list(_candidates(cutoff).select_for_update(skip_locked=True).filter(pk__in=pks))
+        if not payments:
+            return 0, 0
+        moved = [payment.pk for payment in payments]
+        refunds = list(PaymentRefund.objects.filter(payment_id__in=moved))
+        PaymentArchive.objects.bulk_create(
+            [PaymentArchive(**{name: getattr(payment, name) for name in PAYMENT_FIELDS}) for payment in payments],
+            ignore_conflicts=True,
+        )
+        PaymentRefundArchive.objects.bulk_create(
+            [PaymentRefundArchive(**{name: getattr(refund, name) for name in REFUND_FIELDS}) for refund in refunds],
+            ignore_conflicts=True,
+        )
+        PaymentRefund.objects.filter(payment_id__in=moved).delete()
+        Payment.objects.filter(pk__in=moved).delete()
+        status_cache.invalidate(*moved)
+    return len(payments), len(refunds)
+
+
+def archive(months=None, batch_size=None, max_seconds=None, dry_run=False, on_batch=None):
+    """Déplace vers l'archive les paiements clos créés avant le début du mois d'il y a `months` mois.
+
+    Parcours du plus ancien au plus récent (pagination par clé sur (created_at, id)),
+    un lot de `batch_size` paiements par transaction. S'arrête après `max_seconds`.
+    Renvoie les compteurs de l'archivage.
+    """
+    config = settings.PAYMENTS_ARCHIVE
+    months = config['AFTER_MONTHS'] if months is None else months
+    batch_size = batch_size or config['BATCH_SIZE']
+    max_seconds = config['MAX_SECONDS'] if max_seconds is None else max_seconds
+
+    cutoff = month_start(timezone.now(), -months)
+    # Un paiement archivé n'est plus remboursable : rien d'encore dans la fenêtre PayPal
+    refund_window_start = timezone.now() - timedelta(days=config['REFUND_WINDOW_DAYS'])
+    if cutoff > refund_window_start:
+        raise PaymentValidationError(
+            f"--months {months} archiverait des paiements encore remboursables "
+            f"(fenêtre de {config['REFUND_WINDOW_DAYS']} jours)",
+            code='archive_cutoff_in_refund_window',
+            params={'months': months, 'cutoff': cutoff.isoformat()},
+        )
+    totals = Counter()
+    started = time.monotonic()
+    cursor = None
+
+    if not dry_run:
+        oldest = _candidates(cutoff).aggregate(oldest=Min('created_at'))['oldest']
+        if oldest is not None:
+            ensure_partitions(oldest, cutoff)
+
+    while time.monotonic() - started < max_seconds:
+        batch = _next_batch(cutoff, cursor, batch_size)
+        if not batch:
+            break
+        cursor = batch[-1]
+        pks = [pk for _, pk in batch]
+        counts = Counter(rows=len(batch))
+        if dry_run:
+            counts['payments'] = len(pks)
+            counts['refunds'] = PaymentRefund.objects.filter(payment_id__in=pks).count()
+        else:
+            counts['payments'], counts['refunds'] = _move(pks, cutoff)
+            counts['skipped'] = len(pks) - counts['payments']
+            archived_rows.inc(counts['payments'], table='payment')
+            archived_rows.inc(counts['refunds'], table='refund')
+        totals.update(counts)
+        totals['batches'] += 1
+        if on_batch is not None:
+            on_batch(counts)
+
+    totals['seconds'] = round(time.monotonic() - started, 2)
+    logger.info("Archivage des paiements clos avant %s: %s", cutoff.date(), dict(totals))
+    return totals
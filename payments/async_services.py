@@ -0,0 +1,157 @@
+import logging
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+
+from payments import events, ledger, merchants, metrics, rollups, status_cache
+from payments.clients import get_async_client
+from payments.exceptions import PaymentError, PaymentProcessError, PaymentValidationError, PayPalAPIError, RefundError
+from payments.models import Payment
+from payments.services import (
+    SALE_FIELDS, BasePaymentService, already_executed, check_payer, executed_result, execute_flight
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPaymentService(BasePaymentService):
+    """Variante asyncio de PaymentService : les appels PayPal ne bloquent pas la boucle."""
+
+    def __init__(self, client=None):
+        self._client = client
+
+    def client_for(self, merchant=None):
+        # Résolu à chaque appel : le client dépend de la boucle en cours et du marchand
+        return self._client or get_async_client(merchant)
+
+    @metrics.instrument('create_payment')
+    async def create_payment(self, amount, description, return_url=None, cancel_url=None, merchant=None):
+        self._validate_payment(amount)
+        payment_data = self._build_payment_data(amount, description, merchant)
+
+        try:
+            payment = await self.client_for(merchant).create_payment(payment_data)
+        except PayPalAPIError as e:
+            logger.error("Erreur création PayPal: %s", e)
+            raise PaymentProcessError(
+                f"Erreur lors de la création du paiement PayPal: {e}",
+                code='payment_creation_failed'
+            )
+
+        approval_url = next(
+            (link['href'] for link in payment.get('links', []) if link['rel'] == 'approval_url'),
+            None
+        )
+        if not approval_url:
+            raise PaymentProcessError("URL d'approbation non trouvée")
+
+        db_payment = Payment(
+            payment_id=payment['id'],
+            merchant=merchant,
+            amount=Decimal(str(amount)),
+            currency=merchants.currency(merchant),
+            description=description
+        )
+        await sync_to_async(rollups.save_payment)(db_payment)
+        events.payment_created(db_payment)
+        logger.info("Paiement PayPal créé: %s", payment['id'])
+
+        return {
+            'id': str(db_payment.id),
+            'payment_id': db_payment.payment_id,
+            'approval_url': approval_url,
+        }
+
+    @metrics.instrument('execute_payment')
+    async def execute_payment(self, payment_id, payer_id):
+        if not payment_id or not payer_id:
+            raise PaymentValidationError("PayPal Payment ID et Payer ID sont requis")
+        # Même verrou et même mémo que PaymentService : workers sync et async se coordonnent
+        async def execute():
+            return executed_result(await self._execute_payment(payment_id, payer_id))
+
+        result = await execute_flight().ado(payment_id, execute)
+        check_payer(result['payer_id'], payer_id)
+        return result
+
+    async def _execute_payment(self, payment_id, payer_id):
+        db_payment = await Payment.objects.filter(payment_id=payment_id).select_related('merchant').afirst()
+        if not db_payment:
+            raise PaymentError("Paiement non trouvé")
+        if already_executed(db_payment, payer_id):
+            return db_payment
+
+        # Pas de Payment.find préalable : l'appel execute renvoie déjà la ressource complète
+        try:
+            payment = await self.client_for(db_payment.merchant).execute_payment(payment_id, payer_id)
+        except PayPalAPIError as e:
+            logger.error("Échec exécution: %s", e)
+            previous_status = db_payment.status
+            db_payment.status = Payment.Status.FAILED
+            db_payment.error_message = str(e)
+            await sync_to_async(rollups.save_payment)(
+                db_payment, previous_status, update_fields=['status', 'error_message', 'updated_at']
+            )
+            events.payment_failed(db_payment, stage='execute')
+            raise PaymentProcessError(f"Échec de l'exécution: {e}")
+
+        previous_status = db_payment.status
+        db_payment.status = Payment.Status.COMPLETED
+        db_payment.payer_id = payer_id
+        payer_info = payment.get('payer', {}).get('payer_info', {})
+        if payer_info.get('email'):
+            db_payment.payer_email = payer_info['email']
+        self._apply_sale_details(db_payment, payment)
+        await sync_to_async(rollups.save_payment)(
+            db_payment, previous_status,
+            update_fields=['status', 'payer_id', 'payer_email', 'updated_at'] + SALE_FIELDS
+        )
+        events.payment_executed(db_payment)
+        logger.info("Paiement exécuté avec succès: %s", payment_id)
+        return db_payment
+
+    @metrics.instrument('refund_payment')
+    async def refund_payment(self, payment_id, amount=None, reason=None):
+        try:
+            db_payment = await Payment.objects.select_related('merchant').aget(payment_id=payment_id)
+        except Payment.DoesNotExist:
+            raise RefundError("Paiement introuvable")
+
+        if db_payment.status not in ledger.REFUNDABLE_STATUSES:
+            raise RefundError("Impossible de rembourser un paiement non complété")
+
+        try:
+            if not db_payment.sale_id:
+                # Paiement exécuté avant l'enregistrement du sale_id : une seule relecture, mémorisée
+                self._apply_sale_details(db_payment, await self.client_for(db_payment.merchant).find_payment(payment_id))
+                if not db_payment.sale_id:
+                    raise RefundError("Vente PayPal introuvable pour ce paiement", code='sale_not_found')
+                await db_payment.asave(update_fields=SALE_FIELDS + ['updated_at'])
+                await sync_to_async(status_cache.invalidate)(db_payment.pk)
+        except (PayPalAPIError, KeyError, IndexError) as e:
+            logger.error("Erreur lors de la recherche de la vente: %s", e)
+            raise RefundError(f"Erreur lors du remboursement du paiement PayPal: {e}", code='refund_failed')
+
+        amount = await sync_to_async(ledger.reserve)(db_payment, amount)
+        refund_data = {
+            'amount': {
+                'total': str(amount),
+                'currency': db_payment.currency
+            }
+        }
+        try:
+            refund = await self.client_for(db_payment.merchant).refund_sale(db_payment.sale_id, refund_data)
+        except BaseException as e:
+            # Y compris l'annulation de la tâche : la réservation doit être rendue
+            await sync_to_async(ledger.release)(db_payment, amount)
+            if isinstance(e, PayPalAPIError):
+                logger.error("Erreur lors du remboursement du paiement: %s", e)
+                raise RefundError(
+                    f"Erreur lors du remboursement du paiement PayPal: {e}",
+                    code='refund_failed'
+                )
+            raise
+
+        refund_record = await sync_to_async(ledger.record)(db_payment, amount, refund.get('id'), reason)
+        events.payment_refunded(db_payment, refund_record)
+        return refund_record
@@ -0,0 +1,151 @@
+import json
+import math
+import platform
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+STEPS = ('create', 'execute', 'refund')
+
+
+def percentile(values, pct):
+    """Percentile au rang le plus proche (valeurs triées)."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {step: [] for step in STEPS}
+        self.queries = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.error_samples = []
+        self._lock = threading.Lock()
+
+    def add(self, step, seconds, queries, error=None):
+        with self._lock:
+            self.latencies[step].append(seconds)
+            self.queries[step].append(queries)
+            if error is not None:
+                self.errors[step] += 1
+                if len(self.error_samples) < 20:
+                    self.error_samples.append({'step': step, 'error': error})
+
+
+def _host():
+    hosts = [host for host in settings.ALLOWED_HOSTS if host not in ('*',) and not host.startswith('.')]
+    return hosts[0] if hosts else 'localhost'
+
+
+def _call(client, recorder, step, path, data, expected):
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = client.post(path, data=json.dumps(data), content_type='application/json')
+        elapsed = time.perf_counter() - start
+    error = None
+    if response.status_code != expected:
+        error = f'{response.status_code}: {response.content[:200].decode("utf-8", "replace")}'
+    recorder.add(step, elapsed, len(queries), error)
+    return response.json() if error is None else None
+
+
+def run_flow(recorder, amount):
+    """create -> execute -> refund sur un paiement, via l'application Django."""
+    client = Client(SERVER_NAME=_host())
+    created = _call(client, recorder, 'create', reverse('payment-list'),
+                    {'amount': amount, 'description': 'benchmark'}, 200)
+    if created is None:
+        return False
+    executed = _call(client, recorder, 'execute', reverse('payment-execute'),
+                     {'payment_id': created['payment_id'], 'payer_id': 'BENCHPAYER'}, 201)
+    if executed is None:
+        return False
+    refunded = _call(client, recorder, 'refund', reverse('payment-refund', args=[created['id']]), {}, 201)
+    return refunded is not None
+
+
+def run(concurrency=8, iterations=200, amount='10.00', warmup=5):
+    """Lance `iterations` parcours avec `concurrency` clients en parallèle ; renvoie le rapport."""
+    for _ in range(warmup):
+        run_flow(Recorder(), amount)
+
+    recorder = Recorder()
+
+    def flow(_):
+        try:
+            return run_flow(recorder, amount)
+        finally:
+            connection.close()
+
+    started_at = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        completed = sum(1 for ok in executor.map(flow, range(iterations)) if ok)
+    duration = time.perf_counter() - start
+    return report(recorder, started_at, duration, concurrency, iterations, completed)
+
+
+def report(recorder, started_at, duration, concurrency, iterations, completed):
+    steps = {}
+    requests = 0
+    for step in STEPS:
+        latencies = sorted(recorder.latencies[step])
+        queries = recorder.queries[step]
+        requests += len(latencies)
+        steps[step] = {
+            'requests': len(latencies),
+            'errors': recorder.errors[step],
+            'p50_ms': _ms(percentile(latencies, 50)),
+            'p95_ms': _ms(percentile(latencies, 95)),
+            'p99_ms': _ms(percentile(latencies, 99)),
+            'mean_ms': _ms(statistics.fmean(latencies)) if latencies else None,
+            'queries_per_request': round(statistics.fmean(queries), 2) if queries else None,
+            'max_queries': max(queries) if queries else None,
+        }
+    return {
+        'started_at': started_at.isoformat(),
+        'config': {
+            'concurrency': concurrency,
+            'iterations': iterations,
+            'endpoint': settings.PAYPAL_CONFIG.get('PAYPAL_ENDPOINT'),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+        },
+        'duration_seconds': round(duration, 3),
+        'completed_flows': completed,
+        'flows_per_second': round(completed / duration, 2) if duration else None,
+        'requests_per_second': round(requests / duration, 2) if duration else None,
+        'steps': steps,
+        'error_samples': recorder.error_samples,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def compare(result, baseline, tolerance=0.2):
+    """Régressions par rapport à un rapport précédent : p95 ou requêtes SQL en hausse de plus de `tolerance`."""
+    regressions = []
+    for step, current in result['steps'].items():
+        previous = baseline.get('steps', {}).get(step)
+        if not previous:
+            continue
+        for metric in ('p95_ms', 'queries_per_request'):
+            before, after = previous.get(metric), current.get(metric)
+            if before and after and after > before * (1 + tolerance):
+                regressions.append(f'{step}.{metric}: {before} -> {after}')
+    before, after = baseline.get('flows_per_second'), result.get('flows_per_second')
+    if before and after is not None and after < before * (1 - tolerance):
+        regressions.append(f'flows_per_second: {before} -> {after}')
+    return regressions
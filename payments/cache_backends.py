@@ -0,0 +1,31 @@
+import os
+import tempfile
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class AtomicFileBasedCache(FileBasedCache):
+    """FileBasedCache dont add() est atomique entre processus.
+
+    Le add() de Django fait has_key() puis set() : deux workers peuvent tous les
+    deux « gagner ». Ici l'entrée est écrite à part puis publiée par os.link(),
+    qui échoue si le fichier existe déjà. Les verrous single-flight posés avec
+    cache.add() tiennent donc aussi sans Redis/Memcached.
+    """
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self.has_key(key, version):  # supprime au passage une entrée expirée
+            return False
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            os.link(tmp_path, fname)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        return True
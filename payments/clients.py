@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import uuid
+import weakref
+from collections import OrderedDict
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from payments import merchants, metrics, resilience
+from payments.exceptions import PayPalAPIError
+from payments.tokens import get_token_manager
+from payments.transport import paypal_endpoint
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPayPalClient:
+    """Client HTTP non bloquant pour l'API REST PayPal (v1/payments)."""
+
+    def __init__(self, mode, client_id, client_secret, endpoint=None, timeout=30.0, token_manager=None,
+                 timeouts=None, max_connections=100, max_keepalive_connections=20):
+        self.mode = mode
+        self.endpoint = endpoint or paypal_endpoint(mode)
+        self.token_manager = token_manager or get_token_manager(client_id, client_secret, mode)
+        self.timeouts = {
+            operation: httpx.Timeout(read, connect=connect)
+            for operation, (connect, read) in (timeouts or {}).items()
+        }
+        self._http = httpx.AsyncClient(
+            base_url=self.endpoint,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections, max_keepalive_connections=max_keepalive_connections
+            ),
+        )
+
+    async def get_access_token(self):
+        token = self.token_manager.peek()
+        if token is None:
+            # Lecture du cache partagé / rafraîchissement : I/O bloquante, hors de la boucle
+            token = await sync_to_async(self.token_manager.get_token, thread_sensitive=False)()
+        return token['access_token']
+
+    async def request(self, method, path, json=None, operation=None):
+        """Appel PayPal derrière le disjoncteur et le budget de nouveaux essais partagés avec le SDK.
+
+        Les POST portent un PayPal-Request-Id fixé pour tous les essais : rejouables sans doublon.
+        """
+        headers = {'Accept': 'application/json'}
+        if method != 'GET':
+            headers['PayPal-Request-Id'] = str(uuid.uuid4())
+        return await resilience.acall(
+            operation or 'other',
+            lambda: self._request(method, path, json, operation, headers),
+            idempotent=True,
+        )
+
+    async def _request(self, method, path, json, operation, headers):
+        timeout = self.timeouts.get(operation, httpx.USE_CLIENT_DEFAULT)
+        for attempt in range(2):
+            token = await self.get_access_token()
+            with metrics.paypal_call(operation or 'other') as call:
+                response = await self._http.request(
+                    method, path, json=json, timeout=timeout,
+                    headers={**headers, 'Authorization': f'Bearer {token}'},
+                )
+                call.outcome = metrics.status_class(response.status_code)
+            if response.status_code == 401 and attempt == 0:
+                # Token révoqué côté PayPal : on en redemande un une seule fois
+                await sync_to_async(self.token_manager.invalidate, thread_sensitive=False)(token)
+                continue
+            break
+
+        logger.info('PayPal %s %s -> %s', method, path, response.status_code)
+        if not 200 <= response.status_code <= 299:
+            try:
+                error = response.json()
+            except ValueError:
+                error = {'message': response.text}
+            raise PayPalAPIError(
+                f"Erreur PayPal ({response.status_code}): {error.get('message', error)}",
+                code=error.get('name', 'paypal_error'),
+                params={'status': response.status_code, 'error': error},
+            )
+        return response.json() if response.content else {}
+
+    async def create_payment(self, payment_data):
+        return await self.request('POST', '/v1/payments/payment', json=payment_data, operation='create')
+
+    async def find_payment(self, payment_id):
+        return await self.request('GET', f'/v1/payments/payment/{payment_id}', operation='lookup')
+
+    async def execute_payment(self, payment_id, payer_id):
+        return await self.request(
+            'POST', f'/v1/payments/payment/{payment_id}/execute', json={'payer_id': payer_id},
+            operation='execute'
+        )
+
+    async def find_sale(self, sale_id):
+        return await self.request('GET', f'/v1/payments/sale/{sale_id}', operation='lookup')
+
+    async def refund_sale(self, sale_id, refund_data):
+        return await self.request(
+            'POST', f'/v1/payments/sale/{sale_id}/refund', json=refund_data, operation='refund'
+        )
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+# Clients par boucle d'événements : un httpx.AsyncClient ne peut pas
+# être partagé entre boucles (runserver crée une boucle par requête async).
+# Dans chaque boucle, un LRU par marchand borné par PAYPAL_MERCHANT_POOL_SIZE.
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client(merchant=None):
+    loop = asyncio.get_running_loop()
+    clients = _clients.get(loop)
+    if clients is None:
+        clients = _clients[loop] = OrderedDict()
+    key, mode, client_id, client_secret = merchants.credentials(merchant)
+    client = clients.get(key)
+    if client is not None:
+        clients.move_to_end(key)
+        return client
+    client = clients[key] = AsyncPayPalClient(
+        mode=mode,
+        client_id=client_id,
+        client_secret=client_secret,
+        timeout=settings.PAYPAL_CONFIG['PAYPAL_TIMEOUT'],
+        timeouts=settings.PAYPAL_CONFIG['PAYPAL_TIMEOUTS'],
+        max_keepalive_connections=settings.PAYPAL_CONFIG['PAYPAL_POOL_MAXSIZE'],
+    )
+    while len(clients) > settings.PAYPAL_CONFIG['PAYPAL_MERCHANT_POOL_SIZE']:
+        _, evicted = clients.popitem(last=False)
+        loop.create_task(evicted.aclose())
+    return client
@@ -0,0 +1,200 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Journal d'audit des paiements : logger dédié, une ligne NDJSON par événement
+event_logger = logging.getLogger('payments.events')
+
+
+class Event:
+    CREATED = 'payment.created'
+    EXECUTED = 'payment.executed'
+    FAILED = 'payment.failed'
+    REFUNDED = 'payment.refunded'
+    EXPIRED = 'payment.expired'
+    # Volumineux, au niveau DEBUG et échantillonnés (PAYMENTS_EVENTS['SAMPLE_RATES'])
+    PAYPAL_REQUEST = 'paypal.request'
+    PAYPAL_RESPONSE = 'paypal.response'
+
+
+def emit(event, level=logging.INFO, **fields):
+    """Journalise un événement ; les champs appelables ne sont évalués que s'il est conservé.
+
+    Niveau désactivé ou événement écarté par l'échantillonnage : ni formatage ni évaluation.
+    """
+    if not event_logger.isEnabledFor(level):
+        return
+    rate = settings.PAYMENTS_EVENTS['SAMPLE_RATES'].get(event)
+    if rate is not None and random.random() >= rate:
+        return
+    event_logger.log(level, event, extra={'event': event, 'fields': fields})
+
+
+# Événements typés du cycle de vie d'un paiement
+
+def payment_created(payment):
+    emit(Event.CREATED, id=payment.id, payment_id=payment.payment_id, amount=payment.amount,
+         currency=payment.currency)
+
+
+def payment_executed(payment):
+    emit(Event.EXECUTED, id=payment.id, payment_id=payment.payment_id, payer_id=payment.payer_id,
+         sale_id=payment.sale_id, amount=payment.amount, currency=payment.currency)
+
+
+def payment_failed(payment, stage):
+    emit(Event.FAILED, logging.WARNING, id=payment.id, payment_id=payment.payment_id, stage=stage,
+         error=payment.error_message)
+
+
+def payment_expired(payment):
+    emit(Event.EXPIRED, id=payment.id, payment_id=payment.payment_id, amount=payment.amount,
+         currency=payment.currency, created_at=payment.created_at)
+
+
+def payment_refunded(payment, refund):
+    emit(Event.REFUNDED, id=payment.id, payment_id=payment.payment_id, refund_id=refund.refund_id,
+         amount=refund.amount, refunded_amount=payment.refunded_amount, status=payment.status)
+
+
+def _resolve(fields):
+    return {name: value() if callable(value) else value for name, value in fields.items()}
+
+
+class EventJSONEncoder(DjangoJSONEncoder):
+    """Dates, Decimal et UUID comme DjangoJSONEncoder ; str() pour le reste plutôt qu'une exception."""
+
+    def default(self, o):
+        try:
+            return super().default(o)
+        except TypeError:
+            return str(o)
+
+
+def to_json(record):
+    payload = {
+        'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+        'level': record.levelname,
+        'event': getattr(record, 'event', record.getMessage()),
+    }
+    payload.update(getattr(record, 'fields', None) or {})
+    return json.dumps(payload, cls=EventJSONEncoder, separators=(',', ':'))
+
+
+class NDJSONFormatter(logging.Formatter):
+    """Pour un handler classique (console) : même ligne JSON que le handler asynchrone."""
+
+    def format(self, record):
+        if hasattr(record, 'fields'):
+            record.fields = _resolve(record.fields)
+        return to_json(record)
+
+
+class AsyncNDJSONHandler(logging.Handler):
+    """Handler non bloquant : file en mémoire, écriture par lots dans un fichier NDJSON tournant.
+
+    Le thread de la requête ne fait qu'évaluer les champs et déposer l'enregistrement ;
+    la sérialisation JSON, l'écriture et la rotation se font dans un thread de fond.
+    File pleine : les événements DEBUG sont abandonnés, les autres attendent (piste d'audit).
+    """
+
+    def __init__(self, filename, max_bytes=50 * 1024 * 1024, backup_count=10, batch_size=500,
+                 queue_size=10000, level=logging.NOTSET):
+        super().__init__(level)
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        self.file = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                        encoding='utf-8', delay=True)
+        self.file.setFormatter(_PreformattedFormatter())
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _ensure_writer(self):
+        # Démarrage paresseux et par processus : un thread ne survit pas à un fork (gunicorn --preload)
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='payments-events', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def emit(self, record):
+        try:
+            self._ensure_writer()
+            if hasattr(record, 'fields'):
+                record.fields = _resolve(record.fields)
+            if record.levelno <= logging.DEBUG:
+                self.queue.put_nowait(record)
+            else:
+                self.queue.put(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            self._write([record for record in batch if record is not None])
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _write(self, records):
+        if not records:
+            return
+        handler = self.file
+        with handler.lock:
+            try:
+                for record in records:
+                    record.ndjson = to_json(record)
+                    if handler.shouldRollover(record):
+                        handler.doRollover()
+                    if handler.stream is None:
+                        handler.stream = handler._open()
+                    handler.stream.write(record.ndjson + '\n')
+                handler.stream.flush()
+            except Exception:
+                self.handleError(records[-1])
+
+    def flush(self, timeout=5.0):
+        """Attend que la file soit écrite (tests, arrêt propre)."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self.queue.put(None)
+            self._thread.join(timeout=5.0)
+        self.file.close()
+        super().close()
+
+
+class _PreformattedFormatter(logging.Formatter):
+    def format(self, record):
+        return getattr(record, 'ndjson', '')
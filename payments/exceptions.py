@@ -11,4 +11,23 @@ class PaymentProcessError(PaymentError):
     pass
 
 class RefundError(PaymentError):
-    pass
\ No newline at end of file
+    pass
+
+class PayPalAPIError(PaymentError):
+    pass
+
+
+class PayPalUnavailableError(PaymentError):
+    """Disjoncteur ouvert : PayPal n'est pas appelé, le client doit réessayer plus tard."""
+
+    @property
+    def retry_after(self):
+        return self.params.get('retry_after', 1)
+
+
+class WebhookVerificationError(PaymentError):
+    pass
+
+
+class ReconciliationError(PaymentError):
+    pass
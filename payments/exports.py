@@ -0,0 +1,107 @@
+import csv
+import io
+import zlib
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from payments.models import Payment, PaymentRefund
+from payments.reconciliation import merge_join
+
+PAYMENT_FIELDS = ('id', 'payment_id', 'amount', 'currency', 'status', 'payer_email', 'created_at', 'updated_at')
+REFUND_FIELDS = ('refund_id', 'amount', 'status', 'created_at')
+CSV_HEADER = PAYMENT_FIELDS + ('refunds_count', 'refunded_amount', 'refund_ids')
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Taille visée des morceaux envoyés au client (octets, avant compression)
+FLUSH_SIZE = 64 * 1024
+
+
+def iter_payments_with_refunds(filters=None, chunk_size=2000, using=None):
+    """Paiements triés par (created_at, id), chacun avec la liste de ses remboursements.
+
+    Deux curseurs parallèles dans le même ordre, fusionnés au fil de l'eau : pas de
+    requête par paiement (N+1) et une mémoire constante quelle que soit la taille.
+    `using` : alias de base lu (un réplica, voir payments.replicas).
+    """
+    filters = filters or {}
+    payments = (
+        Payment.objects.using(using).filter(**filters)
+        .order_by('created_at', 'id')
+        .values_list(*PAYMENT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    refunds = (
+        PaymentRefund.objects.using(using).filter(**{f'payment__{name}': value for name, value in filters.items()})
+        .order_by('payment__created_at', 'payment_id', 'created_at')
+        .values_list('payment__created_at', 'payment_id', *REFUND_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    refunds_by_payment = (
+        (key, [dict(zip(REFUND_FIELDS, row[2:])) for row in group])
+        for key, group in groupby(refunds, key=itemgetter(0, 1))
+    )
+    payment_key = itemgetter(PAYMENT_FIELDS.index('created_at'), PAYMENT_FIELDS.index('id'))
+
+    for _, payment, refunds in merge_join(payments, refunds_by_payment, left_key=payment_key):
+        if payment is None:
+            continue
+        row = dict(zip(PAYMENT_FIELDS, payment))
+        row['refunds'] = refunds[1] if refunds else []
+        yield row
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for row in rows:
+        refunds = row['refunds']
+        writer.writerow([row[field] for field in PAYMENT_FIELDS] + [
+            len(refunds),
+            sum((refund['amount'] for refund in refunds), Decimal('0')),
+            ';'.join(refund['refund_id'] or '' for refund in refunds),
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _ndjson_lines(rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def stream_export(export_format='csv', compress=False, filters=None, chunk_size=2000, using=None):
+    """Génère l'export par morceaux d'environ FLUSH_SIZE octets, éventuellement gzippés."""
+    rows = iter_payments_with_refunds(filters, chunk_size, using)
+    lines = _csv_lines(rows) if export_format == 'csv' else _ndjson_lines(rows)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # 31 : en-tête gzip
+
+    pending = []
+    size = 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= FLUSH_SIZE:
+            data = ''.join(pending).encode('utf-8')
+            pending, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ''.join(pending).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def export_filename(export_format, compress):
+    return f'payments.{export_format}' + ('.gz' if compress else '')
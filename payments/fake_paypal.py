@@ -0,0 +1,205 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# (méthode, motif de chemin) -> (opération, nom du handler)
+ROUTES = [
+    ('POST', re.compile(r'^/v1/oauth2/token$'), 'token', 'token'),
+    ('POST', re.compile(r'^/v1/payments/payment$'), 'create', 'create_payment'),
+    ('GET', re.compile(r'^/v1/payments/payment/(?P<payment_id>[^/]+)$'), 'lookup', 'find_payment'),
+    ('POST', re.compile(r'^/v1/payments/payment/(?P<payment_id>[^/]+)/execute$'), 'execute', 'execute_payment'),
+    ('GET', re.compile(r'^/v1/payments/sale/(?P<sale_id>[^/]+)$'), 'lookup', 'find_sale'),
+    ('POST', re.compile(r'^/v1/payments/sale/(?P<sale_id>[^/]+)/refund$'), 'refund', 'refund_sale'),
+]
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _new_id(prefix):
+    return f'{prefix}-{uuid.uuid4().hex[:20].upper()}'
+
+
+class FakePayPalServer(ThreadingHTTPServer):
+    """Imitation locale de l'API REST PayPal v1 (token, paiements, ventes, remboursements).
+
+    Les ressources vivent en mémoire. `latency` et `jitter` (secondes) retardent chaque
+    réponse ; `error_rate` renvoie `error_status` sur cette proportion d'appels.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503):
+        super().__init__(address, FakePayPalHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.payments = {}
+        self.sales = {}
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """Sert dans un thread de fond ; renvoie le thread."""
+        thread = threading.Thread(target=self.serve_forever, name='fake-paypal', daemon=True)
+        thread.start()
+        return thread
+
+    # Ressources
+
+    def token(self, body, **kwargs):
+        return 200, {
+            'scope': 'https://api.paypal.com/v1/payments/.*',
+            'access_token': _new_id('A21AA'),
+            'token_type': 'Bearer',
+            'app_id': 'APP-FAKE',
+            'expires_in': 32400,
+            'nonce': _new_id('NONCE'),
+        }
+
+    def create_payment(self, body, **kwargs):
+        payment_id = _new_id('PAYID')
+        token = _new_id('EC')
+        payment = {
+            'id': payment_id,
+            'intent': body.get('intent', 'sale'),
+            'state': 'created',
+            'payer': {'payment_method': body.get('payer', {}).get('payment_method', 'paypal')},
+            'transactions': body.get('transactions', []),
+            'create_time': _now(),
+            'links': [
+                {'href': f'{self.url}/v1/payments/payment/{payment_id}', 'rel': 'self', 'method': 'GET'},
+                {'href': f'{self.url}/checkoutnow?token={token}', 'rel': 'approval_url', 'method': 'REDIRECT'},
+                {'href': f'{self.url}/v1/payments/payment/{payment_id}/execute', 'rel': 'execute', 'method': 'POST'},
+            ],
+        }
+        with self.lock:
+            self.payments[payment_id] = payment
+        return 201, payment
+
+    def find_payment(self, body, payment_id):
+        payment = self.payments.get(payment_id)
+        if payment is None:
+            return 404, {'name': 'INVALID_RESOURCE_ID', 'message': 'Requested resource ID was not found.'}
+        return 200, payment
+
+    def execute_payment(self, body, payment_id):
+        with self.lock:
+            payment = self.payments.get(payment_id)
+            if payment is None:
+                return 404, {'name': 'INVALID_RESOURCE_ID', 'message': 'Requested resource ID was not found.'}
+            if payment['state'] == 'approved':
+                return 400, {'name': 'PAYMENT_ALREADY_DONE', 'message': 'Payment has been done already for this cart.'}
+            amount = payment['transactions'][0]['amount'] if payment['transactions'] else {}
+            sale = {
+                'id': _new_id('SALE'),
+                'state': 'completed',
+                'amount': amount,
+                'transaction_fee': {'value': '0.30', 'currency': amount.get('currency', 'EUR')},
+                'parent_payment': payment_id,
+                'create_time': _now(),
+                'refunded': Decimal('0'),
+            }
+            self.sales[sale['id']] = sale
+            payment['state'] = 'approved'
+            payment['payer']['payer_info'] = {
+                'email': f"buyer-{body.get('payer_id', 'fake').lower()}@example.com",
+                'payer_id': body.get('payer_id'),
+            }
+            if payment['transactions']:
+                payment['transactions'][0]['related_resources'] = [{'sale': self._public_sale(sale)}]
+            payment['update_time'] = _now()
+        return 200, payment
+
+    def find_sale(self, body, sale_id):
+        sale = self.sales.get(sale_id)
+        if sale is None:
+            return 404, {'name': 'INVALID_RESOURCE_ID', 'message': 'Requested resource ID was not found.'}
+        return 200, self._public_sale(sale)
+
+    def refund_sale(self, body, sale_id):
+        with self.lock:
+            sale = self.sales.get(sale_id)
+            if sale is None:
+                return 404, {'name': 'INVALID_RESOURCE_ID', 'message': 'Requested resource ID was not found.'}
+            total = Decimal(str(body.get('amount', {}).get('total') or sale['amount'].get('total', '0')))
+            if sale['refunded'] + total > Decimal(sale['amount'].get('total', '0')):
+                return 400, {'name': 'REFUND_EXCEEDED_TRANSACTION_AMOUNT', 'message': 'Refund amount exceeded.'}
+            sale['refunded'] += total
+            sale['state'] = 'refunded' if sale['refunded'] >= Decimal(sale['amount']['total']) else 'partially_refunded'
+        return 201, {
+            'id': _new_id('REFUND'),
+            'state': 'completed',
+            'amount': {'total': str(total), 'currency': sale['amount'].get('currency', 'EUR')},
+            'sale_id': sale_id,
+            'parent_payment': sale['parent_payment'],
+            'create_time': _now(),
+        }
+
+    @staticmethod
+    def _public_sale(sale):
+        return {key: value for key, value in sale.items() if key != 'refunded'}
+
+
+class FakePayPalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, comme l'API réelle
+
+    def log_message(self, format, *args):
+        logger.debug("fake-paypal %s", format % args)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        server = self.server
+        raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        path = self.path.split('?', 1)[0]
+        for route_method, pattern, operation, handler in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                break
+        else:
+            return self._send(404, {'name': 'NOT_FOUND', 'message': f'{method} {path}'})
+
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+        with server.lock:
+            server.requests[operation] += 1
+        if operation != 'token' and random.random() < server.error_rate:
+            return self._send(server.error_status, {'name': 'INTERNAL_SERVICE_ERROR', 'message': 'Injected error'})
+
+        try:
+            body = json.loads(raw) if raw and raw[:1] in (b'{', b'[') else {}
+        except ValueError:
+            return self._send(400, {'name': 'MALFORMED_REQUEST', 'message': 'Invalid JSON'})
+        status, payload = getattr(server, handler)(body or {}, **match.groupdict())
+        self._send(status, payload)
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('PayPal-Debug-Id', uuid.uuid4().hex[:13])
+        self.end_headers()
+        self.wfile.write(data)
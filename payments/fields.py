@@ -0,0 +1,52 @@
+import base64
+import hashlib
+from functools import lru_cache
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+
+@lru_cache(maxsize=4)
+def _fernet(keys, secret_key):
+    if not keys:
+        # Sans PAYMENTS_ENCRYPTION_KEYS : clé dérivée de SECRET_KEY
+        keys = (base64.urlsafe_b64encode(hashlib.sha256(f'payments.fields:{secret_key}'.encode()).digest()),)
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+def fernet():
+    """Première clé de PAYMENTS_ENCRYPTION_KEYS pour chiffrer, toutes pour déchiffrer (rotation)."""
+    return _fernet(tuple(settings.PAYMENTS_ENCRYPTION_KEYS), settings.SECRET_KEY)
+
+
+def encrypt(value):
+    return fernet().encrypt(value.encode()).decode()
+
+
+def decrypt(token):
+    try:
+        return fernet().decrypt(token.encode()).decode()
+    except InvalidToken:
+        raise ImproperlyConfigured(
+            "Secret illisible : chiffré avec une clé absente de PAYMENTS_ENCRYPTION_KEYS (ou SECRET_KEY changée)"
+        )
+
+
+class EncryptedTextField(models.TextField):
+    """Texte chiffré en base (Fernet), en clair sur l'instance.
+
+    Chiffrement non déterministe : la colonne ne peut servir ni au filtrage ni au tri.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        if not value:
+            return value
+        return decrypt(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if not value:
+            return value
+        return encrypt(value)
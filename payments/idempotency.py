@@ -0,0 +1,136 @@
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from payments.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+POLL_INTERVAL = 0.1
+
+
+def _fingerprint(data):
+    payload = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _claim(key, scope, request_hash):
+    """Tente de réserver la clé. Renvoie (enregistrement, True) si cette requête en devient propriétaire."""
+    config = settings.PAYMENTS_IDEMPOTENCY
+    now = timezone.now()
+    record = None
+    for _ in range(2):
+        try:
+            # Point de sauvegarde : le doublon ne casse pas une transaction englobante (ATOMIC_REQUESTS)
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    key=key,
+                    scope=scope,
+                    request_hash=request_hash,
+                    expires_at=now + timedelta(seconds=config['TTL']),
+                )
+            return record, True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+            if record is None:
+                continue
+            abandoned = (
+                record.state == IdempotencyKey.State.IN_PROGRESS
+                and record.updated_at < now - timedelta(seconds=config['LOCK_TIMEOUT'])
+            )
+            if record.expires_at > now and not abandoned:
+                return record, False
+            # Clé expirée ou requête d'origine morte en route : on la reprend
+            IdempotencyKey.objects.filter(pk=record.pk, updated_at=record.updated_at).delete()
+    return record, False
+
+
+def _wait_for_completion(record):
+    """Attend que la requête d'origine (en vol) termine, dans la limite de WAIT_TIMEOUT."""
+    deadline = time.monotonic() + settings.PAYMENTS_IDEMPOTENCY['WAIT_TIMEOUT']
+    while record is not None and record.state == IdempotencyKey.State.IN_PROGRESS:
+        if time.monotonic() >= deadline:
+            return record
+        time.sleep(POLL_INTERVAL)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+    return record
+
+
+def idempotent(view_method):
+    """Rend une action d'écriture de PaymentViewSet rejouable avec l'en-tête Idempotency-Key.
+
+    - première requête : exécute l'action et mémorise la réponse (hors erreurs 5xx) ;
+    - requête rejouée : renvoie la réponse mémorisée sans appeler PayPal ;
+    - doublon concurrent : attend la fin de la requête en vol plutôt que de la doubler.
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        scope = f'{request.method}:{request.path}'
+        request_hash = _fingerprint(request.data)
+        record, owner = _claim(key[:255], scope, request_hash)
+
+        if not owner:
+            if record is None:
+                return Response(
+                    {'error': "Une requête avec cette Idempotency-Key est toujours en cours"},
+                    status=status.HTTP_409_CONFLICT
+                )
+            if record.request_hash != request_hash:
+                return Response(
+                    {'error': f"{HEADER} déjà utilisée avec une requête différente"},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            record = _wait_for_completion(record)
+            if record is None or record.state != IdempotencyKey.State.COMPLETED:
+                return Response(
+                    {'error': "Une requête avec cette Idempotency-Key est toujours en cours"},
+                    status=status.HTTP_409_CONFLICT
+                )
+            return Response(
+                record.response_body, status=record.status_code, headers={'Idempotent-Replayed': 'true'}
+            )
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        if response.status_code >= 500:
+            # Erreur transitoire : le client doit pouvoir réessayer avec la même clé
+            record.delete()
+        else:
+            record.state = IdempotencyKey.State.COMPLETED
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.save(update_fields=['state', 'status_code', 'response_body', 'updated_at'])
+        return response
+
+    return wrapper
+
+
+def purge_expired(chunk_size=1000):
+    """Supprime les clés expirées par paquets ; renvoie le nombre de lignes supprimées."""
+    total = 0
+    while True:
+        pks = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+            .values_list('pk', flat=True)[:chunk_size]
+        )
+        if not pks:
+            return total
+        deleted, _ = IdempotencyKey.objects.filter(pk__in=pks).delete()
+        total += deleted
@@ -0,0 +1,174 @@
+import logging
+import random
+import threading
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from payments import merchants, resilience
+from payments.exceptions import PaymentValidationError, PayPalAPIError, PayPalUnavailableError
+from payments.models import PaymentJob
+from payments.serializers import PaymentRefundSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def transient_error(error):
+    """Panne PayPal ou réseau à l'origine de `error`, ou None pour une erreur métier.
+
+    Les services enveloppent les erreurs (PaymentProcessError, RefundError) : la chaîne
+    __cause__/__context__ est parcourue. Seules ces pannes justifient un nouvel essai.
+    """
+    while error is not None:
+        if isinstance(error, PayPalUnavailableError) or resilience.is_transient(error):
+            return error
+        if isinstance(error, PayPalAPIError) and error.params.get('status', 0) >= 500:
+            return error
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def enqueue(kind, payload):
+    # PayPal-Request-Id envoyé à chaque essai : un essai après un timeout ne crée pas de doublon
+    return PaymentJob.objects.create(
+        kind=kind,
+        payload={**payload, 'request_id': str(uuid.uuid4())},
+        max_attempts=settings.PAYMENTS_JOBS['MAX_ATTEMPTS'],
+        run_at=timezone.now(),
+    )
+
+
+def claim(worker_id, limit):
+    """Réserve jusqu'à `limit` jobs prêts pour ce worker.
+
+    Postgres : SELECT ... FOR UPDATE SKIP LOCKED, les workers ne se bloquent pas entre eux.
+    Ailleurs (SQLite) : UPDATE conditionnel sur le statut, seul le premier worker l'emporte.
+    """
+    now = timezone.now()
+    ready = PaymentJob.objects.filter(status=PaymentJob.Status.QUEUED, run_at__lte=now).order_by('run_at')
+    claimed_fields = {'status': PaymentJob.Status.RUNNING, 'locked_by': worker_id, 'locked_at': now, 'updated_at': now}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pks = list(ready.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            PaymentJob.objects.filter(pk__in=pks).update(**claimed_fields)
+    else:
+        pks = []
+        for pk in ready.values_list('pk', flat=True)[:limit]:
+            if PaymentJob.objects.filter(pk=pk, status=PaymentJob.Status.QUEUED).update(**claimed_fields):
+                pks.append(pk)
+    return list(PaymentJob.objects.filter(pk__in=pks).order_by('run_at'))
+
+
+def requeue_stale(lock_timeout=None):
+    """Remet en file les jobs « running » dont le worker a disparu."""
+    lock_timeout = lock_timeout or settings.PAYMENTS_JOBS['LOCK_TIMEOUT']
+    return PaymentJob.objects.filter(
+        status=PaymentJob.Status.RUNNING,
+        locked_at__lt=timezone.now() - timedelta(seconds=lock_timeout),
+    ).update(status=PaymentJob.Status.QUEUED, locked_by=None, locked_at=None)
+
+
+def _backoff(attempts):
+    config = settings.PAYMENTS_JOBS
+    delay = min(config['BACKOFF_BASE'] * 2 ** (attempts - 1), config['BACKOFF_MAX'])
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def _execute(service, job):
+    payload = job.payload
+    if job.kind == PaymentJob.Kind.CREATE:
+        merchant = merchants.get_merchant(payload.get('merchant'))
+        return service.create_payment(
+            Decimal(payload['amount']), payload.get('description', ''), None, None,
+            merchant=merchant, request_id=payload['request_id'],
+        )
+    if job.kind == PaymentJob.Kind.REFUND:
+        amount = Decimal(payload['amount']) if payload.get('amount') else None
+        refund = service.refund_payment(
+            payload['payment_id'], amount, payload.get('reason'), request_id=payload['request_id'],
+        )
+        return PaymentRefundSerializer(refund).data
+    raise PaymentValidationError(f"Type de job inconnu: {job.kind}")
+
+
+def _owned(job):
+    return PaymentJob.objects.filter(pk=job.pk, status=PaymentJob.Status.RUNNING, locked_by=job.locked_by)
+
+
+class Heartbeat:
+    """Rafraîchit locked_at du job pendant son exécution (toutes les LOCK_TIMEOUT / 3 secondes).
+
+    Un appel PayPal lent n'est donc pas confié à un autre worker par requeue_stale.
+    """
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = interval or settings.PAYMENTS_JOBS['LOCK_TIMEOUT'] / 3
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f'job-heartbeat-{job.pk}', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def _beat(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                if not _owned(self.job).update(locked_at=timezone.now()):
+                    logger.warning("Job %s: verrou perdu pendant l'exécution", self.job.pk)
+                    return
+        finally:
+            connection.close()  # connexion propre à ce thread
+
+
+def run(service, job):
+    """Exécute un job réservé et enregistre son issue (succès, nouvel essai différé ou échec).
+
+    L'issue n'est enregistrée que si ce worker détient encore le job ; sinon elle est
+    abandonnée (le job a été remis en file et repris ailleurs).
+    """
+    if 'request_id' not in job.payload:
+        # Job mis en file avant l'ajout de request_id : fixé avant le premier appel PayPal
+        job.payload['request_id'] = str(uuid.uuid4())
+        _owned(job).update(payload=job.payload)
+    job.attempts += 1
+    try:
+        with Heartbeat(job):
+            job.result = _execute(service, job)
+    except Exception as e:
+        job.error_message = str(e)
+        transient = transient_error(e)
+        if transient is not None and job.attempts < job.max_attempts:
+            job.status = PaymentJob.Status.QUEUED
+            delay = _backoff(job.attempts)
+            if isinstance(transient, PayPalUnavailableError):
+                # Inutile de revenir avant la réouverture du disjoncteur
+                delay = max(delay, timedelta(seconds=transient.retry_after))
+            job.run_at = timezone.now() + delay
+            logger.warning("Job %s en échec (essai %d/%d): %s", job.pk, job.attempts, job.max_attempts, e)
+        else:
+            job.status = PaymentJob.Status.FAILED
+            logger.error("Job %s abandonné après %d essai(s): %s", job.pk, job.attempts, e)
+    else:
+        job.status = PaymentJob.Status.SUCCEEDED
+        job.error_message = None
+
+    saved = _owned(job).update(
+        attempts=job.attempts, result=job.result, error_message=job.error_message, status=job.status,
+        run_at=job.run_at, locked_by=None, locked_at=None, updated_at=timezone.now(),
+    )
+    if not saved:
+        logger.warning("Job %s repris par un autre worker : issue de %s abandonnée", job.pk, job.locked_by)
+        return job
+    job.locked_by = None
+    job.locked_at = None
+    return job
@@ -0,0 +1,86 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from payments import rollups, status_cache
+from payments.exceptions import RefundError
+from payments.models import Payment, PaymentRefund
+
+REFUNDABLE_STATUSES = (Payment.Status.COMPLETED, Payment.Status.PARTIALLY_REFUNDED)
+CENT = Decimal('0.01')
+
+
+def refunded_status(amount, refunded_amount):
+    if refunded_amount <= 0:
+        return Payment.Status.COMPLETED
+    if refunded_amount >= amount:
+        return Payment.Status.REFUNDED
+    return Payment.Status.PARTIALLY_REFUNDED
+
+
+def reserve(payment, amount=None):
+    """Réserve `amount` (par défaut : le restant) sur `refunded_amount` avant l'appel PayPal.
+
+    Un seul UPDATE conditionnel : deux remboursements concurrents ne peuvent pas
+    dépasser le montant du paiement, sans verrou ni SUM sur les remboursements.
+    Renvoie le montant réservé.
+    """
+    if payment.status not in REFUNDABLE_STATUSES:
+        raise RefundError("Impossible de rembourser un paiement non complété")
+    remaining = payment.amount - payment.refunded_amount
+    if amount is None:
+        amount = remaining
+        if amount <= 0:
+            raise RefundError("Paiement déjà entièrement remboursé", code='already_refunded')
+    amount = Decimal(str(amount)).quantize(CENT)
+    if amount <= 0:
+        raise RefundError("Le montant du remboursement doit être supérieur à 0", code='invalid_amount')
+
+    reserved = Payment.objects.filter(
+        pk=payment.pk,
+        status__in=REFUNDABLE_STATUSES,
+        refunded_amount__lte=F('amount') - amount,
+    ).update(refunded_amount=F('refunded_amount') + amount, updated_at=timezone.now())
+    if not reserved:
+        raise RefundError(
+            "Montant supérieur au restant remboursable",
+            code='refund_exceeds_balance',
+            params={'amount': str(amount)},
+        )
+    status_cache.invalidate(payment.pk)
+    payment.refunded_amount += amount
+    return amount
+
+
+def release(payment, amount):
+    """Annule une réservation dont le remboursement PayPal a échoué."""
+    with transaction.atomic():
+        locked = Payment.objects.select_for_update().get(pk=payment.pk)
+        locked.refunded_amount -= amount
+        _save(locked)
+    payment.refunded_amount, payment.status = locked.refunded_amount, locked.status
+
+
+def record(payment, amount, refund_id, reason=None):
+    """Enregistre le remboursement confirmé par PayPal et met le statut à jour."""
+    with transaction.atomic():
+        locked = Payment.objects.select_for_update().get(pk=payment.pk)
+        refund = PaymentRefund.objects.filter(payment=locked, refund_id=refund_id).first() if refund_id else None
+        if refund is not None:
+            # Déjà reçu par webhook, qui l'a compté : on rend notre réservation
+            locked.refunded_amount -= amount
+        else:
+            refund = PaymentRefund.objects.create(payment=locked, refund_id=refund_id, amount=amount, reason=reason)
+            rollups.record_refunds([refund])
+        _save(locked)
+    payment.refunded_amount, payment.status = locked.refunded_amount, locked.status
+    return refund
+
+
+def _save(locked):
+    previous_status = locked.status
+    if previous_status in REFUNDABLE_STATUSES + (Payment.Status.REFUNDED,):
+        locked.status = refunded_status(locked.amount, locked.refunded_amount)
+    rollups.save_payment(locked, previous_status, update_fields=['refunded_amount', 'status', 'updated_at'])
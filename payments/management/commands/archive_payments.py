@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from payments import archive
+from payments.exceptions import PaymentValidationError
+
+
+class Command(BaseCommand):
+    help = (
+        "Déplace les paiements clos (et leurs remboursements) de plus de N mois vers les tables "
+        "d'archive, par lots courts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, help="Âge en mois (défaut : PAYMENTS_ARCHIVE_AFTER_MONTHS)")
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--max-seconds', type=int, help="Budget de temps de l'archivage")
+        parser.add_argument('--dry-run', action='store_true', help="Compte les lignes sans les déplacer")
+
+    def handle(self, *args, **options):
+        try:
+            totals = archive.archive(
+                months=options['months'],
+                batch_size=options['batch_size'],
+                max_seconds=options['max_seconds'],
+                dry_run=options['dry_run'],
+                on_batch=self._progress,
+            )
+        except PaymentValidationError as e:
+            raise CommandError(str(e))
+        rate = totals['payments'] / totals['seconds'] if totals['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['payments']} paiement(s) et {totals['refunds']} remboursement(s) archivé(s) "
+            f"en {totals['seconds']}s ({rate:,.0f}/s)"
+            f"{', ' + str(totals['skipped']) + ' verrouillé(s)' if totals['skipped'] else ''}"
+            f"{' (simulation)' if options['dry_run'] else ''}"
+        ))
+
+    def _progress(self, counts):
+        self.stdout.write(f"lot de {counts['rows']} : {counts['payments']} paiement(s), {counts['refunds']} remboursement(s)")
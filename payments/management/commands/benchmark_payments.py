@@ -0,0 +1,78 @@
+import json
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from payments import benchmark
+from payments.fake_paypal import FakePayPalServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure create -> execute -> refund à concurrence fixe contre le faux PayPal "
+        "(débit, p50/p95/p99, requêtes SQL par appel). Écrit des paiements dans la base configurée."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--amount', default='10.00')
+        parser.add_argument('--output', default='benchmark.json', help="Rapport JSON")
+        parser.add_argument('--start-fake', action='store_true',
+                            help="Démarre le faux PayPal sur l'hôte/port de PAYPAL_ENDPOINT")
+        parser.add_argument('--latency', type=float, default=0.0, help="Avec --start-fake : latence (ms)")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Avec --start-fake : taux d'erreur")
+        parser.add_argument('--baseline', help="Rapport précédent à comparer")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Régression tolérée (0.2 = 20 %%)")
+
+    def handle(self, *args, **options):
+        endpoint = settings.PAYPAL_CONFIG.get('PAYPAL_ENDPOINT')
+        host = urlparse(endpoint).hostname if endpoint else None
+        if host not in ('localhost', '127.0.0.1', '::1'):
+            raise CommandError(
+                "PAYPAL_ENDPOINT doit pointer vers un faux PayPal local "
+                "(ex. http://127.0.0.1:8765, voir manage.py run_fake_paypal)"
+            )
+
+        server = None
+        if options['start_fake']:
+            server = FakePayPalServer(
+                (host, urlparse(endpoint).port or 80),
+                latency=options['latency'] / 1000,
+                error_rate=options['error_rate'],
+            )
+            server.start()
+
+        try:
+            result = benchmark.run(
+                concurrency=options['concurrency'],
+                iterations=options['iterations'],
+                amount=options['amount'],
+                warmup=options['warmup'],
+            )
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+        self.stdout.write(
+            f"{result['completed_flows']}/{options['iterations']} parcours en {result['duration_seconds']}s "
+            f"({result['flows_per_second']} parcours/s, {result['requests_per_second']} req/s)"
+        )
+        for step, metrics in result['steps'].items():
+            self.stdout.write(
+                f"  {step:<8} p50={metrics['p50_ms']}ms p95={metrics['p95_ms']}ms p99={metrics['p99_ms']}ms "
+                f"requêtes SQL={metrics['queries_per_request']} erreurs={metrics['errors']}"
+            )
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                regressions = benchmark.compare(result, json.load(f), options['tolerance'])
+            if regressions:
+                raise CommandError("Régressions: " + '; '.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"Rapport écrit dans {options['output']}"))
@@ -0,0 +1,30 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments import openapi
+
+
+class Command(BaseCommand):
+    help = (
+        "Génère le schéma OpenAPI une fois (JSON, YAML et variantes gzip/brotli) pour qu'il soit "
+        "servi depuis des fichiers, à lancer à chaque déploiement"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', help="Répertoire de sortie (défaut : PAYMENTS_OPENAPI_DIR)")
+
+    def handle(self, *args, **options):
+        directory = Path(options['output_dir'] or settings.PAYMENTS_OPENAPI['DIR'])
+        manifest = openapi.build(directory)
+        for entry in manifest['formats'].values():
+            sizes = ', '.join(
+                f"{encoding} {(directory / name).stat().st_size:,} o" for encoding, name in entry['files'].items()
+            )
+            self.stdout.write(f"{entry['files']['identity']} : {sizes}")
+        if openapi.brotli is None:
+            self.stdout.write("Paquet brotli absent : pas de variante .br")
+        self.stdout.write(self.style.SUCCESS(
+            f"Schéma OpenAPI {manifest['version']} écrit dans {directory}"
+        ))
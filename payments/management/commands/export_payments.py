@@ -0,0 +1,49 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from payments import exports, replicas
+from payments.models import Payment
+
+
+class Command(BaseCommand):
+    help = "Exporte paiements et remboursements en CSV/NDJSON, en flux (mémoire constante)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Fichier de sortie (défaut : sortie standard)")
+        parser.add_argument('--format', dest='export_format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--status', choices=Payment.Status.values)
+        parser.add_argument('--since', help="Paiements créés depuis (AAAA-MM-JJ)")
+        parser.add_argument('--until', help="... et jusqu'au (AAAA-MM-JJ, exclu)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        filters = {}
+        if options['status']:
+            filters['status'] = options['status']
+        for option, lookup in (('since', 'created_at__date__gte'), ('until', 'created_at__date__lt')):
+            if options[option]:
+                value = parse_date(options[option])
+                if value is None:
+                    raise CommandError(f"Date invalide pour --{option}: {options[option]}")
+                filters[lookup] = value
+
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        started = time.monotonic()
+        written = 0
+        try:
+            for chunk in exports.stream_export(
+                options['export_format'], options['gzip'], filters, options['chunk_size'],
+                using=replicas.read_alias(),
+            ):
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        self.stderr.write(self.style.SUCCESS(
+            f"{written} octets écrits en {time.monotonic() - started:.1f}s"
+        ))
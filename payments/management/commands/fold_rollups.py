@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from payments import rollups
+
+
+class Command(BaseCommand):
+    help = "Reporte les deltas d'agrégats en attente (PaymentRollupDelta) sur PaymentDailyRollup"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Deltas repliés par transaction")
+
+    def handle(self, *args, **options):
+        folded = rollups.fold(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{folded} delta(s) replié(s)"))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.webhooks import process_pending_events
+
+
+class Command(BaseCommand):
+    help = "Applique par lots les webhooks PayPal reçus aux paiements et remboursements"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Pause (s) quand la boîte de réception est vide")
+        parser.add_argument('--once', action='store_true', help="Vide la boîte de réception puis s'arrête")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = process_pending_events(options['batch_size'])
+            total += processed
+            if processed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"{total} événement(s) traité(s)"))
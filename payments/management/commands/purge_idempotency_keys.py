@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from payments.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Supprime les clés d'idempotence expirées"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = purge_expired(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} clé(s) supprimée(s)"))
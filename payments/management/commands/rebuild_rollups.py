@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from payments import rollups
+
+
+class Command(BaseCommand):
+    help = "Recalcule les agrégats journaliers (PaymentDailyRollup) depuis les paiements et remboursements"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Premier jour à recalculer (AAAA-MM-JJ)")
+        parser.add_argument('--until', help="Jour de fin, exclu (AAAA-MM-JJ)")
+
+    def handle(self, *args, **options):
+        days = {}
+        for option in ('since', 'until'):
+            if options[option]:
+                days[option] = parse_date(options[option])
+                if days[option] is None:
+                    raise CommandError(f"Date invalide pour --{option}: {options[option]}")
+        rows = rollups.rebuild(**days)
+        self.stdout.write(self.style.SUCCESS(f"{rows} ligne(s) d'agrégats recalculée(s)"))
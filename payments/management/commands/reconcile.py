@@ -0,0 +1,90 @@
+import csv
+import sys
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from payments.exceptions import ReconciliationError
+from payments.reconciliation import read_ledger, read_report, reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Rapproche un rapport PayPal (CSV trié par identifiant de paiement) des tables "
+        "Payment/PaymentRefund par jointure-fusion en flux"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('report', help="Chemin du rapport CSV PayPal")
+        parser.add_argument('--output', help="Fichier CSV des écarts (défaut : sortie standard)")
+        parser.add_argument('--key-column', default='payment_id')
+        parser.add_argument('--amount-column', default='amount')
+        parser.add_argument('--currency-column', default='currency')
+        parser.add_argument('--status-column', default='status')
+        parser.add_argument('--amount-in-cents', action='store_true',
+                            help="Montants du rapport en centimes (rapports STL)")
+        parser.add_argument('--since', help="Ne considère que les paiements créés depuis (AAAA-MM-JJ)")
+        parser.add_argument('--until', help="... et jusqu'au (AAAA-MM-JJ, exclu)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--progress-every', type=int, default=100000,
+                            help="Affiche la progression toutes les N lignes lues")
+
+    def handle(self, *args, **options):
+        filters = {}
+        for option, lookup in (('since', 'created_at__date__gte'), ('until', 'created_at__date__lt')):
+            if options[option]:
+                value = parse_date(options[option])
+                if value is None:
+                    raise CommandError(f"Date invalide pour --{option}: {options[option]}")
+                filters[lookup] = value
+
+        columns = {
+            'key': options['key_column'],
+            'amount': options['amount_column'],
+            'currency': options['currency_column'],
+            'status': options['status_column'],
+        }
+        stats = Counter()
+        kinds = Counter()
+        out = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        started = time.monotonic()
+        progress_every = options['progress_every']
+
+        def with_progress(entries):
+            next_progress = progress_every
+            for entry in entries:
+                yield entry
+                rows = stats['report_rows'] + stats['ledger_rows']
+                if rows >= next_progress:
+                    self._progress(stats, started)
+                    next_progress = rows + progress_every
+
+        try:
+            writer = csv.writer(out)
+            writer.writerow(['payment_id', 'kind', 'expected', 'actual'])
+            mismatches = reconcile(
+                read_report(options['report'], columns, options['amount_in_cents'], stats),
+                with_progress(read_ledger(filters, options['chunk_size'], stats)),
+            )
+            for mismatch in mismatches:
+                writer.writerow(mismatch)
+                kinds[mismatch.kind] += 1
+        except ReconciliationError as e:
+            raise CommandError(str(e))
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        self._progress(stats, started)
+        summary = ', '.join(f'{kind}={count}' for kind, count in sorted(kinds.items())) or 'aucun écart'
+        self.stderr.write(self.style.SUCCESS(f"Rapprochement terminé : {summary}"))
+
+    def _progress(self, stats, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        rows = stats['report_rows'] + stats['ledger_rows']
+        self.stderr.write(
+            f"{stats['report_rows']} lignes rapport, {stats['ledger_rows']} paiements, "
+            f"{elapsed:.1f}s, {rows / elapsed:,.0f} lignes/s"
+        )
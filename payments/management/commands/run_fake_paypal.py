@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from payments.fake_paypal import FakePayPalServer
+
+
+class Command(BaseCommand):
+    help = "Lance un faux serveur PayPal local (tests de charge) ; pointer PAYPAL_ENDPOINT dessus"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0.0, help="Latence fixe par appel (ms)")
+        parser.add_argument('--jitter', type=float, default=0.0, help="Latence aléatoire ajoutée (ms)")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Proportion d'appels en erreur (0-1)")
+        parser.add_argument('--error-status', type=int, default=503)
+
+    def handle(self, *args, **options):
+        server = FakePayPalServer(
+            (options['host'], options['port']),
+            latency=options['latency'] / 1000,
+            jitter=options['jitter'] / 1000,
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Faux PayPal sur {server.url} (PAYPAL_ENDPOINT={server.url})"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Appels servis: {dict(server.requests)}")
@@ -0,0 +1,65 @@
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from payments import jobs, rollups
+from payments.services import PaymentService
+
+
+class Command(BaseCommand):
+    help = "Exécute les jobs de paiement/remboursement en file (sans broker, sur la base existante)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.PAYMENTS_JOBS['CONCURRENCY'])
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Pause (s) quand aucun job n'est prêt")
+        parser.add_argument('--once', action='store_true', help="Traite les jobs prêts puis s'arrête")
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        service = PaymentService()
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write(f"Worker {worker_id} démarré (concurrence {concurrency})")
+        in_flight = set()
+        done = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while not self._stopping:
+                jobs.requeue_stale()
+                free = concurrency - len(in_flight)
+                claimed = jobs.claim(worker_id, free) if free else []
+                for job in claimed:
+                    in_flight.add(executor.submit(self._run, service, job))
+
+                if not in_flight:
+                    # Temps libre : report des deltas d'agrégats sur PaymentDailyRollup
+                    rollups.fold()
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                # Slots libres : on revient vite réserver de nouveaux jobs ; sinon on attend une fin
+                timeout = None if len(in_flight) >= concurrency else options['poll_interval']
+                finished, in_flight = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                done += len(finished)
+            wait(in_flight)
+        self.stdout.write(self.style.SUCCESS(f"{done + len(in_flight)} job(s) exécuté(s)"))
+
+    def _run(self, service, job):
+        try:
+            return jobs.run(service, job)
+        finally:
+            close_old_connections()
+
+    def _stop(self, signum, frame):
+        self._stopping = True
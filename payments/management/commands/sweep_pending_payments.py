@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from payments import sweeper
+
+
+class Command(BaseCommand):
+    help = (
+        "Solde les paiements PENDING abandonnés : état PayPal lu en parallèle, puis passage "
+        "en completed, failed ou expired par lots"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, help="Âge minimal en secondes (défaut : PAYMENTS_SWEEPER_MIN_AGE)")
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--concurrency', type=int, help="Appels PayPal simultanés")
+        parser.add_argument('--max-seconds', type=int, help="Budget de temps du balayage")
+        parser.add_argument('--max-rate', type=float, help="Appels PayPal par seconde au plus (0 : sans limite)")
+        parser.add_argument('--dry-run', action='store_true', help="Lit PayPal sans modifier les paiements")
+
+    def handle(self, *args, **options):
+        totals = sweeper.sweep(
+            min_age=options['min_age'],
+            batch_size=options['batch_size'],
+            concurrency=options['concurrency'],
+            max_seconds=options['max_seconds'],
+            max_rate=options['max_rate'],
+            dry_run=options['dry_run'],
+            on_batch=self._progress,
+        )
+        summary = ', '.join(f'{outcome}={totals[outcome]}' for outcome in sweeper.OUTCOMES if totals[outcome])
+        rate = totals['rows'] / totals['seconds'] if totals['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['rows']} paiement(s) examiné(s) en {totals['seconds']}s ({rate:,.0f}/s), "
+            f"{totals['paypal_calls']} appel(s) PayPal{' : ' + summary if summary else ''}"
+            f"{' (simulation)' if options['dry_run'] else ''}"
+        ))
+
+    def _progress(self, counts):
+        outcomes = ', '.join(f'{outcome}={counts[outcome]}' for outcome in sweeper.OUTCOMES if counts[outcome])
+        self.stdout.write(
+            f"lot de {counts['rows']} : {counts['paypal_calls']} appel(s) PayPal, "
+            f"{counts['rows_per_second']:,.0f} lignes/s{', ' + outcomes if outcomes else ''}"
+        )
@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from payments.exceptions import PaymentValidationError
+from payments.models import Merchant
+from payments.tokens import CachedTokenApi, get_token_manager
+from payments.transport import paypal_endpoint
+
+DEFAULT = 'default'
+
+
+def credentials(merchant=None):
+    """(clé du pool, mode, client_id, client_secret) du marchand ; None : compte des settings.
+
+    La clé inclut `updated_at` : des identifiants modifiés donnent une nouvelle entrée.
+    """
+    if merchant is None:
+        config = settings.PAYPAL_CONFIG
+        return DEFAULT, config['PAYPAL_MODE'], config['PAYPAL_CLIENT_ID'], config['PAYPAL_CLIENT_SECRET']
+    return (
+        f'{merchant.pk}:{merchant.updated_at.timestamp()}', merchant.mode, merchant.client_id, merchant.client_secret,
+    )
+
+
+def currency(merchant=None):
+    return merchant.currency if merchant is not None else settings.PAYPAL_CONFIG['PAYPAL_CURRENCY']
+
+
+class ApiPool:
+    """LRU borné d'Api PayPal par marchand.
+
+    Chaque Api a son TokenManager (token OAuth propre, partagé entre workers) ;
+    toutes passent par le transport HTTP du processus, donc par le même pool
+    keep-alive vers PayPal. Aucune configuration globale du SDK n'est modifiée.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._apis = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, merchant=None):
+        key, mode, client_id, client_secret = credentials(merchant)
+        with self._lock:
+            api = self._apis.get(key)
+            if api is not None:
+                self._apis.move_to_end(key)
+                self.hits += 1
+                return api
+            self.misses += 1
+            api = self._apis[key] = CachedTokenApi(
+                mode=mode,
+                client_id=client_id,
+                client_secret=client_secret,
+                endpoint=paypal_endpoint(mode),
+                token_manager=get_token_manager(client_id, client_secret, mode),
+            )
+            while len(self._apis) > self.max_size:
+                self._apis.popitem(last=False)
+                self.evictions += 1
+            return api
+
+    def stats(self):
+        return {
+            'size': len(self._apis), 'max_size': self.max_size,
+            'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ApiPool(settings.PAYPAL_CONFIG['PAYPAL_MERCHANT_POOL_SIZE'])
+    return _pool
+
+
+def get_api(merchant=None):
+    return get_pool().get(merchant)
+
+
+def get_merchant(slug):
+    """Marchand actif désigné par `slug` ; None si `slug` est vide (compte par défaut)."""
+    if not slug:
+        return None
+    merchant = Merchant.objects.filter(slug=slug, is_active=True).first()
+    if merchant is None:
+        raise PaymentValidationError(
+            f"Marchand inconnu ou inactif: {slug}", code='unknown_merchant', params={'merchant': slug}
+        )
+    return merchant
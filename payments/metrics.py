@@ -0,0 +1,258 @@
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Secondes : de 5 ms (cache, SQL) à 30 s (timeout PayPal)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: labels attendus {self.labelnames}, reçus {tuple(labels)}")
+        try:
+            return tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError:
+            raise ValueError(f"{self.name}: labels attendus {self.labelnames}, reçus {tuple(labels)}")
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_items(items))
+        return lines
+
+    def _render_items(self, items):
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    """Histogramme cumulatif Prometheus : une recherche dichotomique et un verrou par observation."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_items(self, items):
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """Format texte d'exposition Prometheus (version 0.0.4)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Registre du processus : chaque worker expose ses propres séries
+registry = Registry()
+
+paypal_request_duration = registry.histogram(
+    'paypal_request_duration_seconds', "Durée des appels HTTP à PayPal", ('operation', 'outcome'),
+)
+paypal_requests_in_flight = registry.gauge(
+    'paypal_requests_in_flight', "Appels PayPal en cours", ('operation',),
+)
+service_duration = registry.histogram(
+    'payments_service_duration_seconds', "Durée des méthodes de service de paiement", ('method',),
+)
+service_calls = registry.counter(
+    'payments_service_calls_total', "Appels des méthodes de service par issue (ok ou classe d'exception)",
+    ('method', 'outcome'),
+)
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds', "Durée des requêtes HTTP par route", ('route', 'method', 'status'),
+)
+http_requests_in_flight = registry.gauge(
+    'http_requests_in_flight', "Requêtes HTTP en cours", (),
+)
+db_queries_per_request = registry.histogram(
+    'db_queries_per_request', "Requêtes SQL par requête HTTP", ('route',), buckets=QUERY_COUNT_BUCKETS,
+)
+db_query_duration_per_request = registry.histogram(
+    'db_query_duration_seconds_per_request', "Temps SQL cumulé par requête HTTP", ('route',),
+)
+
+
+def _outcome(error):
+    return 'ok' if error is None else type(error).__name__
+
+
+def instrument(method_name):
+    """Mesure durée et issue d'une méthode de service (synchrone ou coroutine)."""
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                error = None
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    service_duration.observe(time.perf_counter() - start, method=method_name)
+                    service_calls.inc(method=method_name, outcome=_outcome(error))
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            error = None
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                service_duration.observe(time.perf_counter() - start, method=method_name)
+                service_calls.inc(method=method_name, outcome=_outcome(error))
+        return wrapper
+
+    return decorator
+
+
+class _Call:
+    outcome = 'ok'
+
+
+@contextmanager
+def paypal_call(operation):
+    """Chronomètre un appel HTTP à PayPal et le compte comme en cours.
+
+    L'appelant renseigne `call.outcome` (ex. « 2xx », « 5xx ») ; une exception donne le nom de sa classe.
+    """
+    call = _Call()
+    start = time.perf_counter()
+    paypal_requests_in_flight.inc(operation=operation)
+    try:
+        yield call
+    except Exception as e:
+        call.outcome = type(e).__name__
+        raise
+    finally:
+        paypal_requests_in_flight.dec(operation=operation)
+        paypal_request_duration.observe(time.perf_counter() - start, operation=operation, outcome=call.outcome)
+
+
+def status_class(status_code):
+    return f'{status_code // 100}xx'
@@ -0,0 +1,120 @@
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from payments import metrics, replicas
+
+
+class QueryStats:
+    """execute_wrapper : compte les requêtes SQL et leur durée, sans activer le curseur de debug."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class MetricsMiddleware:
+    """Durée des requêtes par route (une route par action de PaymentViewSet), requêtes SQL par requête.
+
+    Le comptage SQL ne couvre que les vues synchrones : les vues async passent
+    par sync_to_async, dont les connexions vivent dans d'autres threads.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PAYMENTS_METRICS['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = QueryStats()
+        start = time.perf_counter()
+        metrics.http_requests_in_flight.inc()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            metrics.http_requests_in_flight.dec()
+        self._observe(request, response, time.perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        metrics.http_requests_in_flight.inc()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.http_requests_in_flight.dec()
+        self._observe(request, response, time.perf_counter() - start, None)
+        return response
+
+    def _observe(self, request, response, duration, stats):
+        route = _route(request)
+        metrics.http_request_duration.observe(
+            duration, route=route, method=request.method, status=response.status_code
+        )
+        if stats is not None:
+            metrics.db_queries_per_request.observe(stats.count, route=route)
+            metrics.db_query_duration_per_request.observe(stats.duration, route=route)
+
+
+class ReplicaPinningMiddleware:
+    """Après une écriture réussie, le client lit sur le primaire pendant PIN_SECONDS (cookie).
+
+    Sans réplica configuré, le middleware est retiré de la chaîne.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PAYMENTS_DB_REPLICAS['ALIASES']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self._pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._pin(request, await self.get_response(request))
+
+    def _pin(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(
+                replicas.PIN_COOKIE, '1', max_age=settings.PAYMENTS_DB_REPLICAS['PIN_SECONDS'],
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_alter_payment_payment_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='payer_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
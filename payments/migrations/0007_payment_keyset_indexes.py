@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-17 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_payment_job'),
+    ]
+
+    operations = [
+        # Couvert par payment_status_created_idx, qui commence par status
+        migrations.RemoveIndex(
+            model_name='payment',
+            name='payments_pa_status_7ad4af_idx',
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['-created_at', '-id'], name='payment_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='payment_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['currency', '-created_at', '-id'], name='payment_currency_created_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-17 21:00
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_refunded_amount(apps, schema_editor):
+    Payment = apps.get_model('payments', 'Payment')
+    PaymentRefund = apps.get_model('payments', 'PaymentRefund')
+    totals = (
+        PaymentRefund.objects.filter(payment=OuterRef('pk'))
+        .order_by()
+        .values('payment')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    Payment.objects.filter(refunds__isnull=False).update(
+        refunded_amount=Coalesce(Subquery(totals), models.Value(0), output_field=models.DecimalField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0009_payment_sale_details'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='refunded_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_refunded_amount, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.1.6 on 2026-10-17 21:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def partition_payment_archive(apps, schema_editor):
+    """Sous PostgreSQL, recrée la table d'archive (vide) partitionnée par mois sur created_at.
+
+    La clé primaire d'une table partitionnée doit contenir la clé de partition : (id, created_at).
+    Les partitions mensuelles sont créées par `manage.py archive_payments` ; la partition
+    par défaut ne reçoit rien tant qu'elles existent.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE payments_paymentarchive RENAME TO payments_paymentarchive_old')
+    schema_editor.execute(
+        'CREATE TABLE payments_paymentarchive '
+        '(LIKE payments_paymentarchive_old INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        'PARTITION BY RANGE (created_at)'
+    )
+    schema_editor.execute('DROP TABLE payments_paymentarchive_old')
+    schema_editor.execute('ALTER TABLE payments_paymentarchive ADD PRIMARY KEY (id, created_at)')
+    schema_editor.execute('CREATE INDEX payment_archive_payid_idx ON payments_paymentarchive (payment_id)')
+    schema_editor.execute('CREATE TABLE payments_paymentarchive_default PARTITION OF payments_paymentarchive DEFAULT')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0012_payment_expired_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentArchive',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('payment_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('currency', models.CharField(max_length=3)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('refunded_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('refunded', 'Refunded'), ('partially_refunded', 'Partially Refunded'), ('expired', 'Expired')], max_length=20)),
+                ('payer_email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('payer_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('payment_method', models.CharField(blank=True, max_length=50, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('sale_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('sale_state', models.CharField(blank=True, max_length=50, null=True)),
+                ('captured_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('transaction_fee', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('merchant', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='payments.merchant')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PaymentRefundArchive',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('refund_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('refunded', 'Refunded'), ('partially_refunded', 'Partially Refunded'), ('expired', 'Expired')], max_length=20)),
+                ('reason', models.TextField(blank=True, null=True)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('payment', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='refunds', to='payments.paymentarchive')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='paymentarchive',
+            index=models.Index(fields=['payment_id'], name='payment_archive_payid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentrefundarchive',
+            index=models.Index(fields=['refund_id'], name='refund_archive_refund_id_idx'),
+        ),
+        migrations.RunPython(partition_payment_archive, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2026-10-17 21:58
+
+import payments.fields
+from django.db import migrations
+
+
+def _convert_secrets(schema_editor, convert):
+    # SQL brut : le modèle historique déchiffrerait déjà les valeurs en clair
+    connection = schema_editor.connection
+    table = connection.ops.quote_name('payments_merchant')
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT id, client_secret FROM {table}')
+        for pk, secret in cursor.fetchall():
+            if secret:
+                cursor.execute(f'UPDATE {table} SET client_secret = %s WHERE id = %s', [convert(secret), pk])
+
+
+def encrypt_secrets(apps, schema_editor):
+    _convert_secrets(schema_editor, payments.fields.encrypt)
+
+
+def decrypt_secrets(apps, schema_editor):
+    _convert_secrets(schema_editor, payments.fields.decrypt)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0014_payment_rollup_delta'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='merchant',
+            name='client_secret',
+            field=payments.fields.EncryptedTextField(),
+        ),
+        migrations.RunPython(encrypt_secrets, decrypt_secrets),
+    ]
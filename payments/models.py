@@ -1,8 +1,12 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 from django.utils.translation import gettext_lazy as _
 import uuid
 
+from payments.fields import EncryptedTextField
+
+
 class Base(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -12,6 +16,29 @@ class Base(models.Model):
         abstract = True
 
 
+class Merchant(Base):
+    """Compte marchand PayPal : identifiants utilisés pour ses paiements (voir payments.merchants)."""
+
+    class Mode(models.TextChoices):
+        SANDBOX = 'sandbox', _('Sandbox')
+        LIVE = 'live', _('Live')
+
+    name = models.CharField(max_length=255)
+    slug = models.SlugField(max_length=100, unique=True)
+    mode = models.CharField(max_length=10, choices=Mode.choices, default=Mode.SANDBOX)
+    client_id = models.CharField(max_length=255)
+    # Chiffré en base (PAYMENTS_ENCRYPTION_KEYS) ; jamais réaffiché dans l'admin
+    client_secret = EncryptedTextField()
+    currency = models.CharField(max_length=3, default='EUR')
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+
+
 class Payment(Base):
     class Status(models.TextChoices):
         PENDING = 'pending', _('Pending')
@@ -19,10 +46,18 @@ class Payment(Base):
         FAILED = 'failed', _('Failed')
         REFUNDED = 'refunded', _('Refunded')
         PARTIALLY_REFUNDED = 'partially_refunded', _('Partially Refunded')
+        # Approbation PayPal jamais finalisée (manage.py sweep_pending_payments)
+        EXPIRED = 'expired', _('Expired')
         
     payment_id = models.CharField(max_length=255, blank=True, null=True)
+    # Vide : compte par défaut (PAYPAL_CLIENT_ID / PAYPAL_CLIENT_SECRET)
+    merchant = models.ForeignKey(
+        Merchant, on_delete=models.PROTECT, related_name='payments', null=True, blank=True
+    )
     currency = models.CharField(max_length=3, default='EUR')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Somme des remboursements (réservés ou confirmés), tenue par payments.ledger
+    refunded_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(
         max_length=20,
         choices=Status.choices,
@@ -30,10 +65,16 @@ class Payment(Base):
     )
     
     payer_email = models.EmailField(null=True, blank=True)
-    payer_id = models.UUIDField(null=True, blank=True)
+    payer_id = models.CharField(max_length=255, null=True, blank=True)
     payment_method = models.CharField(max_length=50, null=True, blank=True)
     description = models.TextField(null=True, blank=True)
     error_message = models.TextField(null=True, blank=True)
+    sale_id = models.CharField(max_length=255, null=True, blank=True)
+    # Renseignés à l'exécution (ou au premier remboursement pour les anciens paiements)
+    sale_state = models.CharField(max_length=50, null=True, blank=True)
+    captured_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    transaction_fee = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    paypal_snapshot = models.JSONField(null=True, blank=True)
 
     def __str__(self):
         return f'{self.amount} - {self.status}'
@@ -42,7 +83,10 @@ class Payment(Base):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['payment_id']),
-            models.Index(fields=['status']),
+            # Pagination par clé (created_at, id) et filtres de la liste ; le second sert aussi les filtres sur status
+            models.Index(fields=['-created_at', '-id'], name='payment_created_id_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='payment_status_created_idx'),
+            models.Index(fields=['currency', '-created_at', '-id'], name='payment_currency_created_idx'),
         ]
 
 
@@ -67,4 +111,220 @@ class PaymentRefund(Base):
         indexes = [
             models.Index(fields=['refund_id']),
             models.Index(fields=['status']),
-        ]
\ No newline at end of file
+        ]
+
+
+class PaymentArchive(models.Model):
+    """Paiement clos sorti de la table chaude par `manage.py archive_payments`.
+
+    Même pk et mêmes dates que le paiement d'origine, sans `paypal_snapshot`.
+    Sous PostgreSQL, la table est partitionnée par mois sur `created_at` (migration 0013).
+    """
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    payment_id = models.CharField(max_length=255, blank=True, null=True)
+    # Sans contrainte ni index : la table partitionnée n'a que la clé (id, created_at) et payment_id
+    merchant = models.ForeignKey(
+        Merchant, on_delete=models.DO_NOTHING, related_name='+', null=True, blank=True,
+        db_constraint=False, db_index=False,
+    )
+    currency = models.CharField(max_length=3)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    refunded_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    status = models.CharField(max_length=20, choices=Payment.Status.choices)
+    payer_email = models.EmailField(null=True, blank=True)
+    payer_id = models.CharField(max_length=255, null=True, blank=True)
+    payment_method = models.CharField(max_length=50, null=True, blank=True)
+    description = models.TextField(null=True, blank=True)
+    error_message = models.TextField(null=True, blank=True)
+    sale_id = models.CharField(max_length=255, null=True, blank=True)
+    sale_state = models.CharField(max_length=50, null=True, blank=True)
+    captured_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    transaction_fee = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.amount} - {self.status}'
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['payment_id'], name='payment_archive_payid_idx'),
+        ]
+
+
+class PaymentRefundArchive(models.Model):
+    """Remboursement d'un paiement archivé."""
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    # Pas de clé étrangère en base vers une table partitionnée sur (id, created_at)
+    payment = models.ForeignKey(
+        PaymentArchive, on_delete=models.DO_NOTHING, related_name='refunds', db_constraint=False,
+    )
+    refund_id = models.CharField(max_length=255, blank=True, null=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Payment.Status.choices)
+    reason = models.TextField(null=True, blank=True)
+    error_message = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.amount} - {self.status}'
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['refund_id'], name='refund_archive_refund_id_idx'),
+        ]
+
+
+class WebhookEvent(Base):
+    """Boîte de réception durable des événements webhook PayPal, traités par lots."""
+
+    class Status(models.TextChoices):
+        RECEIVED = 'received', _('Received')
+        PROCESSED = 'processed', _('Processed')
+        IGNORED = 'ignored', _('Ignored')
+        FAILED = 'failed', _('Failed')
+
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    resource_type = models.CharField(max_length=50, null=True, blank=True)
+    payload = models.JSONField()
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.RECEIVED,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error_message = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.event_type} - {self.status}'
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+
+class IdempotencyKey(Base):
+    """Réponse mémorisée d'une écriture rejouée avec le même en-tête Idempotency-Key."""
+
+    class State(models.TextChoices):
+        IN_PROGRESS = 'in_progress', _('In progress')
+        COMPLETED = 'completed', _('Completed')
+
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    state = models.CharField(
+        max_length=20,
+        choices=State.choices,
+        default=State.IN_PROGRESS,
+    )
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.scope} - {self.key}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='payments_idempotency_scope_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+
+class PaymentJob(Base):
+    """Intention de paiement/remboursement exécutée hors requête par `manage.py run_payment_worker`."""
+
+    class Kind(models.TextChoices):
+        CREATE = 'create', _('Create payment')
+        REFUND = 'refund', _('Refund payment')
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', _('Queued')
+        RUNNING = 'running', _('Running')
+        SUCCEEDED = 'succeeded', _('Succeeded')
+        FAILED = 'failed', _('Failed')
+
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.QUEUED,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_by = models.CharField(max_length=255, null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error_message = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.kind} - {self.status}'
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+        ]
+
+
+class PaymentDailyRollup(Base):
+    """Agrégats par jour × devise × statut, alimentés par les PaymentRollupDelta repliés.
+
+    Les paiements sont comptés au jour de leur création, les remboursements au jour du
+    remboursement (devise du paiement, statut du remboursement).
+    """
+
+    day = models.DateField()
+    currency = models.CharField(max_length=3)
+    status = models.CharField(max_length=20, choices=Payment.Status.choices)
+    payment_count = models.IntegerField(default=0)
+    amount_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refund_count = models.IntegerField(default=0)
+    refunded_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f'{self.day} {self.currency} {self.status}: {self.amount_total}'
+
+    class Meta:
+        ordering = ['day', 'currency', 'status']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'currency', 'status'], name='payments_rollup_day_currency_status_uniq'),
+        ]
+
+
+class PaymentRollupDelta(models.Model):
+    """Variation d'agrégats écrite par une transaction, en attente de report sur PaymentDailyRollup.
+
+    Insertion seule : les écritures concurrentes ne se disputent pas la ligne du jour.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    day = models.DateField()
+    currency = models.CharField(max_length=3)
+    status = models.CharField(max_length=20, choices=Payment.Status.choices)
+    payment_count = models.IntegerField(default=0)
+    amount_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refund_count = models.IntegerField(default=0)
+    refunded_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.day} {self.currency} {self.status}: {self.amount_total:+}'
+
+    class Meta:
+        ordering = ['id']
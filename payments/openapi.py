@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.http import parse_etags
+from drf_yasg.app_settings import swagger_settings
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+
+try:
+    import brotli
+except ImportError:  # optionnel : pas de variante .br sans le paquet brotli
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'json': 'application/json',
+    'yaml': 'application/yaml',
+}
+# Par ordre de préférence quand le client accepte plusieurs encodages
+ENCODINGS = {
+    'br': '.br',
+    'gzip': '.gz',
+}
+MANIFEST = 'manifest.json'
+
+
+def _encode(schema, schema_format):
+    if schema_format == 'json':
+        return OpenAPICodecJson(validators=[], pretty=True).encode(schema)
+    return OpenAPICodecYaml(validators=[]).encode(schema)
+
+
+def _compress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9, mtime=0)  # mtime=0 : fichiers reproductibles
+    return brotli.compress(body, quality=11)
+
+
+def build(directory=None):
+    """Génère le schéma une fois et l'écrit dans `directory` : JSON et YAML, variantes .gz et .br.
+
+    Fichiers nommés d'après la version de l'API et le hachage du contenu, référencés
+    par manifest.json (remplacé en dernier, atomiquement). Renvoie le manifeste.
+    """
+    directory = Path(directory or settings.PAYMENTS_OPENAPI['DIR'])
+    directory.mkdir(parents=True, exist_ok=True)
+    # Même générateur que schema_view (public=True), sans requête : pas de `host`, Swagger UI prend le sien
+    schema = swagger_settings.DEFAULT_GENERATOR_CLASS(info=swagger_settings.DEFAULT_INFO).get_schema(
+        request=None, public=True,
+    )
+    version = schema.info.version
+
+    manifest = {'version': version, 'formats': {}}
+    for schema_format in FORMATS:
+        body = _encode(schema, schema_format)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        name = f'swagger-{version}.{digest[:12]}.{schema_format}'
+        files = {'identity': name}
+        (directory / name).write_bytes(body)
+        for encoding, suffix in ENCODINGS.items():
+            if encoding == 'br' and brotli is None:
+                continue
+            (directory / (name + suffix)).write_bytes(_compress(body, encoding))
+            files[encoding] = name + suffix
+        manifest['formats'][schema_format] = {'etag': digest, 'files': files}
+
+    tmp = directory / f'{MANIFEST}.tmp'
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, directory / MANIFEST)
+
+    current = {name for entry in manifest['formats'].values() for name in entry['files'].values()}
+    for path in directory.glob('swagger-*'):
+        if path.name not in current:
+            path.unlink()
+    return manifest
+
+
+class Bundle:
+    """Fichiers du manifeste chargés en mémoire : format -> encodage -> (corps, ETag)."""
+
+    def __init__(self, manifest, directory):
+        self.version = manifest['version']
+        self.variants = {}
+        for schema_format, entry in manifest['formats'].items():
+            self.variants[schema_format] = {
+                encoding: (
+                    (directory / name).read_bytes(),
+                    f'"{entry["etag"]}"' if encoding == 'identity' else f'"{entry["etag"]}-{encoding}"',
+                )
+                for encoding, name in entry['files'].items()
+            }
+
+
+_bundle = None
+_bundle_mtime = None
+_lock = threading.Lock()
+
+
+def get_bundle():
+    """Schéma précalculé du processus ; relu si manifest.json change, None s'il n'existe pas."""
+    global _bundle, _bundle_mtime
+    directory = Path(settings.PAYMENTS_OPENAPI['DIR'])
+    try:
+        mtime = (directory / MANIFEST).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if mtime != _bundle_mtime:
+        with _lock:
+            if mtime != _bundle_mtime:
+                _bundle = Bundle(json.loads((directory / MANIFEST).read_text()), directory)
+                _bundle_mtime = mtime
+    return _bundle
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = item.partition(';')
+        params = params.replace(' ', '')
+        try:
+            if params.startswith('q=') and not float(params[2:]):
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def serve(request, schema_format, live_view):
+    """Réponse du schéma précalculé au format demandé, encodée selon Accept-Encoding.
+
+    ETag fort par variante (hachage du contenu, suffixé par l'encodage) et 304 sur
+    If-None-Match. Sans fichiers générés : génération à la volée en DEBUG, 503 sinon.
+    """
+    bundle = get_bundle()
+    if bundle is None:
+        if settings.DEBUG:
+            return live_view()
+        logger.error("Schéma OpenAPI absent de %s : lancer manage.py build_openapi_schema",
+                     settings.PAYMENTS_OPENAPI['DIR'])
+        return JsonResponse({'error': 'Schéma OpenAPI indisponible'}, status=503)
+
+    variants = bundle.variants[schema_format]
+    accepted = _accepted_encodings(request)
+    encoding = next(
+        (encoding for encoding in ENCODINGS if encoding in variants and (encoding in accepted or '*' in accepted)),
+        'identity',
+    )
+    body, etag = variants[encoding]
+
+    if_none_match = [tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))]
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(body, content_type=FORMATS[schema_format])
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Cache-Control'] = f"public, max-age={settings.PAYMENTS_OPENAPI['MAX_AGE']}"
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def precomputed(live_view):
+    """Enveloppe une vue drf_yasg : le schéma est servi depuis les fichiers de build_openapi_schema.
+
+    Couvre /swagger.json|yaml et le ?format=openapi que chargent Swagger UI et ReDoc ;
+    les pages HTML des interfaces restent rendues par drf_yasg, sans introspection des vues.
+    """
+
+    def view(request, *args, **kwargs):
+        schema_format = (kwargs.get('format') or request.GET.get('format') or '').lstrip('.')
+        if schema_format == 'openapi':
+            schema_format = 'json'
+        if schema_format not in FORMATS:
+            return live_view(request, *args, **kwargs)
+        return serve(request, schema_format, lambda: live_view(request, *args, **kwargs))
+
+    return view
@@ -0,0 +1,174 @@
+import csv
+import heapq
+from collections import Counter, namedtuple
+from decimal import Decimal, InvalidOperation
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Collate
+
+from payments.exceptions import ReconciliationError
+from payments.models import Payment, PaymentArchive, PaymentRefund, PaymentRefundArchive
+
+
+Mismatch = namedtuple('Mismatch', 'payment_id kind expected actual')
+ReportEntry = namedtuple('ReportEntry', 'payment_id gross refunded currency status')
+LedgerEntry = namedtuple('LedgerEntry', 'payment_id amount refunded currency status')
+
+# Colonnes par défaut d'un rapport de transactions PayPal normalisé
+DEFAULT_COLUMNS = {
+    'key': 'payment_id',
+    'amount': 'amount',
+    'currency': 'currency',
+    'status': 'status',
+}
+
+# Codes de statut PayPal (rapports STL/TRR ou libellés) -> statut de base de nos paiements.
+# Les remboursements apparaissent comme des lignes négatives, comparées séparément.
+REPORT_STATUSES = {
+    's': 'completed', 'success': 'completed', 'completed': 'completed', 'v': 'completed',
+    'p': 'pending', 'pending': 'pending',
+    'd': 'failed', 'f': 'failed', 'denied': 'failed', 'failed': 'failed',
+}
+LEDGER_STATUSES = {
+    Payment.Status.COMPLETED: 'completed',
+    Payment.Status.REFUNDED: 'completed',
+    Payment.Status.PARTIALLY_REFUNDED: 'completed',
+    Payment.Status.PENDING: 'pending',
+    Payment.Status.FAILED: 'failed',
+    # Approbation abandonnée (manage.py sweep_pending_payments) : jamais encaissé, comme un échec
+    Payment.Status.EXPIRED: 'failed',
+}
+
+
+def read_report(path, columns=None, amount_in_cents=False, stats=None):
+    """Lit le rapport ligne à ligne et le regroupe par paiement (le fichier doit être trié par clé)."""
+    columns = {**DEFAULT_COLUMNS, **(columns or {})}
+    stats = stats if stats is not None else Counter()
+
+    def rows():
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            missing = [name for name in columns.values() if name not in (reader.fieldnames or [])]
+            if missing:
+                raise ReconciliationError(f"Colonnes absentes du rapport: {', '.join(missing)}")
+            previous = None
+            for line, row in enumerate(reader, start=2):
+                key = (row[columns['key']] or '').strip()
+                if not key:
+                    continue
+                if previous is not None and key < previous:
+                    raise ReconciliationError(
+                        f"Rapport non trié par {columns['key']} (ligne {line}) : "
+                        f"triez-le d'abord, par ex. LC_ALL=C sort"
+                    )
+                previous = key
+                try:
+                    amount = Decimal(row[columns['amount']].replace(',', '').strip())
+                except InvalidOperation:
+                    raise ReconciliationError(f"Montant illisible ligne {line}: {row[columns['amount']]!r}")
+                if amount_in_cents:
+                    amount = amount / 100
+                stats['report_rows'] += 1
+                yield key, amount, row[columns['currency']].strip(), row[columns['status']].strip().lower()
+
+    for key, group in groupby(rows(), key=itemgetter(0)):
+        gross = refunded = Decimal('0')
+        currency = status = None
+        for _, amount, row_currency, row_status in group:
+            if amount >= 0:
+                gross += amount
+                currency = currency or row_currency
+                status = status or REPORT_STATUSES.get(row_status)
+            else:
+                refunded -= amount
+        yield ReportEntry(key, gross, refunded, currency, status)
+
+
+def _ordered_by_payment_id(queryset, field):
+    # Même ordre que la comparaison de chaînes Python (octets), quelle que soit la collation
+    if connection.vendor == 'postgresql':
+        return queryset.order_by(Collate(F(field), 'C'))
+    return queryset.order_by(field)
+
+
+def _ledger_rows(payment_model, refund_model, filters, chunk_size):
+    """(payment_id, montant, remboursé, devise, statut) d'une paire de tables, trié par payment_id."""
+    payments = _ordered_by_payment_id(
+        payment_model.objects.filter(payment_id__isnull=False, **filters), 'payment_id'
+    ).values_list('payment_id', 'amount', 'currency', 'status').iterator(chunk_size=chunk_size)
+
+    refund_filters = {f'payment__{name}': value for name, value in filters.items()}
+    refunds = _ordered_by_payment_id(
+        refund_model.objects.filter(payment__payment_id__isnull=False, **refund_filters), 'payment__payment_id'
+    ).values_list('payment__payment_id', 'amount').iterator(chunk_size=chunk_size)
+    refund_totals = (
+        (key, sum((amount for _, amount in group), Decimal('0')))
+        for key, group in groupby(refunds, key=itemgetter(0))
+    )
+
+    for key, payment, refunded in merge_join(payments, refund_totals):
+        if payment is None:
+            continue  # remboursement dont le paiement est hors filtre
+        _, amount, currency, status = payment
+        yield key, amount, refunded[1] if refunded else Decimal('0'), currency, status
+
+
+def read_ledger(filters=None, chunk_size=2000, stats=None):
+    """Parcourt paiements et remboursements, tables chaudes et archive, triés par payment_id, en mémoire constante.
+
+    Un paiement archivé reste dans le grand livre : il n'apparaît pas comme missing_in_db.
+    """
+    filters = filters or {}
+    stats = stats if stats is not None else Counter()
+
+    rows = heapq.merge(
+        _ledger_rows(Payment, PaymentRefund, filters, chunk_size),
+        _ledger_rows(PaymentArchive, PaymentRefundArchive, filters, chunk_size),
+        key=itemgetter(0),
+    )
+    for row in rows:
+        stats['ledger_rows'] += 1
+        yield LedgerEntry(*row)
+
+
+def merge_join(left, right, left_key=itemgetter(0), right_key=itemgetter(0)):
+    """Jointure externe de deux flux triés par clé : produit (clé, gauche|None, droite|None)."""
+    left, right = iter(left), iter(right)
+    l_item, r_item = next(left, None), next(right, None)
+    while l_item is not None or r_item is not None:
+        if r_item is None or (l_item is not None and left_key(l_item) < right_key(r_item)):
+            yield left_key(l_item), l_item, None
+            l_item = next(left, None)
+        elif l_item is None or right_key(r_item) < left_key(l_item):
+            yield right_key(r_item), None, r_item
+            r_item = next(right, None)
+        else:
+            yield left_key(l_item), l_item, r_item
+            l_item, r_item = next(left, None), next(right, None)
+
+
+def reconcile(report_entries, ledger_entries):
+    """Compare rapport et base ; produit un Mismatch par écart constaté."""
+    previous_key = None
+    for key, report, ledger in merge_join(report_entries, ledger_entries):
+        if key == previous_key:
+            yield Mismatch(key, 'duplicate_in_db', None, None)
+            continue
+        previous_key = key
+        if ledger is None:
+            yield Mismatch(key, 'missing_in_db', report.gross, None)
+            continue
+        if report is None:
+            yield Mismatch(key, 'missing_in_report', None, ledger.amount)
+            continue
+        if report.gross != ledger.amount:
+            yield Mismatch(key, 'amount_drift', report.gross, ledger.amount)
+        if report.currency and report.currency != ledger.currency:
+            yield Mismatch(key, 'currency_drift', report.currency, ledger.currency)
+        if report.refunded != ledger.refunded:
+            yield Mismatch(key, 'refund_drift', report.refunded, ledger.refunded)
+        if report.status and report.status != LEDGER_STATUSES.get(ledger.status):
+            yield Mismatch(key, 'status_drift', report.status, ledger.status)
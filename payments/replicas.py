@@ -0,0 +1,178 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Max
+
+from payments import metrics
+from payments.models import Payment
+
+logger = logging.getLogger(__name__)
+
+# Posé après une écriture réussie par ReplicaPinningMiddleware
+PIN_COOKIE = 'payments_primary'
+PREFIX = 'payments:replicas:pin'
+
+replica_lag = metrics.registry.gauge(
+    'payments_db_replica_lag_seconds', "Dernier retard mesuré de chaque réplica de lecture", ('alias',),
+)
+routed_reads = metrics.registry.counter(
+    'payments_db_routed_reads_total',
+    "Lectures routables par alias retenu et motif (replica, pinned, lagging, no_replica)",
+    ('alias', 'reason'),
+)
+
+# Alias des lectures du contexte courant ; None : routage par défaut de Django
+_read_alias = ContextVar('payments_read_alias', default=None)
+
+
+class ReplicaRouter:
+    """Lectures sur l'alias choisi par replica_reads(), écritures toujours sur le primaire.
+
+    Hors de replica_reads(), les lectures restent sur le primaire : les services
+    relisent ce qu'ils viennent d'écrire et ne passent jamais par un réplica.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primaire et réplicas portent les mêmes données
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+def _config():
+    return settings.PAYMENTS_DB_REPLICAS
+
+
+def _shared():
+    return caches['payments']
+
+
+def _measure(alias):
+    """Retard du réplica `alias` en secondes.
+
+    PostgreSQL : âge de la dernière transaction rejouée (0 si tout le WAL reçu est rejoué).
+    Autres moteurs : écart entre le dernier paiement créé sur le primaire et sur le réplica
+    (index created_at), une borne haute du retard.
+    """
+    connection = connections[alias]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+                'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+            )
+            return float(cursor.fetchone()[0] or 0)
+    primary = Payment.objects.using(DEFAULT_DB_ALIAS).aggregate(latest=Max('created_at'))['latest']
+    replica = Payment.objects.using(alias).aggregate(latest=Max('created_at'))['latest']
+    if primary is None or (replica is not None and replica >= primary):
+        return 0.0
+    if replica is None:
+        return float('inf')
+    return (primary - replica).total_seconds()
+
+
+class LagMonitor:
+    """Retard de chaque réplica, mesuré au plus une fois par LAG_CHECK_INTERVAL dans le processus.
+
+    Un réplica injoignable compte comme infiniment en retard jusqu'à la mesure suivante.
+    """
+
+    def __init__(self):
+        self._lags = {}
+        self._lock = threading.Lock()
+
+    def lag(self, alias):
+        with self._lock:
+            entry = self._lags.get(alias)
+        if entry is not None and time.monotonic() - entry[0] < _config()['LAG_CHECK_INTERVAL']:
+            return entry[1]
+        try:
+            lag = _measure(alias)
+        except Exception as e:
+            logger.warning("Réplica %s injoignable: %s", alias, e)
+            lag = float('inf')
+        with self._lock:
+            self._lags[alias] = (time.monotonic(), lag)
+        replica_lag.set(lag, alias=alias)
+        return lag
+
+    def stats(self):
+        with self._lock:
+            return {alias: lag for alias, (_, lag) in self._lags.items()}
+
+
+monitor = LagMonitor()
+
+
+def pin(*pks):
+    """Lit ces paiements sur le primaire pendant PIN_SECONDS (appelé après chaque écriture)."""
+    if _config()['ALIASES'] and pks:
+        _shared().set_many({f'{PREFIX}:{pk}': 1 for pk in pks}, timeout=_config()['PIN_SECONDS'])
+
+
+def is_pinned(pk):
+    return bool(_config()['ALIASES']) and _shared().get(f'{PREFIX}:{pk}') is not None
+
+
+def read_alias(request=None):
+    """Alias des lectures de `request` : un réplica assez à jour, sinon le primaire."""
+    aliases = _config()['ALIASES']
+    if not aliases:
+        alias, reason = DEFAULT_DB_ALIAS, 'no_replica'
+    elif request is not None and PIN_COOKIE in request.COOKIES:
+        alias, reason = DEFAULT_DB_ALIAS, 'pinned'
+    else:
+        fresh = [alias for alias in aliases if monitor.lag(alias) <= _config()['MAX_LAG']]
+        alias, reason = (random.choice(fresh), 'replica') if fresh else (DEFAULT_DB_ALIAS, 'lagging')
+    routed_reads.inc(alias=alias, reason=reason)
+    return alias
+
+
+@contextmanager
+def using(alias):
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def replica_reads(request=None):
+    """Les lectures du bloc vont sur read_alias(request) ; les écritures restent sur le primaire."""
+    return using(read_alias(request))
+
+
+def fresh_read(func, pk=None):
+    """func() sur l'alias de lecture courant, refait sur le primaire si le résultat peut être périmé.
+
+    Sur le primaire directement si le paiement `pk` vient d'être écrit ; après coup si
+    le réplica ne trouve rien (ligne pas encore répliquée).
+    """
+    if _read_alias.get() in (None, DEFAULT_DB_ALIAS):
+        return func()
+    if pk is not None and is_pinned(pk):
+        with using(DEFAULT_DB_ALIAS):
+            return func()
+    result = func()
+    if result is None:
+        with using(DEFAULT_DB_ALIAS):
+            result = func()
+    return result
+
+
+def stats():
+    return {'aliases': _config()['ALIASES'], 'lag': monitor.stats()}
@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from paypalrestsdk import exceptions as sdk_exceptions
+
+from payments.exceptions import PayPalAPIError, PayPalUnavailableError
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Disjoncteur d'une opération PayPal, partagé entre workers via le cache `payments`.
+
+    - fermé : les appels passent, les échecs sont comptés sur une fenêtre glissante ;
+    - ouvert (seuil atteint) : échec immédiat pendant `reset_timeout` secondes ;
+    - demi-ouvert : un seul appel d'essai (cache.add) décide de la réouverture ou de la fermeture.
+    """
+
+    def __init__(self, name, failure_threshold=5, window=30, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.reset_timeout = reset_timeout
+        prefix = f'paypal:breaker:{name}'
+        self.failures_key = f'{prefix}:failures'
+        self.open_key = f'{prefix}:open_until'
+        self.probe_key = f'{prefix}:probe'
+
+    @property
+    def cache(self):
+        return caches['payments']
+
+    def _unavailable(self, retry_after):
+        return PayPalUnavailableError(
+            f"PayPal indisponible ({self.name}), réessayez plus tard",
+            code='paypal_unavailable',
+            params={'operation': self.name, 'retry_after': max(1, math.ceil(retry_after))},
+        )
+
+    def before_call(self):
+        """Lève PayPalUnavailableError si l'appel ne doit pas partir. Renvoie True pour un appel d'essai."""
+        open_until = self.cache.get(self.open_key)
+        if open_until is None:
+            return False
+        remaining = open_until - time.time()
+        if remaining > 0:
+            raise self._unavailable(remaining)
+        if not self.cache.add(self.probe_key, 1, timeout=self.reset_timeout):
+            raise self._unavailable(self.reset_timeout)
+        return True
+
+    def record_success(self, probe=False):
+        if probe:
+            self.cache.delete_many([self.open_key, self.probe_key, self.failures_key])
+            logger.info("Disjoncteur PayPal %s refermé", self.name)
+
+    def record_failure(self, probe=False):
+        self.cache.add(self.failures_key, 0, timeout=self.window)
+        try:
+            failures = self.cache.incr(self.failures_key)
+        except ValueError:  # clé expirée entre add et incr
+            failures = 1
+        if probe or failures >= self.failure_threshold:
+            self.cache.set(self.open_key, time.time() + self.reset_timeout, timeout=self.reset_timeout * 10)
+            self.cache.delete_many([self.probe_key, self.failures_key])
+            logger.warning("Disjoncteur PayPal %s ouvert pour %ds", self.name, self.reset_timeout)
+
+    def state(self):
+        open_until = self.cache.get(self.open_key)
+        if open_until is None:
+            return 'closed'
+        return 'open' if open_until > time.time() else 'half_open'
+
+
+class RetryBudget:
+    """Seau de jetons par processus : chaque appel crédite `ratio`, chaque nouvel essai coûte 1.
+
+    Quand PayPal est en panne, les nouveaux essais restent bornés à ~ratio des appels
+    au lieu de multiplier la charge.
+    """
+
+    def __init__(self, ratio=0.2, minimum=10):
+        self.ratio = ratio
+        self.capacity = max(minimum, 1)
+        self.tokens = float(self.capacity)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+# Connexion jamais établie : la requête n'a pas atteint PayPal, un nouvel essai est sans risque
+CONNECT_ERRORS = (requests.ConnectTimeout, httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def is_transient(error):
+    """Panne côté PayPal ou réseau (compte pour le disjoncteur), par opposition à une erreur métier."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, sdk_exceptions.ServerError)):
+        return True
+    if isinstance(error, (httpx.TransportError, httpx.TimeoutException)):
+        return True
+    if isinstance(error, PayPalAPIError):
+        status = error.params.get('status', 0)
+        return status == 429 or status >= 500
+    response = getattr(error, 'response', None)
+    return isinstance(error, sdk_exceptions.ClientError) and getattr(response, 'status_code', None) == 429
+
+
+def _backoff(attempt):
+    config = settings.PAYPAL_CONFIG
+    delay = min(config['PAYPAL_RETRY_BACKOFF_BASE'] * 2 ** (attempt - 1), config['PAYPAL_RETRY_BACKOFF_MAX'])
+    return random.uniform(0, delay)
+
+
+def _time_limit(operation):
+    # execute tourne sous le verrou de PAYPAL_EXECUTE_LOCK_TIMEOUT : aucun essai ne doit lui survivre
+    if operation == 'execute':
+        return settings.PAYPAL_CONFIG['PAYPAL_EXECUTE_LOCK_TIMEOUT']
+    return None
+
+
+def _read_timeout(operation):
+    config = settings.PAYPAL_CONFIG
+    timeouts = config['PAYPAL_TIMEOUTS'].get(operation)
+    return timeouts[1] if timeouts else config['PAYPAL_TIMEOUT']
+
+
+def _retry_delay(operation, error, attempt, started, idempotent):
+    """Pause avant un nouvel essai, ou None si l'erreur doit remonter.
+
+    Nouvel essai seulement si l'appel est rejouable sans risque (`idempotent`, ou connexion
+    jamais établie), qu'il reste des essais, qu'un essai complet tient dans la limite de
+    temps de l'opération et que le budget le permet.
+    """
+    if not (idempotent or isinstance(error, CONNECT_ERRORS)):
+        return None
+    if attempt >= settings.PAYPAL_CONFIG['PAYPAL_RETRY_MAX_ATTEMPTS']:
+        return None
+    delay = _backoff(attempt)
+    limit = _time_limit(operation)
+    if limit and time.monotonic() - started + delay + _read_timeout(operation) > limit:
+        return None
+    if not get_retry_budget().withdraw():
+        return None
+    return delay
+
+
+def call(operation, func, idempotent=False):
+    """Appelle `func` derrière le disjoncteur de `operation`, avec nouveaux essais bornés (_retry_delay)."""
+    breaker = get_breaker(operation)
+    get_retry_budget().deposit()
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        probe = breaker.before_call()
+        try:
+            result = func()
+        except Exception as e:
+            if not is_transient(e):
+                breaker.record_success(probe)
+                raise
+            breaker.record_failure(probe)
+            delay = _retry_delay(operation, e, attempt, started, idempotent)
+            if delay is None:
+                raise
+            logger.warning("PayPal %s en échec (essai %d), nouvel essai dans %.2fs: %s", operation, attempt, delay, e)
+            time.sleep(delay)
+            continue
+        breaker.record_success(probe)
+        return result
+
+
+async def acall(operation, func, idempotent=False):
+    """Variante asyncio de call() : `func` renvoie une coroutine.
+
+    Même disjoncteur et même budget que les workers sync ; l'état du disjoncteur (cache
+    partagé, I/O bloquante) est lu et écrit hors de la boucle.
+    """
+    breaker = get_breaker(operation)
+    get_retry_budget().deposit()
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        probe = await sync_to_async(breaker.before_call, thread_sensitive=False)()
+        try:
+            result = await func()
+        except Exception as e:
+            if not is_transient(e):
+                if probe:
+                    await sync_to_async(breaker.record_success, thread_sensitive=False)(probe)
+                raise
+            await sync_to_async(breaker.record_failure, thread_sensitive=False)(probe)
+            delay = _retry_delay(operation, e, attempt, started, idempotent)
+            if delay is None:
+                raise
+            logger.warning("PayPal %s en échec (essai %d), nouvel essai dans %.2fs: %s", operation, attempt, delay, e)
+            await asyncio.sleep(delay)
+            continue
+        if probe:
+            await sync_to_async(breaker.record_success, thread_sensitive=False)(probe)
+        return result
+
+
+_breakers = {}
+_retry_budget = None
+_registry_lock = threading.Lock()
+
+
+def get_breaker(operation):
+    breaker = _breakers.get(operation)
+    if breaker is None:
+        config = settings.PAYPAL_CONFIG
+        with _registry_lock:
+            breaker = _breakers.setdefault(operation, CircuitBreaker(
+                operation,
+                failure_threshold=config['PAYPAL_BREAKER_FAILURE_THRESHOLD'],
+                window=config['PAYPAL_BREAKER_WINDOW'],
+                reset_timeout=config['PAYPAL_BREAKER_RESET_TIMEOUT'],
+            ))
+    return breaker
+
+
+def get_retry_budget():
+    global _retry_budget
+    if _retry_budget is None:
+        with _registry_lock:
+            if _retry_budget is None:
+                _retry_budget = RetryBudget(
+                    ratio=settings.PAYPAL_CONFIG['PAYPAL_RETRY_BUDGET_RATIO'],
+                    minimum=settings.PAYPAL_CONFIG['PAYPAL_RETRY_BUDGET_MIN'],
+                )
+    return _retry_budget
+
+
+def stats():
+    return {
+        'breakers': {name: breaker.state() for name, breaker in _breakers.items()},
+        'retry_budget': round(get_retry_budget().tokens, 2),
+    }
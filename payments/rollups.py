@@ -0,0 +1,218 @@
+from collections import defaultdict
+from decimal import Decimal
+from itertools import chain
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from payments import status_cache
+from payments.models import (
+    Payment, PaymentArchive, PaymentDailyRollup, PaymentRefund, PaymentRefundArchive,
+    PaymentRollupDelta,
+)
+
+COUNTERS = ('payment_count', 'amount_total', 'refund_count', 'refunded_total')
+GROUP_FIELDS = ('day', 'currency', 'status')
+# Nom renvoyé par query() -> colonne sommée
+TOTALS = {
+    'payments': 'payment_count',
+    'amount': 'amount_total',
+    'refunds': 'refund_count',
+    'refunded': 'refunded_total',
+}
+
+
+def _new_deltas():
+    return defaultdict(lambda: [0, Decimal('0'), 0, Decimal('0')])
+
+
+def _apply(deltas):
+    """Enregistre les deltas, une ligne PaymentRollupDelta par groupe (insertion seule, aucune ligne verrouillée).
+
+    fold() les reporte ensuite sur PaymentDailyRollup, hors de la transaction du paiement.
+    """
+    rows = [
+        PaymentRollupDelta(day=day, currency=currency, status=status, **dict(zip(COUNTERS, values)))
+        for (day, currency, status), values in sorted(deltas.items())
+        if any(values)
+    ]
+    PaymentRollupDelta.objects.bulk_create(rows)
+
+
+def _add_to_rollups(deltas):
+    """Ajoute les deltas aux lignes concernées par UPDATE ... SET x = x + delta (sans lecture préalable)."""
+    # Ordre fixe : deux transactions concurrentes verrouillent les lignes dans le même ordre
+    for (day, currency, status), values in sorted(deltas.items()):
+        changes = dict(zip(COUNTERS, values))
+        if not any(changes.values()):
+            continue
+        row = PaymentDailyRollup.objects.filter(day=day, currency=currency, status=status)
+        increments = {name: F(name) + value for name, value in changes.items() if value}
+        if row.update(updated_at=timezone.now(), **increments):
+            continue
+        try:
+            with transaction.atomic():
+                PaymentDailyRollup.objects.create(day=day, currency=currency, status=status, **changes)
+        except IntegrityError:
+            # Ligne créée entre-temps par un autre repli
+            row.update(updated_at=timezone.now(), **increments)
+
+
+def _fold_batch(batch_size):
+    pending = PaymentRollupDelta.objects.order_by('id')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        rows = list(pending.values('id', *GROUP_FIELDS, *COUNTERS)[:batch_size])
+        if not rows:
+            return 0
+        if PaymentRollupDelta.objects.filter(pk__in=[row['id'] for row in rows]).delete()[0] != len(rows):
+            # Sans SKIP LOCKED (SQLite) : lot déjà replié par un autre processus
+            transaction.set_rollback(True)
+            return 0
+        totals = _new_deltas()
+        for row in rows:
+            bucket = totals[row['day'], row['currency'], row['status']]
+            for index, name in enumerate(COUNTERS):
+                bucket[index] += row[name]
+        _add_to_rollups(totals)
+    return len(rows)
+
+
+def fold(batch_size=None):
+    """Reporte les deltas en attente sur PaymentDailyRollup, par lots ; renvoie le nombre de deltas repliés.
+
+    Appelé par le worker (run_payment_worker) et `manage.py fold_rollups`.
+    """
+    batch_size = batch_size or settings.PAYMENTS_ROLLUPS['FOLD_BATCH_SIZE']
+    folded = 0
+    while True:
+        count = _fold_batch(batch_size)
+        folded += count
+        if count < batch_size:
+            return folded
+
+
+def record_payments(payments):
+    """Compte des paiements nouvellement enregistrés."""
+    deltas = _new_deltas()
+    for payment in payments:
+        bucket = deltas[timezone.localdate(payment.created_at), payment.currency, payment.status]
+        bucket[0] += 1
+        bucket[1] += payment.amount
+    _apply(deltas)
+
+
+def record_status_changes(changes):
+    """Déplace des paiements d'un statut à l'autre ; `changes` : [(paiement, ancien statut)]."""
+    deltas = _new_deltas()
+    for payment, previous_status in changes:
+        if previous_status == payment.status:
+            continue
+        day = timezone.localdate(payment.created_at)
+        before = deltas[day, payment.currency, previous_status]
+        before[0] -= 1
+        before[1] -= payment.amount
+        after = deltas[day, payment.currency, payment.status]
+        after[0] += 1
+        after[1] += payment.amount
+    _apply(deltas)
+
+
+def record_status_change(payment, previous_status):
+    record_status_changes([(payment, previous_status)])
+
+
+def save_payment(payment, previous_status=None, update_fields=None):
+    """Enregistre le paiement et ses agrégats dans la même transaction.
+
+    `previous_status` à None : paiement nouveau, compté tel quel.
+    """
+    with transaction.atomic():
+        if previous_status is None:
+            payment.save(force_insert=True)
+            record_payments([payment])
+        else:
+            payment.save(update_fields=update_fields)
+            record_status_change(payment, previous_status)
+            status_cache.invalidate(payment.pk)
+
+
+def record_refunds(refunds):
+    """Compte des remboursements nouvellement enregistrés (paiement déjà chargé sur chacun)."""
+    deltas = _new_deltas()
+    for refund in refunds:
+        bucket = deltas[timezone.localdate(refund.created_at), refund.payment.currency, refund.status]
+        bucket[2] += 1
+        bucket[3] += Decimal(str(refund.amount))
+    _apply(deltas)
+
+
+def rebuild(since=None, until=None):
+    """Recalcule les agrégats pour [since, until[ (dates), tables d'archive comprises.
+
+    Renvoie le nombre de lignes écrites.
+    """
+    day_filters = {}
+    if since:
+        day_filters['day__gte'] = since
+    if until:
+        day_filters['day__lt'] = until
+
+    payments = [
+        model.objects.annotate(day=TruncDate('created_at'))
+        .filter(**day_filters)
+        .values('day', 'currency', 'status')
+        .annotate(count=Count('id'), total=Sum('amount'))
+        .order_by()
+        for model in (Payment, PaymentArchive)
+    ]
+    refunds = [
+        model.objects.annotate(day=TruncDate('created_at'))
+        .filter(**day_filters)
+        .values('day', 'payment__currency', 'status')
+        .annotate(count=Count('id'), total=Sum('amount'))
+        .order_by()
+        for model in (PaymentRefund, PaymentRefundArchive)
+    ]
+
+    with transaction.atomic():
+        totals = _new_deltas()
+        for row in chain(*payments):
+            bucket = totals[row['day'], row['currency'], row['status']]
+            bucket[0] += row['count']
+            bucket[1] += row['total']
+        for row in chain(*refunds):
+            bucket = totals[row['day'], row['payment__currency'], row['status']]
+            bucket[2] += row['count']
+            bucket[3] += row['total']
+
+        # Les deltas en attente sont déjà comptés dans les tables sources
+        PaymentRollupDelta.objects.filter(**day_filters).delete()
+        PaymentDailyRollup.objects.filter(**day_filters).delete()
+        PaymentDailyRollup.objects.bulk_create(
+            [
+                PaymentDailyRollup(day=day, currency=currency, status=status, **dict(zip(COUNTERS, values)))
+                for (day, currency, status), values in sorted(totals.items())
+            ],
+            batch_size=1000,
+        )
+    return len(totals)
+
+
+def query(filters=None, group_by=GROUP_FIELDS):
+    """Somme les agrégats par `group_by` (sous-ensemble de day, currency, status), deltas non repliés compris."""
+    sums = {name: Sum(field) for name, field in TOTALS.items()}
+    results = {}
+    for model in (PaymentDailyRollup, PaymentRollupDelta):
+        rows = model.objects.filter(**(filters or {}))
+        rows = rows.values(*group_by).annotate(**sums).order_by() if group_by else [rows.aggregate(**sums)]
+        for row in rows:
+            key = tuple(row[field] for field in group_by)
+            result = results.setdefault(key, {**dict(zip(group_by, key)), **dict.fromkeys(TOTALS, 0)})
+            for name in TOTALS:
+                result[name] += row[name] or 0
+    return [results[key] for key in sorted(results)]
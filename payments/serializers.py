@@ -1,14 +1,47 @@
 from rest_framework import serializers
-from payments.models import Payment, PaymentRefund
+from payments.models import Payment, PaymentArchive, PaymentJob, PaymentRefund
 
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = '__all__'
-        read_only_fields = ('payment_id', 'status', 'payer_email', 'payer_id')
+        read_only_fields = (
+            'payment_id', 'merchant', 'status', 'refunded_amount', 'payer_email', 'payer_id',
+            'sale_id', 'sale_state', 'captured_amount', 'transaction_fee', 'paypal_snapshot',
+        )
+
+class PaymentArchiveSerializer(serializers.ModelSerializer):
+    """Paiement archivé, sous la forme de PaymentSerializer (sans paypal_snapshot, avec archived_at)."""
+    class Meta:
+        model = PaymentArchive
+        fields = '__all__'
+        read_only_fields = [field.name for field in PaymentArchive._meta.concrete_fields]
+
+class PaymentListSerializer(serializers.ModelSerializer):
+    """Représentation compacte pour la liste : pas de colonnes texte (description, erreurs)."""
+    class Meta:
+        model = Payment
+        fields = ('id', 'payment_id', 'amount', 'currency', 'status', 'created_at')
+        read_only_fields = fields
 
 class PaymentRefundSerializer(serializers.ModelSerializer):
     class Meta:
         model = PaymentRefund
         fields = '__all__'
-        read_only_fields = ('refund_id', 'status')
\ No newline at end of file
+        read_only_fields = ('refund_id', 'status')
+
+class PaymentJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PaymentJob
+        fields = ('id', 'kind', 'status', 'attempts', 'run_at', 'result', 'error_message', 'created_at', 'updated_at')
+        read_only_fields = fields
+
+class PaymentRollupSerializer(serializers.Serializer):
+    """Ligne d'agrégats ; les champs de regroupement absents de `group_by` sont omis."""
+    day = serializers.DateField(required=False)
+    currency = serializers.CharField(required=False)
+    status = serializers.CharField(required=False)
+    payments = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    refunds = serializers.IntegerField()
+    refunded = serializers.DecimalField(max_digits=14, decimal_places=2)
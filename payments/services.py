@@ -1,190 +1,377 @@
 import logging
 import paypalrestsdk
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.conf import settings
+from django.db import transaction
 from decimal import Decimal
-from payments.models import Payment, PaymentRefund
-from payments.exceptions import PaymentError, PaymentValidationError, PaymentProcessError, RefundError
+from payments import events, ledger, merchants, metrics, rollups, status_cache
+from payments.events import Event
+from payments.models import Payment
+from payments.serializers import PaymentSerializer
+from payments.exceptions import (
+    PaymentError, PaymentValidationError, PaymentProcessError, PayPalUnavailableError, RefundError
+)
+from payments.singleflight import SingleFlight
+from payments.transport import paypal_operation
 
 logger = logging.getLogger(__name__)
 
-class PaymentService:
-    def __init__(self):
-        self._configure_paypal()
-    
-    def _configure_paypal(self):
-        paypalrestsdk.configure({
-            'mode': settings.PAYPAL_CONFIG['PAYPAL_MODE'],
-            'client_id': settings.PAYPAL_CONFIG['PAYPAL_CLIENT_ID'],
-            'client_secret': settings.PAYPAL_CONFIG['PAYPAL_CLIENT_SECRET'],
-        })
-    
+# Champs copiés depuis la ressource PayPal exécutée
+SALE_FIELDS = ['sale_id', 'sale_state', 'captured_amount', 'transaction_fee', 'paypal_snapshot']
+SNAPSHOT_KEYS = ('id', 'state', 'intent', 'create_time', 'update_time')
+SNAPSHOT_SALE_KEYS = ('id', 'state', 'amount', 'transaction_fee', 'create_time', 'update_time')
+EXECUTED_STATUSES = (Payment.Status.COMPLETED, Payment.Status.PARTIALLY_REFUNDED, Payment.Status.REFUNDED)
+
+
+def _money(value):
+    return Decimal(str(value)) if value not in (None, '') else None
+
+
+def already_executed(db_payment, payer_id):
+    if db_payment.status not in EXECUTED_STATUSES:
+        return False
+    # Un autre payer_id ferait échouer l'execute chez PayPal et passer le paiement en FAILED
+    check_payer(db_payment.payer_id, payer_id)
+    return True
+
+
+def check_payer(executed_payer_id, payer_id):
+    # Payeur inconnu (COMPLETED posé par webhook ou balayage après un timeout) : rien à comparer,
+    # la relance de l'acheteur doit recevoir le paiement exécuté
+    if executed_payer_id is not None and executed_payer_id != payer_id:
+        raise PaymentValidationError("Paiement déjà exécuté pour un autre payeur", code='payer_mismatch')
+
+
+def executed_result(db_payment):
+    # Mémorisé par le single-flight et partagé entre appelants : des données, pas l'instance du modèle
+    return dict(PaymentSerializer(db_payment).data)
+
+
+_execute_flight = None
+
+
+def execute_flight():
+    global _execute_flight
+    if _execute_flight is None:
+        config = settings.PAYPAL_CONFIG
+        _execute_flight = SingleFlight(
+            'execute',
+            lock_timeout=config['PAYPAL_EXECUTE_LOCK_TIMEOUT'],
+            memo_timeout=config['PAYPAL_EXECUTE_MEMO_TIMEOUT'],
+        )
+    return _execute_flight
+
+
+class BasePaymentService:
     def _validate_payment(self, amount):
         if amount <= 0:
             raise PaymentValidationError(
                 "Le montant du paiement doit être supérieur à 0",
                 code='invalid_amount'
             )
-    
-    
-    def create_payment(self,amount,description,return_url,cancel_url):
-        try:
-            self._validate_payment(amount)
-            
-            payment_data = {
-                'intent': 'sale',
-                'payment_method': 'paypal',
-                'transactions': [{
-                    'amount': {
-                        'total': str(amount),
-                        'currency': settings.PAYPAL_CONFIG['PAYPAL_CURRENCY'],
-                    },
-                    'description': description,
-                }],
-                'redirect_urls': {
-                    'return_url':  settings.PAYPAL_CONFIG['PAYPAL_SUCCESS_URL'],    
-                    'cancel_url':  settings.PAYPAL_CONFIG['PAYPAL_CANCEL_URL'],
+
+    def _build_payment_data(self, amount, description, merchant=None):
+        return {
+            'intent': 'sale',
+            'payment_method': 'paypal',
+            'transactions': [{
+                'amount': {
+                    'total': str(amount),
+                    'currency': merchants.currency(merchant),
                 },
-            }
-            logger.debug(f"PayPal payment data: {payment_data}")
-            payment = paypalrestsdk.Payment(payment_data)
-            if not payment.create():
-                logger.error(f"Erreur création PayPal: {payment.error}")
-                raise PaymentProcessError(
-                    f"Erreur lors de la création du paiement PayPal: {payment.error}",
-                    code='payment_creation_failed'
-                )
-            
-            logger.info(f"Paiement PayPal créé: {payment.id}")
-            logger.debug(f"Payment response: {payment}")
-            
-            db_payment = Payment.objects.create(
-                payment_id=payment.id,
-                amount=Decimal(str(amount)),
-                currency=settings.PAYPAL_CONFIG['PAYPAL_CURRENCY'],
-                description=description
+                'description': description,
+            }],
+            'redirect_urls': {
+                'return_url':  settings.PAYPAL_CONFIG['PAYPAL_SUCCESS_URL'],    
+                'cancel_url':  settings.PAYPAL_CONFIG['PAYPAL_CANCEL_URL'],
+            },
+        }
+
+    def _apply_sale_details(self, db_payment, resource):
+        """Copie la vente (sale) de la ressource PayPal et un instantané compact sur le paiement."""
+        try:
+            sale = resource['transactions'][0]['related_resources'][0]['sale']
+        except (KeyError, IndexError, TypeError):
+            sale = {}
+        db_payment.sale_id = sale.get('id') or db_payment.sale_id
+        db_payment.sale_state = sale.get('state')
+        db_payment.captured_amount = _money(sale.get('amount', {}).get('total'))
+        db_payment.transaction_fee = _money(sale.get('transaction_fee', {}).get('value'))
+        snapshot = {key: resource[key] for key in SNAPSHOT_KEYS if key in resource}
+        snapshot['payer_id'] = resource.get('payer', {}).get('payer_info', {}).get('payer_id')
+        snapshot['sale'] = {key: sale[key] for key in SNAPSHOT_SALE_KEYS if key in sale}
+        db_payment.paypal_snapshot = snapshot
+
+
+class PaymentService(BasePaymentService):
+    # Une Api par marchand (pool LRU de payments.merchants) : pas de paypalrestsdk.configure() global
+    def _api(self, merchant=None):
+        return merchants.get_api(merchant)
+
+    def _create_paypal_payment(self, amount, description, merchant=None, request_id=None):
+        """Crée le paiement chez PayPal ; renvoie la ressource et l'URL d'approbation.
+
+        `request_id` : PayPal-Request-Id stable entre essais, PayPal renvoie alors le même paiement.
+        """
+        payment_data = self._build_payment_data(amount, description, merchant)
+        events.emit(Event.PAYPAL_REQUEST, logging.DEBUG, operation='create', body=payment_data)
+        payment = paypalrestsdk.Payment(payment_data, api=self._api(merchant))
+        if request_id:
+            payment.request_id = request_id
+        with paypal_operation('create'):
+            created = payment.create()
+        if not created:
+            logger.error("Erreur création PayPal: %s", payment.error)
+            raise PaymentProcessError(
+                f"Erreur lors de la création du paiement PayPal: {payment.error}",
+                code='payment_creation_failed'
             )
-            
-            # Trouver l'URL d'approbation
-            approval_url = None
-            for link in payment.links:
-                logger.debug(f"Payment link: {link}")
-                if link.rel == "approval_url":
-                    approval_url = link.href
-                    break
 
-            if not approval_url:
-                raise PaymentProcessError("URL d'approbation non trouvée")
+        logger.info("Paiement PayPal créé: %s", payment.id)
+        events.emit(Event.PAYPAL_RESPONSE, logging.DEBUG, operation='create', body=payment.to_dict)
 
+        # Trouver l'URL d'approbation
+        approval_url = next((link.href for link in payment.links if link.rel == 'approval_url'), None)
+        if not approval_url:
+            raise PaymentProcessError("URL d'approbation non trouvée")
+        return payment, approval_url
+
+    def _build_db_payment(self, paypal_payment, amount, description, merchant=None):
+        return Payment(
+            payment_id=paypal_payment.id,
+            merchant=merchant,
+            amount=Decimal(str(amount)),
+            currency=merchants.currency(merchant),
+            description=description
+        )
+
+    @metrics.instrument('create_payment')
+    def create_payment(self,amount,description,return_url,cancel_url,merchant=None,request_id=None):
+        try:
+            self._validate_payment(amount)
+            
+            payment, approval_url = self._create_paypal_payment(amount, description, merchant, request_id)
+            # Nouvel essai d'un job : PayPal a pu renvoyer un paiement déjà enregistré
+            db_payment = Payment.objects.filter(payment_id=payment.id).first() if request_id else None
+            if db_payment is None:
+                db_payment = self._build_db_payment(payment, amount, description, merchant)
+                rollups.save_payment(db_payment)
+                events.payment_created(db_payment)
             
             return {
                 'id': str(db_payment.id),
-                'payment_id': db_payment.id,
-                'approval_url': next(link.href for link in payment.links if link.rel == 'approval_url')
+                'payment_id': db_payment.payment_id,
+                'approval_url': approval_url
             }
         except PaymentValidationError as e:
-            logging.error(f"Erreur de validation du paiement: {str(e)}")
+            logger.error("Erreur de validation du paiement: %s", e)
+            raise
+        except PayPalUnavailableError:
+            raise
         
         except Exception as e:
-            logging.error(f"Erreur lors de la création du paiement: {str(e)}")
+            logger.error("Erreur lors de la création du paiement: %s", e)
             raise PaymentProcessError("Erreur lors de la création du paiement")
         
     
     
+    @metrics.instrument('create_payments_batch')
+    def create_payments_batch(self, specs, max_concurrency=None, merchant=None):
+        """Crée plusieurs paiements : appels PayPal en parallèle (bornés), un seul bulk_create.
+
+        `specs` est une liste de dicts {'amount', 'description'}, tous pour `merchant`.
+        Renvoie un résultat par élément, dans l'ordre, avec `status` 'created' ou 'failed'.
+        """
+        max_concurrency = max_concurrency or settings.PAYPAL_CONFIG['PAYPAL_BATCH_CONCURRENCY']
+        results = [None] * len(specs)
+        pending = []
+        for index, spec in enumerate(specs):
+            try:
+                amount = Decimal(str(spec.get('amount')))
+                self._validate_payment(amount)
+            except PaymentValidationError as e:
+                results[index] = {'index': index, 'status': 'failed', 'error': str(e)}
+                continue
+            except (ArithmeticError, ValueError):
+                results[index] = {'index': index, 'status': 'failed', 'error': 'Montant invalide'}
+                continue
+            pending.append((index, amount, spec.get('description', '')))
+
+        created = []
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(pending))) as executor:
+                futures = {
+                    executor.submit(self._create_paypal_payment, amount, description, merchant):
+                        (index, amount, description)
+                    for index, amount, description in pending
+                }
+                for future in as_completed(futures):
+                    index, amount, description = futures[future]
+                    try:
+                        paypal_payment, approval_url = future.result()
+                    except Exception as e:
+                        logger.error("Erreur création PayPal (lot, élément %d): %s", index, e)
+                        results[index] = {'index': index, 'status': 'failed', 'error': str(e)}
+                        continue
+                    created.append(
+                        (index, self._build_db_payment(paypal_payment, amount, description, merchant), approval_url)
+                    )
+
+        # Les paiements PayPal existent déjà : on les enregistre tous d'un coup
+        with transaction.atomic():
+            db_payments = Payment.objects.bulk_create([db_payment for _, db_payment, _ in created])
+            rollups.record_payments(db_payments)
+        for db_payment in db_payments:
+            events.payment_created(db_payment)
+        for index, db_payment, approval_url in created:
+            results[index] = {
+                'index': index,
+                'status': 'created',
+                'id': str(db_payment.id),
+                'payment_id': db_payment.payment_id,
+                'approval_url': approval_url,
+            }
+        return results
+    
+    
+    @metrics.instrument('execute_payment')
     def execute_payment(self, payment_id,payer_id):
+        # Vérifier les paramètres
+        if not payment_id or not payer_id:
+            raise PaymentValidationError("PayPal Payment ID et Payer ID sont requis")
+        # Retours PayPal et relances du frontend simultanés : un seul execute chez PayPal.
+        # Clé sur le seul payment_id : un appel avec un autre payer_id reçoit le résultat en vol et est refusé
+        result = execute_flight().do(
+            payment_id, lambda: executed_result(self._execute_payment(payment_id, payer_id))
+        )
+        check_payer(result['payer_id'], payer_id)
+        return result
+
+    def _execute_payment(self, payment_id, payer_id):
         try:
-            logger.info(f"Début exécution paiement - PayPal ID: {payment_id}, Payer ID: {payer_id}")
-            
-              # Vérifier les paramètres
-            if not payment_id or not payer_id:
-                raise PaymentValidationError("PayPal Payment ID et Payer ID sont requis")
+            logger.info("Début exécution paiement - PayPal ID: %s, Payer ID: %s", payment_id, payer_id)
 
             # Trouver le paiement dans notre base
-            db_payment = Payment.objects.filter(payment_id=payment_id).first()
+            db_payment = Payment.objects.filter(payment_id=payment_id).select_related('merchant').first()
             if not db_payment:
-                logger.error(f"Paiement non trouvé en base: {payment_id}")
+                logger.error("Paiement non trouvé en base: %s", payment_id)
                 raise PaymentError("Paiement non trouvé")
+            if already_executed(db_payment, payer_id):
+                # Mémo expiré : PayPal répondrait PAYMENT_ALREADY_DONE et le paiement passerait en échec
+                return db_payment
 
-            # Récupérer le paiement PayPal
-            try:
-                payment = paypalrestsdk.Payment.find(payment_id)
-                logger.debug(f"Payment trouvé sur PayPal: {payment}")
-            except Exception as e:
-                logger.error(f"Erreur recherche paiement PayPal: {str(e)}")
-                raise PaymentError("Paiement PayPal introuvable")
+            # Pas de Payment.find : l'exécution n'a besoin que de l'identifiant PayPal
+            payment = paypalrestsdk.Payment({'id': payment_id}, api=self._api(db_payment.merchant))
 
             # Exécuter le paiement
             execute_data = {"payer_id": payer_id}
-            logger.debug(f"Executing payment with data: {execute_data}")
+            events.emit(
+                Event.PAYPAL_REQUEST, logging.DEBUG, operation='execute', payment_id=payment_id, body=execute_data
+            )
             
-            if not payment.execute(execute_data):
-                logger.error(f"Échec exécution: {payment.error}")
-                db_payment.status = Payment.PaymentStatus.FAILED
+            with paypal_operation('execute'):
+                executed = payment.execute(execute_data)
+            if not executed:
+                logger.error("Échec exécution: %s", payment.error)
+                previous_status = db_payment.status
+                db_payment.status = Payment.Status.FAILED
                 db_payment.error_message = str(payment.error)
-                db_payment.save()
+                rollups.save_payment(
+                    db_payment, previous_status, update_fields=['status', 'error_message', 'updated_at']
+                )
+                events.payment_failed(db_payment, stage='execute')
                 raise PaymentProcessError(f"Échec de l'exécution: {payment.error}")
 
             
             
             try:
                 payer_info = payment.payer.payer_info
-                logger.debug(f"Payer info: {payer_info}")
+                events.emit(Event.PAYPAL_RESPONSE, logging.DEBUG, operation='execute', body=payment.to_dict)
+                previous_status = db_payment.status
                 db_payment.status = Payment.Status.COMPLETED
                 db_payment.payer_id = payer_id
                 if hasattr(payer_info, 'email'):
                     db_payment.payer_email = payer_info.email
-                db_payment.save()
-                logger.info(f"Paiement exécuté avec succès: {payment_id}")
+                # Le remboursement n'aura plus besoin de relire le paiement chez PayPal
+                self._apply_sale_details(db_payment, payment.to_dict())
+                rollups.save_payment(
+                    db_payment, previous_status,
+                    update_fields=['status', 'payer_id', 'payer_email', 'updated_at'] + SALE_FIELDS
+                )
+                events.payment_executed(db_payment)
+                logger.info("Paiement exécuté avec succès: %s", payment_id)
                 
             except AttributeError as e:
-                logger.error(f"Erreur lors de l'accès aux informations du payeur: {str(e)}")
+                logger.error("Erreur lors de l'accès aux informations du payeur: %s", e)
                 
             return db_payment
         except Payment.DoesNotExist:
             raise PaymentError("Paiement introuvable")
+        except (PayPalUnavailableError, PaymentValidationError):
+            raise
         
         
         except Exception as e:
-            logging.error(f"Erreur lors de l'exécution du paiement: {str(e)}")
+            logger.error("Erreur lors de l'exécution du paiement: %s", e)
             raise PaymentProcessError("Erreur lors de l'exécution du paiement")
     
     
-    def refund_payment(self,payment_id,amount=None,reason=None):
+    def _backfill_sale(self, db_payment):
+        # Paiement exécuté avant l'enregistrement du sale_id : une seule relecture, mémorisée
+        with paypal_operation('lookup'):
+            paypal_payment = paypalrestsdk.Payment.find(db_payment.payment_id, api=self._api(db_payment.merchant))
+        self._apply_sale_details(db_payment, paypal_payment.to_dict())
+        if not db_payment.sale_id:
+            raise RefundError("Vente PayPal introuvable pour ce paiement", code='sale_not_found')
+        db_payment.save(update_fields=SALE_FIELDS + ['updated_at'])
+        status_cache.invalidate(db_payment.pk)
+
+    @metrics.instrument('refund_payment')
+    def refund_payment(self,payment_id,amount=None,reason=None,request_id=None):
         try:
-            db_payment = Payment.objects.get(payment_id=payment_id)
-            if db_payment.status != Payment.Status.COMPLETED:
+            db_payment = Payment.objects.select_related('merchant').get(payment_id=payment_id)
+            if db_payment.status not in ledger.REFUNDABLE_STATUSES:
                 raise RefundError("Impossible de rembourser un paiement non complété")
             
-            paypal_payment = paypalrestsdk.Payment.find(payment_id=payment_id)
-            sale_id = paypal_payment.transactions[0].related_resources[0].sale.id
-            sale = paypalrestsdk.Sale.find(sale_id)
-            
+            # sale_id enregistré à l'exécution (ou par webhook) : appel direct au remboursement
+            if not db_payment.sale_id:
+                self._backfill_sale(db_payment)
+            sale = paypalrestsdk.Sale({'id': db_payment.sale_id}, api=self._api(db_payment.merchant))
+            if request_id:
+                sale.request_id = request_id
+
+            # Réservé avant l'appel PayPal : les remboursements concurrents ne peuvent pas dépasser le total
+            amount = ledger.reserve(db_payment, amount)
             refund_data = {
                 'amount': {
-                    'total': str(amount) if amount else str(db_payment.amount),
+                    'total': str(amount),
                     'currency': db_payment.currency
                 }
             }
             
-            refund = sale.refund(refund_data)
+            try:
+                with paypal_operation('refund'):
+                    refund = sale.refund(refund_data)
+            except Exception:
+                ledger.release(db_payment, amount)
+                raise
             if not refund.success():
+                ledger.release(db_payment, amount)
                 raise RefundError(
                     f"Erreur lors du remboursement du paiement PayPal: {refund.error}",
                     code='refund_failed'
                 )
             
-            refund_record = PaymentRefund.objects.create(
-                payment=db_payment,
-                amount=refund.amount.total,
-                reason=reason
-            )
-            
-            payment.status = Payment.Status.REFUNDED
-            payment.save()
+            refund_record = ledger.record(db_payment, amount, refund.id, reason)
+            events.payment_refunded(db_payment, refund_record)
             return refund_record
         
         
         except Payment.DoesNotExist:
             raise RefundError("Paiement introuvable")
+        except (RefundError, PayPalUnavailableError) as e:
+            logger.error("Erreur lors du remboursement du paiement: %s", e)
+            raise
         except Exception as e:
-            logging.error(f"Erreur lors du remboursement du paiement: {str(e)}")
+            logger.error("Erreur lors du remboursement du paiement: %s", e)
             raise RefundError("Erreur lors du remboursement du paiement")
\ No newline at end of file
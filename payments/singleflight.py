@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+
+from payments import metrics
+
+calls = metrics.registry.counter(
+    'payments_singleflight_calls_total',
+    "Appels regroupés : leader (exécuté), shared (résultat d'un appel en vol), memo (résultat mémorisé)",
+    ('name', 'result'),
+)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Un seul appel en vol par clé, dans le processus et entre workers.
+
+    - dans le processus : les appelants concurrents attendent l'appel du premier et
+      reçoivent le même résultat (ou la même exception) ;
+    - entre workers : verrou `cache.add` dans le cache `payments`, comme le TokenManager ;
+      les autres workers attendent la fin de l'appel et lisent le mémo ;
+    - le résultat reste mémorisé `memo_timeout` secondes pour les retardataires ;
+      une erreur n'est pas mémorisée, l'appel suivant réessaie.
+    """
+
+    WAIT_INTERVAL = 0.05
+
+    def __init__(self, name, lock_timeout=60, memo_timeout=60):
+        self.name = name
+        self.lock_timeout = lock_timeout
+        self.memo_timeout = memo_timeout
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches['payments']
+
+    def _keys(self, key):
+        prefix = f'singleflight:{self.name}:{key}'
+        return f'{prefix}:lock', f'{prefix}:memo'
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            calls.inc(name=self.name, result='shared')
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._do_shared(key, func)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_shared(self, key, func):
+        lock_key, memo_key = self._keys(key)
+        while True:
+            memo = self.cache.get(memo_key)
+            if memo is not None:
+                calls.inc(name=self.name, result='memo')
+                return memo
+            if self.cache.add(lock_key, 1, timeout=self.lock_timeout):
+                try:
+                    return self._lead(memo_key, func)
+                finally:
+                    self.cache.delete(lock_key)
+            # Un autre worker exécute : on attend son mémo ou la libération du verrou
+            deadline = time.monotonic() + self.lock_timeout
+            while self.cache.get(lock_key) is not None and time.monotonic() < deadline:
+                time.sleep(self.WAIT_INTERVAL)
+
+    def _lead(self, memo_key, func):
+        # Le verrou a pu être libéré entre notre lecture du mémo et cache.add
+        memo = self.cache.get(memo_key)
+        if memo is not None:
+            calls.inc(name=self.name, result='memo')
+            return memo
+        calls.inc(name=self.name, result='leader')
+        result = func()
+        self.cache.set(memo_key, result, timeout=self.memo_timeout)
+        return result
+
+    async def ado(self, key, func):
+        """Variante asyncio : `func` est une fonction coroutine ; le cache est lu hors de la boucle."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            future = self._async_calls.get((loop, key))
+            leader = future is None
+            if leader:
+                future = self._async_calls[(loop, key)] = loop.create_future()
+        if not leader:
+            calls.inc(name=self.name, result='shared')
+            return await asyncio.shield(future)
+        try:
+            result = await self._ado_shared(key, func)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # marquée comme lue s'il n'y a aucun autre appelant
+            raise
+        finally:
+            with self._lock:
+                del self._async_calls[(loop, key)]
+
+    async def _ado_shared(self, key, func):
+        lock_key, memo_key = self._keys(key)
+        cache_get = sync_to_async(self.cache.get, thread_sensitive=False)
+        while True:
+            memo = await cache_get(memo_key)
+            if memo is not None:
+                calls.inc(name=self.name, result='memo')
+                return memo
+            if await sync_to_async(self.cache.add, thread_sensitive=False)(lock_key, 1, timeout=self.lock_timeout):
+                try:
+                    memo = await cache_get(memo_key)
+                    if memo is not None:
+                        calls.inc(name=self.name, result='memo')
+                        return memo
+                    calls.inc(name=self.name, result='leader')
+                    result = await func()
+                    await sync_to_async(self.cache.set, thread_sensitive=False)(
+                        memo_key, result, timeout=self.memo_timeout
+                    )
+                    return result
+                finally:
+                    await sync_to_async(self.cache.delete, thread_sensitive=False)(lock_key)
+            deadline = time.monotonic() + self.lock_timeout
+            while await cache_get(lock_key) is not None and time.monotonic() < deadline:
+                await asyncio.sleep(self.WAIT_INTERVAL)
@@ -0,0 +1,212 @@
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from payments import metrics, replicas, subscriptions
+from payments.models import Payment, PaymentArchive
+from payments.serializers import PaymentArchiveSerializer, PaymentSerializer
+
+PREFIX = 'payments:status'
+
+cache_requests = metrics.registry.counter(
+    'payments_status_cache_requests_total', "Lectures de paiement par niveau servi (local, shared, database)",
+    ('result',),
+)
+cache_invalidations = metrics.registry.counter(
+    'payments_status_cache_invalidations_total', "Invalidations du cache de paiements", (),
+)
+
+
+class LocalLRU:
+    """LRU borné du processus : pk -> (version, représentation)."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_local = None
+_aliases = None
+_stats = {'local': 0, 'shared': 0, 'database': 0, 'invalidations': 0}
+_local_lock = threading.Lock()
+
+
+def _config():
+    return settings.PAYMENTS_STATUS_CACHE
+
+
+def _shared():
+    return caches[_config()['CACHE_ALIAS']]
+
+
+def _lrus():
+    global _local, _aliases
+    if _local is None:
+        with _local_lock:
+            if _local is None:
+                max_entries = _config()['LOCAL_MAX_ENTRIES']
+                _aliases = LocalLRU(max_entries)
+                _local = LocalLRU(max_entries)
+    return _local, _aliases
+
+
+def _count(result):
+    _stats[result] += 1
+    cache_requests.inc(result=result)
+
+
+def _version_key(pk):
+    return f'{PREFIX}:{pk}:version'
+
+
+def _current_version(pk):
+    """Jeton de version courant du paiement, créé au premier accès.
+
+    Un jeton aléatoire plutôt qu'un compteur : deux écritures concurrentes ne peuvent pas
+    retomber sur une version déjà lue, et une clé de version expirée ou évincée ne
+    ressuscite rien. D'où une durée de vie bornée (KEY_TIMEOUT) sans risque.
+    """
+    shared = _shared()
+    key = _version_key(pk)
+    version = shared.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not shared.add(key, version, timeout=_config()['KEY_TIMEOUT']):
+            version = shared.get(key, version)
+    return version
+
+
+def _as_uuid(key):
+    try:
+        return uuid.UUID(str(key))
+    except ValueError:
+        return None
+
+
+def _resolve_pk(key):
+    """pk (UUID) ou payment_id PayPal -> pk ; la correspondance ne change jamais."""
+    pk = _as_uuid(key)
+    if pk is not None:
+        return pk
+    _, aliases = _lrus()
+    pk = aliases.get(key)
+    if pk is not None:
+        return pk
+    alias_key = f'{PREFIX}:paypal:{key}'
+    pk = _shared().get(alias_key)
+    if pk is None:
+        pk = replicas.fresh_read(lambda: (
+            Payment.objects.filter(payment_id=key).values_list('pk', flat=True).first()
+            or PaymentArchive.objects.filter(payment_id=key).values_list('pk', flat=True).first()
+        ))
+        if pk is None:
+            return None
+        _shared().set(alias_key, pk, timeout=_config()['KEY_TIMEOUT'])
+    aliases.set(key, pk)
+    return pk
+
+
+def _load(**lookup):
+    """Paiement courant, sinon archivé (manage.py archive_payments), sérialisé ; None si inconnu."""
+    payment = Payment.objects.filter(**lookup).first()
+    if payment is not None:
+        return PaymentSerializer(payment).data
+    archived = PaymentArchive.objects.filter(**lookup).first()
+    return PaymentArchiveSerializer(archived).data if archived is not None else None
+
+
+def get_payment(key):
+    """Représentation sérialisée d'un paiement, par pk ou payment_id PayPal ; None si inconnu.
+
+    LRU du processus, puis cache partagé, puis base (table courante, puis archive).
+    La version lue avant la base est celle sous laquelle on publie : une écriture
+    entre-temps change la version et la représentation périmée n'est jamais resservie.
+    """
+    if not _config()['ENABLED']:
+        pk = _as_uuid(key)
+        return replicas.fresh_read(lambda: _load(**({'pk': pk} if pk else {'payment_id': key})), pk=pk)
+
+    pk = _resolve_pk(key)
+    if pk is None:
+        return None
+    local, _ = _lrus()
+    version = _current_version(pk)
+    entry = local.get(pk)
+    if entry is not None and entry[0] == version:
+        _count('local')
+        return entry[1]
+
+    data_key = f'{PREFIX}:{pk}:{version}'
+    data = _shared().get(data_key)
+    if data is not None:
+        _count('shared')
+    else:
+        _count('database')
+        data = replicas.fresh_read(lambda: _load(pk=pk), pk=pk)
+        if data is None:
+            return None
+        data = dict(data)
+        _shared().set(data_key, data, timeout=_config()['TIMEOUT'])
+    local.set(pk, (version, data))
+    return data
+
+
+def invalidate(*pks):
+    """Change la version des paiements après le commit de la transaction en cours.
+
+    Réveille aussi les abonnés de ce processus (SSE, long-poll) de ces paiements, et
+    les fait lire sur le primaire le temps que les réplicas rattrapent l'écriture.
+    """
+    if not pks:
+        return
+
+    def bump():
+        # Avant le changement de version : la nouvelle n'est jamais lue sur un réplica en retard
+        replicas.pin(*pks)
+        if _config()['ENABLED']:
+            local, _ = _lrus()
+            _shared().set_many({_version_key(pk): uuid.uuid4().hex for pk in pks}, timeout=_config()['KEY_TIMEOUT'])
+            for pk in pks:
+                local.pop(pk)
+            _stats['invalidations'] += len(pks)
+            cache_invalidations.inc(len(pks))
+        subscriptions.notify(*pks)
+
+    transaction.on_commit(bump)
+
+
+def stats():
+    local, aliases = _lrus()
+    reads = _stats['local'] + _stats['shared'] + _stats['database']
+    return {
+        **_stats,
+        'hit_ratio': round((reads - _stats['database']) / reads, 3) if reads else None,
+        'local_entries': len(local),
+        'alias_entries': len(aliases),
+    }
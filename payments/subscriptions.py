@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from payments import metrics, status_cache
+
+subscribers = metrics.registry.gauge(
+    'payments_status_subscribers', "Connexions en attente d'un changement de statut (SSE, long-poll)", ('mode',),
+)
+
+# pk -> {(boucle, asyncio.Event)} des abonnés de ce processus
+_waiters = defaultdict(set)
+_lock = threading.Lock()
+
+
+async def get_payment(key):
+    return await sync_to_async(status_cache.get_payment)(key)
+
+
+@contextmanager
+def subscribe(pk):
+    """Event réveillé par notify(pk) ; à appeler depuis la boucle asyncio de l'abonné."""
+    waiter = (asyncio.get_running_loop(), asyncio.Event())
+    key = str(pk)
+    with _lock:
+        _waiters[key].add(waiter)
+    try:
+        yield waiter[1]
+    finally:
+        with _lock:
+            waiters = _waiters.get(key)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del _waiters[key]
+
+
+def notify(*pks):
+    """Réveille les abonnés de ce processus ; appelable depuis n'importe quel thread."""
+    with _lock:
+        waiters = [waiter for pk in pks for waiter in _waiters.get(str(pk), ())]
+    for loop, event in waiters:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:  # boucle déjà fermée
+            pass
+
+
+async def watch(payment, timeout):
+    """Représentations successives d'un paiement (dict de get_payment), à partir de `payment`.
+
+    Réveil immédiat par notify() quand l'écriture a lieu dans ce processus ; sinon
+    relecture du cache de statut toutes les POLL_INTERVAL secondes (une lecture de
+    cache, pas de requête SQL), ce qui couvre les écritures des autres workers.
+    Produit None à chaque intervalle sans changement (battement pour SSE).
+    """
+    poll_interval = settings.PAYMENTS_SUBSCRIPTIONS['POLL_INTERVAL']
+    deadline = time.monotonic() + timeout
+    with subscribe(payment['id']) as changed:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), min(poll_interval, remaining))
+            except asyncio.TimeoutError:
+                pass
+            changed.clear()
+            current = await get_payment(payment['id'])
+            if current is None:
+                return
+            if current['updated_at'] != payment['updated_at'] or current['status'] != payment['status']:
+                payment = current
+                yield payment
+            else:
+                yield None
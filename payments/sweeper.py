@@ -0,0 +1,208 @@
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import paypalrestsdk
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from paypalrestsdk.exceptions import ResourceNotFound
+
+from payments import events, merchants, metrics, rollups, status_cache
+from payments.models import Payment
+from payments.services import SALE_FIELDS, BasePaymentService
+from payments.transport import paypal_operation
+
+logger = logging.getLogger(__name__)
+
+# État PayPal (v1/payments) -> statut local ; les autres (« created ») deviennent EXPIRED
+PAYPAL_STATES = {
+    'approved': Payment.Status.COMPLETED,
+    'failed': Payment.Status.FAILED,
+    'expired': Payment.Status.EXPIRED,
+    'canceled': Payment.Status.EXPIRED,
+}
+OUTCOMES = ('completed', 'failed', 'expired', 'skipped', 'errors')
+UPDATE_FIELDS = ['status', 'payer_id', 'payer_email', 'error_message', 'updated_at'] + SALE_FIELDS
+
+swept_rows = metrics.registry.counter(
+    'payments_sweeper_rows_total', "Paiements PENDING examinés par le balayage, par issue", ('outcome',),
+)
+batch_paypal_calls = metrics.registry.histogram(
+    'payments_sweeper_batch_paypal_calls', "Appels PayPal par lot du balayage", (),
+    buckets=(0, 10, 25, 50, 100, 200, 500, 1000),
+)
+rows_per_second = metrics.registry.gauge(
+    'payments_sweeper_rows_per_second', "Débit du dernier lot du balayage", (),
+)
+
+
+class RateLimiter:
+    """Espace les appels pour ne pas dépasser `rate` par seconde, tous threads confondus."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _lookup(payment, limiter):
+    """Ressource PayPal du paiement ; None si PayPal ne la connaît pas (404)."""
+    limiter.acquire()
+    try:
+        with paypal_operation('lookup'):
+            return paypalrestsdk.Payment.find(payment.payment_id, api=merchants.get_api(payment.merchant)).to_dict()
+    except ResourceNotFound:
+        return None
+
+
+def _resolve(payment, resource):
+    """Nouveau statut du paiement d'après PayPal (paiement plus vieux que MIN_AGE)."""
+    if not payment.payment_id or resource is None:
+        return Payment.Status.EXPIRED
+    status = PAYPAL_STATES.get(resource.get('state'))
+    if status == Payment.Status.COMPLETED:
+        payer_info = resource.get('payer', {}).get('payer_info', {})
+        payment.payer_id = payer_info.get('payer_id') or payment.payer_id
+        payment.payer_email = payer_info.get('email') or payment.payer_email
+        BasePaymentService()._apply_sale_details(payment, resource)
+    elif status == Payment.Status.FAILED:
+        payment.error_message = resource.get('failure_reason') or "Paiement refusé par PayPal"
+    if status is None:
+        # Toujours « created » après MIN_AGE : approbation abandonnée
+        status = Payment.Status.EXPIRED
+    return status
+
+
+def _apply(resolved):
+    """Enregistre les nouveaux statuts des paiements encore PENDING ; renvoie ceux mis à jour.
+
+    Les lignes sont relues sous verrou : un execute concurrent l'emporte sur le balayage.
+    """
+    if not resolved:
+        return []
+    with transaction.atomic():
+        still_pending = set(
+            Payment.objects.select_for_update()
+            .filter(pk__in=[payment.pk for payment, _ in resolved], status=Payment.Status.PENDING)
+            .values_list('pk', flat=True)
+        )
+        changed = []
+        now = timezone.now()
+        for payment, status in resolved:
+            if payment.pk in still_pending:
+                payment.status = status
+                payment.updated_at = now
+                changed.append(payment)
+        Payment.objects.bulk_update(changed, UPDATE_FIELDS)
+        rollups.record_status_changes([(payment, Payment.Status.PENDING) for payment in changed])
+        status_cache.invalidate(*[payment.pk for payment in changed])
+    return changed
+
+
+def _next_batch(cutoff, cursor, batch_size):
+    queryset = Payment.objects.filter(status=Payment.Status.PENDING, created_at__lt=cutoff)
+    if cursor is not None:
+        created_at, pk = cursor
+        queryset = queryset.filter(created_at__gte=created_at).exclude(created_at=created_at, id__lte=pk)
+    return list(queryset.select_related('merchant').order_by('created_at', 'id')[:batch_size])
+
+
+def sweep(min_age=None, batch_size=None, concurrency=None, max_seconds=None, max_rate=None, dry_run=False,
+          on_batch=None):
+    """Parcourt les paiements PENDING plus vieux que `min_age` secondes, du plus ancien au plus récent.
+
+    Par lot (pagination par clé sur (created_at, id), index status/created_at) : états PayPal
+    lus en parallèle (`concurrency` threads, au plus `max_rate` appels/s), puis un bulk_update.
+    S'arrête après `max_seconds`. Renvoie les compteurs du balayage.
+    """
+    config = settings.PAYMENTS_SWEEPER
+    min_age = config['MIN_AGE'] if min_age is None else min_age
+    batch_size = batch_size or config['BATCH_SIZE']
+    concurrency = concurrency or config['CONCURRENCY']
+    max_seconds = config['MAX_SECONDS'] if max_seconds is None else max_seconds
+    max_rate = config['MAX_RATE'] if max_rate is None else max_rate
+
+    cutoff = timezone.now() - timedelta(seconds=min_age)
+    limiter = RateLimiter(max_rate)
+    totals = Counter()
+    started = time.monotonic()
+    cursor = None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while time.monotonic() - started < max_seconds:
+            batch = _next_batch(cutoff, cursor, batch_size)
+            if not batch:
+                break
+            cursor = batch[-1].created_at, batch[-1].pk
+            batch_started = time.monotonic()
+            counts = Counter()
+
+            with_ids = [payment for payment in batch if payment.payment_id]
+            lookups = executor.map(lambda payment: _safe_lookup(payment, limiter), with_ids)
+            resources = dict(zip((payment.pk for payment in with_ids), lookups))
+            counts['paypal_calls'] = len(with_ids)
+
+            resolved = []
+            for payment in batch:
+                resource = resources.get(payment.pk)
+                if isinstance(resource, Exception):
+                    counts['errors'] += 1
+                else:
+                    resolved.append((payment, _resolve(payment, resource)))
+            if dry_run:
+                counts.update(str(status) for _, status in resolved)
+            else:
+                changed = _apply(resolved)
+                counts.update(str(payment.status) for payment in changed)
+                counts['skipped'] += len(resolved) - len(changed)  # passés hors PENDING entre-temps
+                for payment in changed:
+                    _emit(payment)
+            counts['rows'] = len(batch)
+
+            elapsed = max(time.monotonic() - batch_started, 1e-6)
+            counts['rows_per_second'] = round(len(batch) / elapsed, 1)
+            batch_paypal_calls.observe(counts['paypal_calls'])
+            rows_per_second.set(counts['rows_per_second'])
+            for outcome in OUTCOMES:
+                if counts[outcome]:
+                    swept_rows.inc(counts[outcome], outcome=outcome)
+            totals.update({key: value for key, value in counts.items() if key != 'rows_per_second'})
+            totals['batches'] += 1
+            if on_batch is not None:
+                on_batch(counts)
+
+    totals['seconds'] = round(time.monotonic() - started, 2)
+    logger.info("Balayage des paiements PENDING: %s", dict(totals))
+    return totals
+
+
+def _emit(payment):
+    if payment.status == Payment.Status.COMPLETED:
+        events.payment_executed(payment)
+    elif payment.status == Payment.Status.FAILED:
+        events.payment_failed(payment, stage='sweep')
+    else:
+        events.payment_expired(payment)
+
+
+def _safe_lookup(payment, limiter):
+    try:
+        return _lookup(payment, limiter)
+    except Exception as e:
+        # Panne ou disjoncteur ouvert : le paiement reste PENDING jusqu'au prochain passage
+        logger.warning("Balayage: état PayPal de %s illisible: %s", payment.payment_id, e)
+        return e
@@ -0,0 +1,77 @@
+import threading
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+
+from payments import merchants
+from payments.fake_paypal import FakePayPalServer
+from payments.models import Payment
+from payments.services import PaymentService
+
+# Caches `payments` et `payments_status` propres au processus de test : verrous, mémos et disjoncteurs repartent de zéro
+TEST_CACHES = {
+    **settings.CACHES,
+    'payments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'payments-tests'},
+    'payments_status': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'payments-status-tests'},
+}
+
+
+class FakePayPalMixin:
+    """Faux PayPal local (payments.fake_paypal) derrière PAYPAL_ENDPOINT pour la classe de test."""
+
+    latency = 0.0
+
+    @classmethod
+    def setUpClass(cls):
+        cls.paypal = FakePayPalServer(('127.0.0.1', 0), latency=cls.latency)
+        cls.paypal.start()
+        cls.addClassCleanup(cls.paypal.server_close)
+        cls.addClassCleanup(cls.paypal.shutdown)
+        overrides = override_settings(
+            PAYPAL_CONFIG={**settings.PAYPAL_CONFIG, 'PAYPAL_ENDPOINT': cls.paypal.url},
+            CACHES=TEST_CACHES,
+        )
+        overrides.enable()
+        cls.addClassCleanup(overrides.disable)
+        # Les Api du pool gardent l'endpoint de leur création
+        merchants._pool = None
+        cls.addClassCleanup(setattr, merchants, '_pool', None)
+        super().setUpClass()
+
+    def setUp(self):
+        super().setUp()
+        caches['payments'].clear()
+        caches['payments_status'].clear()
+        self.paypal.requests.clear()
+        self.paypal.error_rate = 0.0
+        self.service = PaymentService()
+
+    def executed_payment(self, amount='10.00', payer_id='BUYER'):
+        created = self.service.create_payment(Decimal(amount), 'Test', None, None)
+        self.service.execute_payment(created['payment_id'], payer_id)
+        return Payment.objects.get(payment_id=created['payment_id'])
+
+
+def run_concurrently(func, *args_list):
+    """Lance func(*args) dans un thread par jeu d'arguments, départ simultané ; renvoie résultats ou exceptions."""
+    barrier = threading.Barrier(len(args_list))
+    outcomes = [None] * len(args_list)
+
+    def target(index, args):
+        try:
+            barrier.wait()
+            outcomes[index] = func(*args)
+        except Exception as e:
+            outcomes[index] = e
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=target, args=(index, args)) for index, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
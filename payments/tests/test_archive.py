@@ -0,0 +1,63 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from payments import archive, status_cache
+from payments.exceptions import PaymentValidationError
+from payments.models import Payment, PaymentArchive, PaymentRefund, PaymentRefundArchive
+from payments.tests.base import TEST_CACHES
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        caches['payments_status'].clear()
+        status_cache._local = status_cache._aliases = None
+
+    def payment(self, payment_id, status=Payment.Status.COMPLETED, days=400):
+        payment = Payment.objects.create(payment_id=payment_id, amount=Decimal('10.00'), status=status)
+        Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - timedelta(days=days))
+        return payment
+
+    def test_moves_old_closed_payments_with_their_refunds(self):
+        refunded = self.payment('PAYID-OLD', Payment.Status.PARTIALLY_REFUNDED)
+        PaymentRefund.objects.create(payment=refunded, refund_id='R-1', amount=Decimal('4.00'))
+        self.payment('PAYID-PENDING', Payment.Status.PENDING)
+        self.payment('PAYID-RECENT', days=30)
+        with_pending_refund = self.payment('PAYID-REFUNDING')
+        PaymentRefund.objects.create(payment=with_pending_refund, amount=Decimal('1.00'), status=Payment.Status.PENDING)
+
+        totals = archive.archive(months=12)
+
+        self.assertEqual((totals['payments'], totals['refunds']), (1, 1))
+        self.assertEqual(
+            set(Payment.objects.values_list('payment_id', flat=True)),
+            {'PAYID-PENDING', 'PAYID-RECENT', 'PAYID-REFUNDING'},
+        )
+        self.assertEqual(PaymentArchive.objects.get().payment_id, 'PAYID-OLD')
+        self.assertEqual(PaymentRefundArchive.objects.get().refund_id, 'R-1')
+        # Toujours lisible par pk ou payment_id
+        self.assertEqual(status_cache.get_payment('PAYID-OLD')['id'], str(refunded.pk))
+
+    def test_dry_run_only_counts(self):
+        self.payment('PAYID-OLD')
+
+        self.assertEqual(archive.archive(months=12, dry_run=True)['payments'], 1)
+        self.assertFalse(PaymentArchive.objects.exists())
+
+    def test_cutoff_inside_refund_window_is_refused(self):
+        self.payment('PAYID-OLD', days=100)
+
+        with self.assertRaises(PaymentValidationError) as raised:
+            archive.archive(months=3)
+        self.assertEqual(raised.exception.code, 'archive_cutoff_in_refund_window')
+        with self.assertRaises(CommandError):
+            call_command('archive_payments', months=0, stdout=StringIO())
+        self.assertEqual(archive.archive(months=6, dry_run=True)['payments'], 0)
+        self.assertFalse(PaymentArchive.objects.exists())
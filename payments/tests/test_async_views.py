@@ -0,0 +1,65 @@
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+
+from payments.models import Payment
+from payments.tests.base import FakePayPalMixin
+
+
+class AsyncPaymentViewTests(FakePayPalMixin, TestCase):
+
+    async def create_and_execute(self, amount='10.00'):
+        created = await self.async_client.post(
+            reverse('async-payment-create'), {'amount': amount, 'description': 'Test'}, content_type='application/json',
+        )
+        self.assertEqual(created.status_code, 200)
+        payment_id = created.json()['payment_id']
+        executed = await self.async_client.post(
+            reverse('async-payment-execute'), {'payment_id': payment_id, 'payer_id': 'BUYER'},
+            content_type='application/json',
+        )
+        self.assertEqual(executed.status_code, 200)
+        return executed.json()
+
+    async def refund(self, payment, body):
+        return await self.async_client.post(
+            reverse('async-payment-refund', args=[payment['id']]), body, content_type='application/json',
+        )
+
+    async def test_create_execute_refund(self):
+        payment = await self.create_and_execute('10.00')
+        self.assertEqual(payment['status'], Payment.Status.COMPLETED)
+        self.assertTrue(payment['sale_id'])
+
+        response = await self.refund(payment, {'amount': '4.00'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.json()['amount']), Decimal('4.00'))
+
+        # Sans montant : remboursement du restant
+        response = await self.refund(payment, {})
+        self.assertEqual(Decimal(response.json()['amount']), Decimal('6.00'))
+        db_payment = await Payment.objects.aget(pk=payment['id'])
+        self.assertEqual(db_payment.status, Payment.Status.REFUNDED)
+
+    async def test_unparseable_refund_amount_is_rejected(self):
+        payment = await self.create_and_execute('10.00')
+
+        for amount in ('1O.00', 'NaN', 'Infinity', '-5', '0', 'abc'):
+            with self.subTest(amount=amount):
+                response = await self.refund(payment, {'amount': amount})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['code'], 'invalid_amount')
+
+        self.assertEqual(self.paypal.requests['refund'], 0)
+        db_payment = await Payment.objects.aget(pk=payment['id'])
+        self.assertEqual(db_payment.refunded_amount, Decimal('0'))
+
+    async def test_create_requires_valid_amount(self):
+        for body in ({}, {'amount': 'NaN'}, {'amount': '12,5'}):
+            with self.subTest(body=body):
+                response = await self.async_client.post(
+                    reverse('async-payment-create'), body, content_type='application/json',
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.paypal.requests['create'], 0)
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.test import TestCase
+from django.urls import reverse
+
+from payments.models import Payment
+from payments.tests.base import FakePayPalMixin
+
+
+class BatchCreateTests(FakePayPalMixin, TestCase):
+
+    def post(self, data):
+        return self.client.post(reverse('payment-batch'), data, content_type='application/json')
+
+    def test_creates_valid_items_and_reports_failures_in_order(self):
+        response = self.post({'payments': [
+            {'amount': '10.00', 'description': 'A'},
+            {'amount': 'abc'},
+            {'amount': '-1'},
+            {'amount': '2.50', 'description': 'B'},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (2, 2))
+        self.assertEqual([result['status'] for result in body['results']], ['created', 'failed', 'failed', 'created'])
+        self.assertEqual([result['index'] for result in body['results']], [0, 1, 2, 3])
+        self.assertEqual(self.paypal.requests['create'], 2)
+        self.assertEqual(
+            set(Payment.objects.values_list('payment_id', flat=True)),
+            {body['results'][0]['payment_id'], body['results'][3]['payment_id']},
+        )
+        self.assertTrue(all(result['approval_url'] for result in body['results'] if result['status'] == 'created'))
+
+    def test_paypal_failure_only_fails_its_item(self):
+        self.paypal.error_rate, self.paypal.error_status = 1.0, 400
+        response = self.post([{'amount': '10.00'}, {'amount': '20.00'}])
+
+        self.assertEqual(response.json()['failed'], 2)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_rejects_empty_or_oversized_batches(self):
+        self.assertEqual(self.post({'payments': []}).status_code, 400)
+        self.assertEqual(self.post({'payments': 'x'}).status_code, 400)
+        with self.settings(PAYPAL_CONFIG={**settings.PAYPAL_CONFIG, 'PAYPAL_BATCH_MAX_ITEMS': 2}):
+            self.assertEqual(self.post([{'amount': '1'}] * 3).status_code, 400)
+        self.assertEqual(self.paypal.requests['create'], 0)
+
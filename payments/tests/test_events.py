@@ -0,0 +1,71 @@
+import json
+import logging
+import os
+import tempfile
+import uuid
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from payments import events
+from payments.events import Event
+from payments.tests.base import FakePayPalMixin
+
+
+class EventFormatTests(SimpleTestCase):
+
+    def record(self, **fields):
+        record = logging.LogRecord('payments.events', logging.INFO, __file__, 0, Event.CREATED, (), None)
+        record.event, record.fields = Event.CREATED, fields
+        return record
+
+    def test_to_json_handles_decimal_uuid_and_unknown_types(self):
+        payment_id = uuid.uuid4()
+        line = json.loads(events.to_json(self.record(id=payment_id, amount=Decimal('9.99'), other=object())))
+
+        self.assertEqual(line['event'], Event.CREATED)
+        self.assertEqual(line['level'], 'INFO')
+        self.assertEqual(line['id'], str(payment_id))
+        self.assertEqual(line['amount'], '9.99')
+        self.assertTrue(line['other'].startswith('<object'))
+
+    def test_lazy_fields_are_skipped_when_not_kept(self):
+        body = mock.Mock(return_value={'id': 'PAYID'})
+        with mock.patch.object(events.event_logger, 'isEnabledFor', return_value=False):
+            events.emit(Event.PAYPAL_RESPONSE, logging.DEBUG, body=body)
+        sample_rates = {**settings.PAYMENTS_EVENTS['SAMPLE_RATES'], Event.PAYPAL_RESPONSE: 0.0}
+        with override_settings(PAYMENTS_EVENTS={**settings.PAYMENTS_EVENTS, 'SAMPLE_RATES': sample_rates}), \
+                mock.patch.object(events.event_logger, 'log') as log:
+            events.emit(Event.PAYPAL_RESPONSE, logging.DEBUG, body=body)
+
+        log.assert_not_called()
+        body.assert_not_called()
+
+    def test_async_handler_writes_one_line_per_event(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.ndjson')
+            handler = events.AsyncNDJSONHandler(path, batch_size=2)
+            for index in range(5):
+                handler.handle(self.record(index=index, body=lambda: {'lazy': True}))
+            handler.flush()
+            handler.close()
+
+            with open(path, encoding='utf-8') as file:
+                lines = [json.loads(line) for line in file]
+        self.assertEqual([line['index'] for line in lines], list(range(5)))
+        self.assertEqual(lines[0]['body'], {'lazy': True})
+
+
+class PaymentEventTests(FakePayPalMixin, TestCase):
+
+    def test_lifecycle_events(self):
+        with self.assertLogs('payments.events', 'INFO') as logs:
+            payment = self.executed_payment('10.00')
+            self.service.refund_payment(payment.payment_id, Decimal('4.00'))
+
+        emitted = {record.event: record.fields for record in logs.records}
+        self.assertEqual(list(emitted), [Event.CREATED, Event.EXECUTED, Event.REFUNDED])
+        self.assertEqual(emitted[Event.EXECUTED]['sale_id'], payment.sale_id)
+        self.assertEqual(emitted[Event.REFUNDED]['refunded_amount'], Decimal('4.00'))
@@ -0,0 +1,84 @@
+from decimal import Decimal
+from unittest import mock
+
+import requests
+from django.core.cache import caches
+from django.test import TestCase, TransactionTestCase
+
+from payments.exceptions import PaymentProcessError, PaymentValidationError
+from payments.models import Payment
+from payments.services import SALE_FIELDS
+from payments.tests.base import FakePayPalMixin, run_concurrently
+from payments.webhooks import process_pending_events, record_event
+
+
+class ExecuteCoalescingTests(FakePayPalMixin, TransactionTestCase):
+    latency = 0.3
+
+    def test_concurrent_executes_share_one_paypal_call(self):
+        created = self.service.create_payment(Decimal('25.00'), 'Test', None, None)
+
+        outcomes = run_concurrently(self.service.execute_payment, *[(created['payment_id'], 'BUYER')] * 4)
+
+        self.assertEqual(self.paypal.requests['execute'], 1)
+        for outcome in outcomes:
+            self.assertIsInstance(outcome, dict)
+            self.assertEqual(outcome['status'], Payment.Status.COMPLETED)
+            self.assertEqual(outcome['payment_id'], created['payment_id'])
+
+    def test_other_payer_is_refused(self):
+        created = self.service.create_payment(Decimal('25.00'), 'Test', None, None)
+        self.service.execute_payment(created['payment_id'], 'BUYER')
+
+        # Résultat mémorisé, puis paiement relu en base : refusé dans les deux cas, sans appel PayPal
+        for clear_memo in (False, True):
+            if clear_memo:
+                caches['payments'].clear()
+            with self.assertRaises(PaymentValidationError) as raised:
+                self.service.execute_payment(created['payment_id'], 'OTHER')
+            self.assertEqual(raised.exception.code, 'payer_mismatch')
+
+        self.assertEqual(self.paypal.requests['execute'], 1)
+        self.assertEqual(Payment.objects.get(payment_id=created['payment_id']).status, Payment.Status.COMPLETED)
+
+
+class ExecuteRetryTests(FakePayPalMixin, TestCase):
+
+    def test_buyer_retry_after_webhook_completion(self):
+        created = self.service.create_payment(Decimal('10.00'), 'Test', None, None)
+        payment_id = created['payment_id']
+        # L'execute a abouti chez PayPal mais la réponse n'est jamais arrivée (timeout)
+        executed = requests.post(
+            f'{self.paypal.url}/v1/payments/payment/{payment_id}/execute', json={'payer_id': 'BUYER'}, timeout=5,
+        ).json()
+        sale = executed['transactions'][0]['related_resources'][0]['sale']
+        record_event({
+            'id': 'WH-EVT-1', 'event_type': 'PAYMENT.SALE.COMPLETED', 'resource_type': 'sale',
+            'resource': {'id': sale['id'], 'state': 'completed', 'parent_payment': payment_id},
+        })
+        process_pending_events()
+        payment = Payment.objects.get(payment_id=payment_id)
+        self.assertEqual((payment.status, payment.payer_id), (Payment.Status.COMPLETED, None))
+
+        result = self.service.execute_payment(payment_id, 'BUYER')
+
+        self.assertEqual(result['status'], Payment.Status.COMPLETED)
+        self.assertEqual(result['sale_id'], sale['id'])
+        self.assertEqual(self.paypal.requests['execute'], 1)
+
+    def test_execute_saves_only_the_fields_it_sets(self):
+        created = self.service.create_payment(Decimal('10.00'), 'Test', None, None)
+
+        with mock.patch.object(Payment, 'save', autospec=True, side_effect=Payment.save) as save:
+            self.service.execute_payment(created['payment_id'], 'BUYER')
+
+        update_fields = save.call_args.kwargs['update_fields']
+        self.assertEqual(set(update_fields), {'status', 'payer_id', 'payer_email', 'updated_at', *SALE_FIELDS})
+
+        # Échec chez PayPal : statut et message seulement
+        created = self.service.create_payment(Decimal('10.00'), 'Test', None, None)
+        self.paypal.error_rate, self.paypal.error_status = 1.0, 400
+        with mock.patch.object(Payment, 'save', autospec=True, side_effect=Payment.save) as save:
+            with self.assertRaises(PaymentProcessError):
+                self.service.execute_payment(created['payment_id'], 'BUYER')
+        self.assertEqual(save.call_args.kwargs['update_fields'], ['status', 'error_message', 'updated_at'])
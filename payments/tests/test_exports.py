@@ -0,0 +1,49 @@
+import csv
+import io
+import json
+import zlib
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+
+from payments.models import Payment, PaymentRefund
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.refunded = Payment.objects.create(
+            payment_id='PAYID-A', amount=Decimal('10.00'), currency='EUR', status=Payment.Status.PARTIALLY_REFUNDED,
+        )
+        PaymentRefund.objects.create(payment=self.refunded, refund_id='R-1', amount=Decimal('3.00'))
+        PaymentRefund.objects.create(payment=self.refunded, refund_id='R-2', amount=Decimal('2.00'))
+        Payment.objects.create(payment_id='PAYID-B', amount=Decimal('4.00'), currency='USD')
+
+    def export(self, query):
+        response = self.client.get(f"{reverse('payment-export')}?{query}")
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_rows_carry_refund_totals(self):
+        response, body = self.export('output=csv')
+
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = {row['payment_id']: row for row in csv.DictReader(io.StringIO(body.decode('utf-8')))}
+        self.assertEqual(set(rows), {'PAYID-A', 'PAYID-B'})
+        self.assertEqual(rows['PAYID-A']['refunds_count'], '2')
+        self.assertEqual(Decimal(rows['PAYID-A']['refunded_amount']), Decimal('5.00'))
+        self.assertEqual(set(rows['PAYID-A']['refund_ids'].split(';')), {'R-1', 'R-2'})
+        self.assertEqual(rows['PAYID-B']['refunds_count'], '0')
+
+    def test_gzip_ndjson_with_filters(self):
+        response, body = self.export('output=ndjson&gzip=1&currency=eur')
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = zlib.decompress(body, 16 + zlib.MAX_WBITS).decode('utf-8').splitlines()
+        [row] = [json.loads(line) for line in lines]
+        self.assertEqual(row['payment_id'], 'PAYID-A')
+        self.assertEqual(sorted(refund['refund_id'] for refund in row['refunds']), ['R-1', 'R-2'])
+
+    def test_unknown_format_is_rejected(self):
+        self.assertEqual(self.client.get(f"{reverse('payment-export')}?output=xml").status_code, 400)
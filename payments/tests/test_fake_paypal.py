@@ -0,0 +1,71 @@
+from decimal import Decimal
+
+import requests
+from django.test import SimpleTestCase
+
+from payments.fake_paypal import FakePayPalServer
+
+
+class FakePayPalServerTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.paypal = FakePayPalServer(('127.0.0.1', 0))
+        cls.paypal.start()
+        cls.addClassCleanup(cls.paypal.server_close)
+        cls.addClassCleanup(cls.paypal.shutdown)
+
+    def setUp(self):
+        self.paypal.requests.clear()
+        self.paypal.error_rate = 0.0
+
+    def call(self, method, path, body=None):
+        return requests.request(method, self.paypal.url + path, json=body, timeout=5)
+
+    def create(self, total='10.00'):
+        response = self.call('POST', '/v1/payments/payment', {
+            'intent': 'sale',
+            'payer': {'payment_method': 'paypal'},
+            'transactions': [{'amount': {'total': total, 'currency': 'EUR'}}],
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_payment_lifecycle(self):
+        self.assertEqual(self.call('POST', '/v1/oauth2/token').status_code, 200)
+        payment = self.create()
+        self.assertIn('approval_url', [link['rel'] for link in payment['links']])
+
+        executed = self.call('POST', f"/v1/payments/payment/{payment['id']}/execute", {'payer_id': 'BUYER'}).json()
+        sale = executed['transactions'][0]['related_resources'][0]['sale']
+        self.assertEqual(executed['state'], 'approved')
+        self.assertEqual(executed['payer']['payer_info']['payer_id'], 'BUYER')
+
+        again = self.call('POST', f"/v1/payments/payment/{payment['id']}/execute", {'payer_id': 'BUYER'})
+        self.assertEqual(again.json()['name'], 'PAYMENT_ALREADY_DONE')
+
+        refund = self.call('POST', f"/v1/payments/sale/{sale['id']}/refund", {'amount': {'total': '4.00'}})
+        self.assertEqual(refund.status_code, 201)
+        self.assertEqual(self.call('GET', f"/v1/payments/sale/{sale['id']}").json()['state'], 'partially_refunded')
+        self.assertNotIn('refunded', self.call('GET', f"/v1/payments/sale/{sale['id']}").json())
+        self.assertEqual(self.paypal.requests['execute'], 2)
+
+    def test_refund_cannot_exceed_sale(self):
+        payment = self.create('10.00')
+        executed = self.call('POST', f"/v1/payments/payment/{payment['id']}/execute", {'payer_id': 'B'}).json()
+        sale_id = executed['transactions'][0]['related_resources'][0]['sale']['id']
+
+        self.call('POST', f'/v1/payments/sale/{sale_id}/refund', {'amount': {'total': '6.00'}})
+        response = self.call('POST', f'/v1/payments/sale/{sale_id}/refund', {'amount': {'total': '6.00'}})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['name'], 'REFUND_EXCEEDED_TRANSACTION_AMOUNT')
+        self.assertEqual(Decimal(str(self.paypal.sales[sale_id]['refunded'])), Decimal('6.00'))
+
+    def test_error_injection_spares_token(self):
+        self.paypal.error_rate, self.paypal.error_status = 1.0, 503
+
+        self.assertEqual(self.call('POST', '/v1/oauth2/token').status_code, 200)
+        self.assertEqual(self.call('GET', '/v1/payments/payment/PAYID-X').status_code, 503)
+        self.assertEqual(self.call('GET', '/v1/unknown').status_code, 404)
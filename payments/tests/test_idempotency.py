@@ -0,0 +1,93 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from payments.models import IdempotencyKey, Payment, PaymentRefund
+from payments.services import PaymentService
+from payments.tests.base import FakePayPalMixin
+
+
+class IdempotencyKeyTests(FakePayPalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.url = reverse('payment-list')
+
+    def post(self, data, key='order-42'):
+        return self.client.post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_stored_response(self):
+        first = self.post({'amount': '12.50', 'description': 'Commande 42'})
+        second = self.post({'amount': '12.50', 'description': 'Commande 42'})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.paypal.requests['create'], 1)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_key_reused_with_other_body_is_rejected(self):
+        self.post({'amount': '12.50'})
+        response = self.post({'amount': '99.00'})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.paypal.requests['create'], 1)
+
+    def test_server_error_releases_key(self):
+        with mock.patch.object(PaymentService, 'create_payment', side_effect=RuntimeError('boom')):
+            response = self.post({'amount': '12.50'})
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        retry = self.post({'amount': '12.50'})
+        self.assertEqual(retry.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', retry)
+        self.assertEqual(self.paypal.requests['create'], 1)
+
+    def test_refund_replay_does_not_refund_twice(self):
+        payment = self.executed_payment('10.00')
+        url = reverse('payment-refund', args=[payment.pk])
+
+        responses = [
+            self.client.post(url, {'amount': '4.00'}, format='json', HTTP_IDEMPOTENCY_KEY='refund-1')
+            for _ in range(2)
+        ]
+
+        self.assertEqual([response.status_code for response in responses], [201, 201])
+        self.assertEqual(responses[1].json(), responses[0].json())
+        self.assertEqual(self.paypal.requests['refund'], 1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.refunded_amount, Decimal('4.00'))
+
+
+class RefundAmountTests(FakePayPalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.payment = self.executed_payment('10.00')
+        self.url = reverse('payment-refund', args=[self.payment.pk])
+
+    def test_unparseable_amount_is_rejected(self):
+        for amount in ('1O.00', 'NaN', 'Infinity', '-Infinity', '-1', '0', True):
+            with self.subTest(amount=amount):
+                response = self.client.post(self.url, {'amount': amount}, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['code'], 'invalid_amount')
+
+        self.assertEqual(self.paypal.requests['refund'], 0)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.refunded_amount, Decimal('0'))
+
+    def test_missing_or_empty_amount_refunds_the_balance(self):
+        response = self.client.post(self.url, {'amount': '3.00'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(self.url, {'amount': ''}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.json()['amount']), Decimal('7.00'))
+        self.assertEqual(PaymentRefund.objects.filter(payment=self.payment).count(), 2)
@@ -0,0 +1,118 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+import requests
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from payments import jobs
+from payments.exceptions import PaymentProcessError, PayPalUnavailableError, RefundError
+from payments.models import PaymentJob
+
+
+class JobQueueTests(TestCase):
+
+    def enqueue_create(self):
+        return jobs.enqueue(PaymentJob.Kind.CREATE, {'amount': '10.00', 'description': 'Test', 'merchant': None})
+
+    def test_claim_is_exclusive(self):
+        enqueued = {self.enqueue_create().pk for _ in range(3)}
+
+        first = jobs.claim('worker-1', 2)
+        second = jobs.claim('worker-2', 5)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertEqual({job.pk for job in first + second}, enqueued)
+        self.assertEqual(jobs.claim('worker-3', 5), [])
+        self.assertTrue(all(job.status == PaymentJob.Status.RUNNING and job.locked_by == 'worker-1' for job in first))
+
+    def test_transient_failure_is_retried_with_same_request_id(self):
+        job = self.enqueue_create()
+        service = mock.Mock()
+        try:
+            raise requests.ConnectionError('connexion réinitialisée')
+        except requests.ConnectionError as e:
+            network_error = PaymentProcessError("Erreur lors de la création du paiement PayPal")
+            network_error.__cause__ = e
+        service.create_payment.side_effect = [network_error, {'payment_id': 'PAYID-1'}]
+
+        [job] = jobs.claim('worker-1', 1)
+        jobs.run(service, job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, PaymentJob.Status.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(job.locked_by)
+        self.assertGreater(job.run_at, timezone.now())
+
+        PaymentJob.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        [job] = jobs.claim('worker-2', 1)
+        jobs.run(service, job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, PaymentJob.Status.SUCCEEDED)
+        self.assertEqual(job.result, {'payment_id': 'PAYID-1'})
+        request_ids = {call.kwargs['request_id'] for call in service.create_payment.call_args_list}
+        self.assertEqual(request_ids, {job.payload['request_id']})
+
+    def test_business_error_is_not_retried(self):
+        jobs.enqueue(PaymentJob.Kind.REFUND, {'payment_id': 'PAYID-1', 'amount': None, 'reason': None})
+        service = mock.Mock()
+        service.refund_payment.side_effect = RefundError("Montant supérieur au restant remboursable")
+
+        [job] = jobs.claim('worker-1', 1)
+        jobs.run(service, job)
+        job.refresh_from_db()
+
+        self.assertEqual(job.status, PaymentJob.Status.FAILED)
+        self.assertEqual(job.attempts, 1)
+
+    def test_outcome_is_discarded_when_lock_was_lost(self):
+        self.enqueue_create()
+        service = mock.Mock()
+        service.create_payment.return_value = {'payment_id': 'PAYID-1'}
+        [job] = jobs.claim('worker-1', 1)
+        # Remis en file puis repris par un autre worker pendant l'exécution
+        PaymentJob.objects.filter(pk=job.pk).update(locked_by='worker-2')
+
+        jobs.run(service, job)
+        job.refresh_from_db()
+
+        self.assertEqual(job.status, PaymentJob.Status.RUNNING)
+        self.assertEqual(job.locked_by, 'worker-2')
+        self.assertIsNone(job.result)
+
+    def test_breaker_retry_waits_for_retry_after(self):
+        self.enqueue_create()
+        service = mock.Mock()
+        service.create_payment.side_effect = PayPalUnavailableError("PayPal indisponible", params={'retry_after': 600})
+
+        [job] = jobs.claim('worker-1', 1)
+        jobs.run(service, job)
+        job.refresh_from_db()
+
+        self.assertEqual(job.status, PaymentJob.Status.QUEUED)
+        self.assertGreaterEqual(job.run_at, timezone.now() + timedelta(seconds=590))
+
+    def test_stale_job_is_requeued(self):
+        self.enqueue_create()
+        [job] = jobs.claim('worker-1', 1)
+        PaymentJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(jobs.requeue_stale(lock_timeout=60), 1)
+        self.assertEqual(jobs.claim('worker-2', 1)[0].pk, job.pk)
+
+
+class HeartbeatTests(TransactionTestCase):
+    # Le heartbeat écrit depuis son propre thread, donc sa propre connexion
+
+    def test_heartbeat_keeps_running_job_from_being_requeued(self):
+        jobs.enqueue(PaymentJob.Kind.CREATE, {'amount': '10.00', 'description': 'Test', 'merchant': None})
+        [job] = jobs.claim('worker-1', 1)
+        PaymentJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+
+        with jobs.Heartbeat(job, interval=0.05):
+            time.sleep(0.3)
+
+        self.assertGreater(PaymentJob.objects.get(pk=job.pk).locked_at, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(jobs.requeue_stale(lock_timeout=60), 0)
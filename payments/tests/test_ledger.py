@@ -0,0 +1,68 @@
+from decimal import Decimal
+
+from django.test import TransactionTestCase, skipUnlessDBFeature
+
+from payments import ledger
+from payments.exceptions import RefundError
+from payments.models import Payment, PaymentRefund
+from payments.tests.base import FakePayPalMixin, run_concurrently
+
+
+class RefundLedgerTests(FakePayPalMixin, TransactionTestCase):
+
+    def test_stale_instances_cannot_reserve_past_amount(self):
+        # Deux requêtes ont lu le paiement avant toute réservation : seul l'UPDATE conditionnel les départage
+        payment = self.executed_payment('10.00')
+        first, second = Payment.objects.get(pk=payment.pk), Payment.objects.get(pk=payment.pk)
+
+        self.assertEqual(ledger.reserve(first, Decimal('6.00')), Decimal('6.00'))
+        with self.assertRaises(RefundError) as raised:
+            ledger.reserve(second, Decimal('6.00'))
+
+        self.assertEqual(raised.exception.code, 'refund_exceeds_balance')
+        self.assertEqual(second.refunded_amount, Decimal('0.00'))
+        payment.refresh_from_db()
+        self.assertEqual(payment.refunded_amount, Decimal('6.00'))
+
+    # SQLite (base de test partagée en mémoire) : les écritures concurrentes échouent en « table is locked »
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_refunds_cannot_exceed_amount(self):
+        payment = self.executed_payment('10.00')
+
+        outcomes = run_concurrently(
+            self.service.refund_payment, (payment.payment_id, Decimal('6.00')), (payment.payment_id, Decimal('6.00')),
+        )
+
+        refunds = [outcome for outcome in outcomes if isinstance(outcome, PaymentRefund)]
+        errors = [outcome for outcome in outcomes if isinstance(outcome, RefundError)]
+        self.assertEqual((len(refunds), len(errors)), (1, 1), outcomes)
+        self.assertEqual(errors[0].code, 'refund_exceeds_balance')
+        self.assertEqual(self.paypal.requests['refund'], 1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.refunded_amount, Decimal('6.00'))
+        self.assertEqual(payment.status, Payment.Status.PARTIALLY_REFUNDED)
+        self.assertEqual(payment.refunds.count(), 1)
+
+    def test_refused_refund_releases_reservation(self):
+        payment = self.executed_payment('10.00')
+        self.paypal.error_rate, self.paypal.error_status = 1.0, 400
+
+        with self.assertRaises(RefundError) as raised:
+            self.service.refund_payment(payment.payment_id, Decimal('4.00'))
+
+        self.assertEqual(raised.exception.code, 'refund_failed')
+        payment.refresh_from_db()
+        self.assertEqual(payment.refunded_amount, Decimal('0.00'))
+        self.assertEqual(payment.status, Payment.Status.COMPLETED)
+        self.assertFalse(payment.refunds.exists())
+
+    def test_full_refund_after_partial_refund(self):
+        payment = self.executed_payment('10.00')
+        self.service.refund_payment(payment.payment_id, Decimal('4.00'))
+        refund = self.service.refund_payment(payment.payment_id)
+
+        self.assertEqual(refund.amount, Decimal('6.00'))
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.Status.REFUNDED)
+        with self.assertRaises(RefundError):
+            self.service.refund_payment(payment.payment_id, Decimal('0.01'))
@@ -0,0 +1,85 @@
+import importlib
+from types import SimpleNamespace
+
+from cryptography.fernet import Fernet
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from payments import fields
+from payments.models import Merchant
+
+secret_migration = importlib.import_module('payments.migrations.0015_merchant_encrypted_secret')
+
+
+class MerchantSecretTests(TestCase):
+
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name='Acme', slug='acme', client_id='CLIENT', client_secret='S3CRET')
+
+    def stored_secret(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT client_secret FROM payments_merchant WHERE id = %s', [self.merchant.pk.hex])
+            return cursor.fetchone()[0]
+
+    def test_secret_is_encrypted_at_rest(self):
+        stored = self.stored_secret()
+
+        self.assertNotIn('S3CRET', stored)
+        self.assertEqual(fields.decrypt(stored), 'S3CRET')
+        self.assertEqual(Merchant.objects.get(pk=self.merchant.pk).client_secret, 'S3CRET')
+
+    def test_key_rotation_reads_old_secrets(self):
+        old_key, new_key = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+        with override_settings(PAYMENTS_ENCRYPTION_KEYS=[old_key]):
+            self.merchant.save()
+        with override_settings(PAYMENTS_ENCRYPTION_KEYS=[new_key, old_key]):
+            self.assertEqual(Merchant.objects.get(pk=self.merchant.pk).client_secret, 'S3CRET')
+        with override_settings(PAYMENTS_ENCRYPTION_KEYS=[new_key]):
+            with self.assertRaises(ImproperlyConfigured):
+                Merchant.objects.get(pk=self.merchant.pk)
+
+    def test_migration_encrypts_plaintext_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE payments_merchant SET client_secret = %s', ['PLAIN'])
+
+        secret_migration.encrypt_secrets(None, SimpleNamespace(connection=connection))
+
+        self.assertEqual(fields.decrypt(self.stored_secret()), 'PLAIN')
+
+
+class MerchantAdminTests(TestCase):
+
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name='Acme', slug='acme', client_id='CLIENT', client_secret='S3CRET')
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        self.url = reverse('admin:payments_merchant_change', args=[self.merchant.pk])
+
+    def form_data(self, **changes):
+        return {
+            'name': 'Acme', 'slug': 'acme', 'mode': 'sandbox', 'client_id': 'CLIENT',
+            'client_secret': '', 'currency': 'EUR', 'is_active': 'on', **changes,
+        }
+
+    def test_secret_is_never_rendered(self):
+        for url in (self.url, reverse('admin:payments_merchant_changelist')):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotContains(response, 'S3CRET')
+
+    def test_blank_secret_keeps_the_current_one(self):
+        self.client.post(self.url, self.form_data(name='Acme Corp'))
+        self.merchant.refresh_from_db()
+        self.assertEqual((self.merchant.name, self.merchant.client_secret), ('Acme Corp', 'S3CRET'))
+
+        self.client.post(self.url, self.form_data(client_secret='NEW'))
+        self.merchant.refresh_from_db()
+        self.assertEqual(self.merchant.client_secret, 'NEW')
+
+    def test_new_merchant_requires_a_secret(self):
+        response = self.client.post(reverse('admin:payments_merchant_add'), self.form_data(slug='other'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Merchant.objects.filter(slug='other').exists())
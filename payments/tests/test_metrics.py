@@ -0,0 +1,72 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from payments import metrics
+from payments.tests.base import FakePayPalMixin
+
+
+def metrics_settings(**config):
+    return override_settings(PAYMENTS_METRICS={**settings.PAYMENTS_METRICS, **config})
+
+
+class RegistryTests(SimpleTestCase):
+
+    def test_render_counter_and_histogram(self):
+        registry = metrics.Registry()
+        calls = registry.counter('calls_total', "Appels", ('method',))
+        duration = registry.histogram('duration_seconds', "Durée", ('route',), buckets=(0.1, 1.0))
+
+        calls.inc(method='a"b')
+        calls.inc(2, method='a"b')
+        duration.observe(0.5, route='list')
+        output = registry.render()
+
+        self.assertIn('# TYPE calls_total counter', output)
+        self.assertIn('calls_total{method="a\\"b"} 3', output)
+        self.assertIn('duration_seconds_bucket{route="list",le="0.1"} 0', output)
+        self.assertIn('duration_seconds_bucket{route="list",le="1.0"} 1', output)
+        self.assertIn('duration_seconds_bucket{route="list",le="+Inf"} 1', output)
+        self.assertIn('duration_seconds_count{route="list"} 1', output)
+
+    def test_wrong_labels_are_refused(self):
+        calls = metrics.Registry().counter('calls_total', "Appels", ('method',))
+        with self.assertRaises(ValueError):
+            calls.inc(route='list')
+
+
+class MetricsViewTests(FakePayPalMixin, TestCase):
+
+    def scrape(self, **headers):
+        return self.client.get(reverse('metrics'), headers=headers)
+
+    @metrics_settings(TOKEN='')
+    def test_without_token_only_served_in_debug(self):
+        with self.assertLogs('payments.views', 'ERROR'):
+            self.assertEqual(self.scrape().status_code, 403)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.scrape().status_code, 200)
+
+    @metrics_settings(TOKEN='secret')
+    def test_bearer_token_required(self):
+        self.assertEqual(self.scrape().status_code, 401)
+        self.assertEqual(self.scrape(Authorization='Bearer wrong').status_code, 401)
+        self.assertEqual(self.scrape(Authorization='Bearer secret').status_code, 200)
+
+    @metrics_settings(ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual(self.scrape().status_code, 404)
+
+    @metrics_settings(TOKEN='secret')
+    def test_service_and_paypal_calls_are_recorded(self):
+        self.service.create_payment(Decimal('10.00'), 'Test', None, None)
+        self.client.get(reverse('payment-list'))
+
+        output = self.scrape(Authorization='Bearer secret').content.decode()
+
+        self.assertIn('payments_service_calls_total{method="create_payment",outcome="ok"}', output)
+        self.assertIn('paypal_request_duration_seconds_count{operation="create",outcome="2xx"}', output)
+        self.assertIn('http_request_duration_seconds_count{route="payment-list",method="GET",status="200"}', output)
+        self.assertIn('db_queries_per_request_count{route="payment-list"}', output)
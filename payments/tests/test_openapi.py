@@ -0,0 +1,68 @@
+import gzip
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from payments import openapi
+
+
+class OpenAPISchemaTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = Path(tmp.name)
+        overrides = override_settings(PAYMENTS_OPENAPI={**settings.PAYMENTS_OPENAPI, 'DIR': tmp.name})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # Le bundle du processus est indexé sur le mtime du manifeste, pas sur le répertoire
+        openapi._bundle = openapi._bundle_mtime = None
+
+    def build(self):
+        call_command('build_openapi_schema', stdout=StringIO())
+        return json.loads((self.directory / openapi.MANIFEST).read_text())
+
+    def test_build_writes_hashed_files_and_manifest(self):
+        (self.directory / 'swagger-old.json').write_text('{}')
+
+        manifest = self.build()
+
+        files = manifest['formats']['json']['files']
+        body = (self.directory / files['identity']).read_bytes()
+        self.assertIn('/payments/', json.loads(body)['paths'])
+        self.assertEqual(gzip.decompress((self.directory / files['gzip']).read_bytes()), body)
+        self.assertIn(manifest['formats']['json']['etag'][:12], files['identity'])
+        self.assertTrue((self.directory / manifest['formats']['yaml']['files']['identity']).exists())
+        # Fichiers d'un build précédent supprimés
+        self.assertFalse((self.directory / 'swagger-old.json').exists())
+        # Contenu identique : mêmes noms, reproductible
+        self.assertEqual(self.build(), manifest)
+
+    def test_serves_precomputed_schema_with_etag(self):
+        manifest = self.build()
+        etag = f'"{manifest["formats"]["json"]["etag"]}"'
+
+        response = self.client.get('/swagger.json/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('paths', json.loads(response.content))
+
+        response = self.client.get('/swagger.json/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/', {'format': 'openapi'}, HTTP_ACCEPT_ENCODING='gzip;q=1.0, identity;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], f'"{manifest["formats"]["json"]["etag"]}-gzip"')
+        self.assertIn('paths', json.loads(gzip.decompress(response.content)))
+
+    @override_settings(DEBUG=False)
+    def test_missing_schema_is_unavailable_outside_debug(self):
+        with self.assertLogs('payments.openapi', 'ERROR'):
+            response = self.client.get('/swagger.yaml/')
+        self.assertEqual(response.status_code, 503)
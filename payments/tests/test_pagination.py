@@ -0,0 +1,52 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from payments.models import Payment
+
+
+class KeysetPaginationTests(TestCase):
+
+    def test_pages_through_identical_created_at(self):
+        Payment.objects.bulk_create([
+            Payment(payment_id=f'PAYID-{index}', amount=Decimal('5.00'), currency='EUR') for index in range(7)
+        ])
+        # Même horodatage partout : seul l'id départage les lignes
+        Payment.objects.update(created_at=timezone.now())
+
+        seen = []
+        url = f"{reverse('payment-list')}?page_size=3"
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(row['id'] for row in page['results'])
+            url = page['next']
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen, sorted(map(str, Payment.objects.values_list('id', flat=True)), reverse=True))
+
+    def test_list_is_slim_and_filtered(self):
+        now = timezone.now()
+        Payment.objects.create(payment_id='PAYID-OLD', amount=Decimal('1.00'), currency='EUR', description='x' * 500)
+        Payment.objects.create(payment_id='PAYID-USD', amount=Decimal('2.00'), currency='USD')
+        Payment.objects.create(
+            payment_id='PAYID-DONE', amount=Decimal('3.00'), currency='EUR', status=Payment.Status.COMPLETED,
+        )
+        Payment.objects.filter(payment_id='PAYID-OLD').update(created_at=now - timedelta(days=10))
+
+        def ids(query):
+            response = self.client.get(f"{reverse('payment-list')}?{query}")
+            self.assertEqual(response.status_code, 200)
+            return {row['payment_id'] for row in response.json()['results']}
+
+        self.assertEqual(ids('currency=eur'), {'PAYID-OLD', 'PAYID-DONE'})
+        self.assertEqual(ids('status=completed'), {'PAYID-DONE'})
+        self.assertEqual(ids(f'created_before={(now - timedelta(days=1)).date()}'), {'PAYID-OLD'})
+        self.assertEqual(self.client.get(f"{reverse('payment-list')}?status=nope").status_code, 400)
+        row = self.client.get(reverse('payment-list')).json()['results'][0]
+        self.assertEqual(set(row), {'id', 'payment_id', 'amount', 'currency', 'status', 'created_at'})
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get(f"{reverse('payment-list')}?cursor=bm9wZQ==").status_code, 404)
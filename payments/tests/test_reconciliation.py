@@ -0,0 +1,91 @@
+import csv
+import io
+import os
+import tempfile
+from decimal import Decimal
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from payments.exceptions import ReconciliationError
+from payments.models import Payment, PaymentRefund
+from payments.reconciliation import read_ledger, read_report, reconcile
+
+
+class ReconciliationTests(TestCase):
+
+    def write_report(self, rows, header=('payment_id', 'amount', 'currency', 'status')):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+        return path
+
+    def payment(self, payment_id, amount='10.00', status=Payment.Status.COMPLETED, currency='EUR'):
+        return Payment.objects.create(payment_id=payment_id, amount=Decimal(amount), currency=currency, status=status)
+
+    def mismatches(self, path):
+        return {(m.payment_id, m.kind) for m in reconcile(read_report(path), read_ledger())}
+
+    def test_matching_report_has_no_mismatch(self):
+        refunded = self.payment('PAYID-A', status=Payment.Status.PARTIALLY_REFUNDED)
+        PaymentRefund.objects.create(payment=refunded, amount=Decimal('4.00'), refund_id='R-1')
+        self.payment('PAYID-B', '5.00')
+        path = self.write_report([
+            ('PAYID-A', '10.00', 'EUR', 'S'), ('PAYID-A', '-4.00', 'EUR', 'S'), ('PAYID-B', '5.00', 'EUR', 'Success'),
+        ])
+
+        self.assertEqual(self.mismatches(path), set())
+
+    def test_reports_every_kind_of_drift(self):
+        self.payment('PAYID-A', '10.00')
+        self.payment('PAYID-B', '5.00', currency='USD')
+        self.payment('PAYID-C', '5.00', status=Payment.Status.FAILED)
+        self.payment('PAYID-E', '1.00')
+        path = self.write_report([
+            ('PAYID-A', '12.00', 'EUR', 'S'), ('PAYID-A', '-1.00', 'EUR', 'S'),
+            ('PAYID-B', '5.00', 'EUR', 'S'),
+            ('PAYID-C', '5.00', 'EUR', 'S'),
+            ('PAYID-D', '3.00', 'EUR', 'S'),
+        ])
+
+        self.assertEqual(self.mismatches(path), {
+            ('PAYID-A', 'amount_drift'), ('PAYID-A', 'refund_drift'),
+            ('PAYID-B', 'currency_drift'),
+            ('PAYID-C', 'status_drift'),
+            ('PAYID-D', 'missing_in_db'),
+            ('PAYID-E', 'missing_in_report'),
+        })
+
+    def test_expired_payment_matches_a_failed_report_line(self):
+        self.payment('PAYID-A', status=Payment.Status.EXPIRED)
+        self.payment('PAYID-B', status=Payment.Status.EXPIRED)
+        path = self.write_report([('PAYID-A', '10.00', 'EUR', 'D'), ('PAYID-B', '10.00', 'EUR', 'S')])
+
+        self.assertEqual(self.mismatches(path), {('PAYID-B', 'status_drift')})
+
+    def test_unsorted_report_is_refused(self):
+        path = self.write_report([('PAYID-B', '1', 'EUR', 'S'), ('PAYID-A', '1', 'EUR', 'S')])
+        with self.assertRaises(ReconciliationError):
+            list(read_report(path))
+
+    def test_command_writes_mismatches_and_maps_columns(self):
+        self.payment('PAYID-A', '10.00')
+        path = self.write_report(
+            [('PAYID-A', '900', 'EUR', 'S')], header=('Transaction ID', 'Gross', 'Currency', 'Status'),
+        )
+        output = path + '.out'
+        self.addCleanup(os.remove, output)
+        call_command(
+            'reconcile', path, '--key-column', 'Transaction ID', '--amount-column', 'Gross',
+            '--currency-column', 'Currency', '--status-column', 'Status', '--amount-in-cents',
+            '--output', output, stderr=io.StringIO(),
+        )
+
+        with open(output, newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows, [['payment_id', 'kind', 'expected', 'actual'], ['PAYID-A', 'amount_drift', '9', '10.00']])
+        with self.assertRaises(CommandError):
+            call_command('reconcile', path, '--output', output, stderr=io.StringIO())
@@ -0,0 +1,91 @@
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from payments import replicas
+from payments.tests.base import TEST_CACHES, FakePayPalMixin
+
+
+def replica_settings(**config):
+    return override_settings(
+        CACHES=TEST_CACHES,
+        PAYMENTS_DB_REPLICAS={**settings.PAYMENTS_DB_REPLICAS, 'ALIASES': ['replica_0'], **config},
+    )
+
+
+def current_alias():
+    return replicas._read_alias.get()
+
+
+@replica_settings()
+class ReadRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        replicas.monitor = replicas.LagMonitor()
+        self.addCleanup(setattr, replicas, 'monitor', replicas.LagMonitor())
+
+    def set_lag(self, lag):
+        replicas.monitor._lags['replica_0'] = (time.monotonic(), lag)
+
+    def test_router_reads_on_the_chosen_alias_and_writes_on_primary(self):
+        router = replicas.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(None))
+        with replicas.using('replica_0'):
+            self.assertEqual(router.db_for_read(None), 'replica_0')
+            self.assertEqual(router.db_for_write(None), DEFAULT_DB_ALIAS)
+
+    def test_read_alias_skips_lagging_replicas_and_pinned_clients(self):
+        self.set_lag(0.5)
+        self.assertEqual(replicas.read_alias(), 'replica_0')
+
+        request = RequestFactory().get('/', HTTP_COOKIE=f'{replicas.PIN_COOKIE}=1')
+        self.assertEqual(replicas.read_alias(request), DEFAULT_DB_ALIAS)
+
+        self.set_lag(30.0)
+        self.assertEqual(replicas.read_alias(), DEFAULT_DB_ALIAS)
+
+        with replica_settings(ALIASES=[]):
+            self.assertEqual(replicas.read_alias(), DEFAULT_DB_ALIAS)
+
+    def test_unreachable_replica_counts_as_lagging(self):
+        with mock.patch.object(replicas, '_measure', side_effect=ConnectionError('down')) as measure:
+            self.assertEqual(replicas.monitor.lag('replica_0'), float('inf'))
+            replicas.monitor.lag('replica_0')
+        # Mesure gardée LAG_CHECK_INTERVAL secondes
+        self.assertEqual(measure.call_count, 1)
+
+    def test_fresh_read_falls_back_to_primary(self):
+        with replicas.using('replica_0'):
+            self.assertEqual(replicas.fresh_read(current_alias), 'replica_0')
+
+            # Ligne pas encore répliquée : relue sur le primaire
+            aliases = []
+            replicas.fresh_read(lambda: aliases.append(current_alias()))
+            self.assertEqual(aliases, ['replica_0', DEFAULT_DB_ALIAS])
+
+            # Paiement écrit à l'instant : directement sur le primaire
+            replicas.pin('PK-1')
+            self.assertEqual(replicas.fresh_read(current_alias, pk='PK-1'), DEFAULT_DB_ALIAS)
+
+
+@replica_settings()
+class ReplicaPinningTests(FakePayPalMixin, TestCase):
+
+    def test_successful_write_pins_the_client_to_primary(self):
+        response = self.client.get(reverse('payment-list'))
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+        response = self.client.post(reverse('payment-list'), {'amount': '10.00', 'description': 'Test'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_failed_write_does_not_pin(self):
+        response = self.client.post(reverse('payment-list'), {'amount': '-5'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
@@ -0,0 +1,63 @@
+import time
+
+import httpx
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from payments import resilience
+from payments.exceptions import PayPalAPIError
+from payments.tests.base import FakePayPalMixin
+
+
+class AsyncResilienceTests(FakePayPalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        resilience._breakers.clear()
+        resilience._retry_budget = None
+
+    async def create(self):
+        return await self.async_client.post(
+            reverse('async-payment-create'), {'amount': '10.00', 'description': 'Test'}, content_type='application/json',
+        )
+
+    async def test_server_errors_are_retried(self):
+        self.paypal.error_rate, self.paypal.error_status = 1.0, 503
+
+        response = await self.create()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.paypal.requests['create'], 3)
+        self.assertEqual(resilience.get_breaker('create').state(), 'closed')
+
+    async def test_open_breaker_answers_503_without_calling_paypal(self):
+        resilience.get_breaker('create').record_failure(probe=True)
+
+        response = await self.create()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(self.paypal.requests['create'], 0)
+
+
+class RetryDelayTests(SimpleTestCase):
+
+    def setUp(self):
+        resilience._retry_budget = None
+
+    def test_execute_retry_must_fit_in_the_execute_lock(self):
+        error = httpx.ReadTimeout('timeout')
+        # Lecture de 30 s déjà écoulée : un second essai de 30 s dépasserait le verrou de 60 s
+        self.assertIsNone(resilience._retry_delay('execute', error, 1, time.monotonic() - 35, idempotent=True))
+        self.assertIsNotNone(resilience._retry_delay('execute', error, 1, time.monotonic(), idempotent=True))
+        self.assertIsNotNone(resilience._retry_delay('lookup', error, 1, time.monotonic() - 35, idempotent=True))
+
+    def test_unsafe_call_is_only_retried_before_connecting(self):
+        now = time.monotonic()
+        self.assertIsNone(resilience._retry_delay('create', httpx.ReadTimeout('timeout'), 1, now, idempotent=False))
+        self.assertIsNotNone(resilience._retry_delay('create', httpx.ConnectError('refused'), 1, now, idempotent=False))
+
+    def test_paypal_client_errors_are_not_transient(self):
+        self.assertTrue(resilience.is_transient(PayPalAPIError('', params={'status': 503})))
+        self.assertTrue(resilience.is_transient(PayPalAPIError('', params={'status': 429})))
+        self.assertFalse(resilience.is_transient(PayPalAPIError('', params={'status': 400})))
@@ -0,0 +1,69 @@
+import io
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from payments import rollups
+from payments.models import Payment, PaymentDailyRollup, PaymentRollupDelta
+
+
+class RollupTests(TestCase):
+
+    def save(self, amount, status=Payment.Status.PENDING, currency='EUR'):
+        payment = Payment(payment_id=f'PAYID-{amount}', amount=Decimal(amount), currency=currency, status=status)
+        rollups.save_payment(payment)
+        return payment
+
+    def totals(self, **filters):
+        return {row['status']: row for row in rollups.query(filters, ['status'])}
+
+    def test_writes_only_insert_deltas(self):
+        payment = self.save('10.00')
+        payment.status = Payment.Status.COMPLETED
+        rollups.save_payment(payment, Payment.Status.PENDING, update_fields=['status', 'updated_at'])
+
+        self.assertFalse(PaymentDailyRollup.objects.exists())
+        self.assertEqual(PaymentRollupDelta.objects.count(), 3)
+        totals = self.totals()
+        self.assertEqual(totals[Payment.Status.PENDING]['payments'], 0)
+        self.assertEqual(totals[Payment.Status.COMPLETED]['payments'], 1)
+        self.assertEqual(totals[Payment.Status.COMPLETED]['amount'], Decimal('10.00'))
+
+    def test_fold_moves_deltas_into_daily_rows(self):
+        self.save('10.00')
+        self.save('5.00')
+        self.save('7.00', currency='USD')
+        before = rollups.query()
+
+        self.assertEqual(rollups.fold(batch_size=2), 3)
+
+        self.assertFalse(PaymentRollupDelta.objects.exists())
+        row = PaymentDailyRollup.objects.get(currency='EUR', status=Payment.Status.PENDING)
+        self.assertEqual((row.payment_count, row.amount_total), (2, Decimal('15.00')))
+        self.assertEqual(rollups.query(), before)
+        self.assertEqual(rollups.fold(), 0)
+
+    def test_query_adds_pending_deltas_to_folded_rows(self):
+        self.save('10.00')
+        call_command('fold_rollups', stdout=io.StringIO())
+        self.save('2.50')
+
+        [row] = rollups.query({'currency': 'EUR'}, [])
+        self.assertEqual((row['payments'], row['amount']), (2, Decimal('12.50')))
+
+        response = self.client.get(reverse('payment-analytics'), {'group_by': 'currency'})
+        self.assertEqual(response.json()['results'], [
+            {'currency': 'EUR', 'payments': 2, 'amount': '12.50', 'refunds': 0, 'refunded': '0.00'},
+        ])
+
+    def test_rebuild_discards_pending_deltas(self):
+        self.save('10.00')
+        today = timezone.localdate()
+
+        rollups.rebuild(since=today)
+
+        self.assertFalse(PaymentRollupDelta.objects.exists())
+        self.assertEqual(self.totals()[Payment.Status.PENDING]['payments'], 1)
@@ -0,0 +1,40 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from payments.models import Payment
+from payments.tests.base import FakePayPalMixin
+
+
+class SaleDetailsTests(FakePayPalMixin, TestCase):
+
+    def test_execute_stores_sale_details(self):
+        payment = self.executed_payment('12.00')
+
+        self.assertTrue(payment.sale_id)
+        self.assertEqual(payment.sale_state, 'completed')
+        self.assertEqual(payment.captured_amount, Decimal('12.00'))
+        self.assertEqual(payment.paypal_snapshot['payer_id'], 'BUYER')
+        self.assertEqual(payment.paypal_snapshot['sale']['id'], payment.sale_id)
+
+    def test_refund_goes_straight_to_the_sale(self):
+        payment = self.executed_payment()
+        self.paypal.requests.clear()
+
+        self.service.refund_payment(payment.payment_id, Decimal('4.00'))
+
+        self.assertEqual(self.paypal.requests['lookup'], 0)
+        self.assertEqual(self.paypal.requests['refund'], 1)
+        self.assertEqual(self.paypal.sales[payment.sale_id]['refunded'], Decimal('4.00'))
+
+    def test_missing_sale_id_is_backfilled_once(self):
+        payment = self.executed_payment()
+        sale_id = payment.sale_id
+        Payment.objects.filter(pk=payment.pk).update(sale_id=None)
+        self.paypal.requests.clear()
+
+        self.service.refund_payment(payment.payment_id, Decimal('1.00'))
+        self.service.refund_payment(payment.payment_id, Decimal('1.00'))
+
+        self.assertEqual(self.paypal.requests['lookup'], 1)
+        self.assertEqual(Payment.objects.get(pk=payment.pk).sale_id, sale_id)
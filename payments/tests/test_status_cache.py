@@ -0,0 +1,52 @@
+import time
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from payments import status_cache
+from payments.models import Payment
+from payments.tests.base import TEST_CACHES
+
+
+@override_settings(CACHES=TEST_CACHES)
+class StatusCacheTests(TestCase):
+
+    def setUp(self):
+        caches['payments'].clear()
+        self.shared = caches['payments_status']
+        self.shared.clear()
+        status_cache._local = status_cache._aliases = None
+        self.payment = Payment.objects.create(payment_id='PAYID-S', amount=Decimal('10.00'))
+
+    def expiry(self, key):
+        return self.shared._expire_info[self.shared.make_key(key)]
+
+    def test_keys_live_in_their_own_alias_with_bounded_lifetime(self):
+        self.assertEqual(status_cache.get_payment('PAYID-S')['id'], str(self.payment.pk))
+
+        version_key = status_cache._version_key(self.payment.pk)
+        self.assertIsNone(caches['payments'].get(version_key))
+        for key in (version_key, f'{status_cache.PREFIX}:paypal:PAYID-S'):
+            self.assertIsNotNone(self.shared.get(key))
+            self.assertLessEqual(self.expiry(key), time.time() + 24 * 3600)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            status_cache.invalidate(self.payment.pk)
+        self.assertLessEqual(self.expiry(version_key), time.time() + 24 * 3600)
+
+    def test_invalidation_and_evicted_version_reload_from_database(self):
+        status_cache.get_payment(self.payment.pk)
+        self.assertEqual(status_cache.get_payment(self.payment.pk)['status'], Payment.Status.PENDING)
+
+        Payment.objects.filter(pk=self.payment.pk).update(status=Payment.Status.COMPLETED)
+        with self.captureOnCommitCallbacks(execute=True):
+            status_cache.invalidate(self.payment.pk)
+        self.assertEqual(status_cache.get_payment(self.payment.pk)['status'], Payment.Status.COMPLETED)
+
+        # Clé de version évincée : nouveau jeton, relecture en base plutôt qu'une copie périmée
+        Payment.objects.filter(pk=self.payment.pk).update(status=Payment.Status.REFUNDED)
+        self.shared.delete(status_cache._version_key(self.payment.pk))
+        database_reads = status_cache.stats()['database']
+        self.assertEqual(status_cache.get_payment(self.payment.pk)['status'], Payment.Status.REFUNDED)
+        self.assertEqual(status_cache.stats()['database'], database_reads + 1)
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import time
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from payments import status_cache, subscriptions
+from payments.models import Payment
+from payments.tests.base import TEST_CACHES
+
+
+def sse_events(body):
+    return [
+        dict(line.split(': ', 1) for line in block.splitlines())
+        for block in body.strip().split('\n\n') if block.startswith('event:')
+    ]
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    PAYMENTS_SUBSCRIPTIONS={**settings.PAYMENTS_SUBSCRIPTIONS, 'POLL_INTERVAL': 5.0, 'SSE_TIMEOUT': 5.0},
+)
+class StatusSubscriptionTests(TestCase):
+
+    def setUp(self):
+        caches['payments_status'].clear()
+        status_cache._local = status_cache._aliases = None
+        self.payment = Payment.objects.create(payment_id='PAYID-W', amount=Decimal('10.00'))
+        self.url = reverse('async-payment-status', args=['PAYID-W'])
+
+    def complete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.filter(pk=self.payment.pk).update(status=Payment.Status.COMPLETED)
+            status_cache.invalidate(self.payment.pk)
+
+    async def complete_later(self, delay=0.1):
+        await asyncio.sleep(delay)
+        await sync_to_async(self.complete)()
+
+    async def test_long_poll_returns_current_state_without_waiting(self):
+        response = await self.async_client.get(self.url, {'timeout': '0'})
+        self.assertEqual(response.json()['status'], Payment.Status.PENDING)
+
+        await sync_to_async(self.complete)()
+        start = time.monotonic()
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.json()['status'], Payment.Status.COMPLETED)
+        self.assertLess(time.monotonic() - start, 1)
+
+    async def test_long_poll_is_woken_by_the_write(self):
+        start = time.monotonic()
+        response, _ = await asyncio.gather(self.async_client.get(self.url, {'timeout': '5'}), self.complete_later())
+
+        self.assertEqual(response.json()['status'], Payment.Status.COMPLETED)
+        # Réveil par notify(), sans attendre POLL_INTERVAL
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertFalse(subscriptions._waiters)
+
+    async def test_sse_streams_changes_until_final_status(self):
+        response = await self.async_client.get(self.url, headers={'Accept': 'text/event-stream'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        async def read():
+            return ''.join([chunk.decode() if isinstance(chunk, bytes) else chunk
+                            async for chunk in response.streaming_content])
+
+        body, _ = await asyncio.gather(read(), self.complete_later())
+
+        statuses = [json.loads(event['data'])['status'] for event in sse_events(body)]
+        self.assertEqual(statuses, [Payment.Status.PENDING, Payment.Status.COMPLETED])
+
+    async def test_unknown_payment(self):
+        response = await self.async_client.get(reverse('async-payment-status', args=['PAYID-NONE']))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,56 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import requests
+from django.test import TestCase
+from django.utils import timezone
+
+from payments import sweeper
+from payments.models import Payment
+from payments.tests.base import FakePayPalMixin
+
+
+class SweeperTests(FakePayPalMixin, TestCase):
+
+    def pending(self, age=timedelta(hours=4)):
+        created = self.service.create_payment(Decimal('10.00'), 'Test', None, None)
+        Payment.objects.filter(payment_id=created['payment_id']).update(created_at=timezone.now() - age)
+        return created['payment_id']
+
+    def status(self, payment_id):
+        return Payment.objects.get(payment_id=payment_id).status
+
+    def test_resolves_old_pending_payments_from_paypal(self):
+        abandoned = self.pending()
+        approved = self.pending()
+        # Exécuté chez PayPal, réponse perdue : le balayage reprend payeur et vente
+        requests.post(f'{self.paypal.url}/v1/payments/payment/{approved}/execute', json={'payer_id': 'BUYER'}, timeout=5)
+        unknown = Payment.objects.create(payment_id='PAYID-GONE', amount=Decimal('5.00'))
+        Payment.objects.filter(pk=unknown.pk).update(created_at=timezone.now() - timedelta(hours=4))
+        recent = self.pending(age=timedelta(minutes=5))
+
+        totals = sweeper.sweep(min_age=3 * 3600, max_rate=0)
+
+        self.assertEqual(self.status(abandoned), Payment.Status.EXPIRED)
+        self.assertEqual(self.status('PAYID-GONE'), Payment.Status.EXPIRED)
+        self.assertEqual(self.status(recent), Payment.Status.PENDING)
+        payment = Payment.objects.get(payment_id=approved)
+        self.assertEqual((payment.status, payment.payer_id), (Payment.Status.COMPLETED, 'BUYER'))
+        self.assertTrue(payment.sale_id)
+        self.assertEqual((totals['expired'], totals['completed'], totals['paypal_calls']), (2, 1, 3))
+
+    def test_dry_run_changes_nothing(self):
+        payment_id = self.pending()
+
+        totals = sweeper.sweep(min_age=3 * 3600, max_rate=0, dry_run=True)
+
+        self.assertEqual(totals['expired'], 1)
+        self.assertEqual(self.status(payment_id), Payment.Status.PENDING)
+
+    def test_payment_executed_meanwhile_is_skipped(self):
+        payment_id = self.pending()
+        payment = Payment.objects.get(payment_id=payment_id)
+        Payment.objects.filter(pk=payment.pk).update(status=Payment.Status.COMPLETED)
+
+        self.assertEqual(sweeper._apply([(payment, Payment.Status.EXPIRED)]), [])
+        self.assertEqual(self.status(payment_id), Payment.Status.COMPLETED)
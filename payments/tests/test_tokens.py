@@ -0,0 +1,57 @@
+import time
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from payments.tests.base import FakePayPalMixin, run_concurrently
+from payments.tokens import TokenManager, get_token_manager
+
+
+class TokenManagerTests(FakePayPalMixin, SimpleTestCase):
+
+    def manager(self, **kwargs):
+        return TokenManager('client', 'secret', self.paypal.url, **kwargs)
+
+    def test_workers_share_one_token_fetch(self):
+        # Un TokenManager par « worker » : seul le cache partagé les relie
+        managers = [self.manager() for _ in range(4)]
+
+        tokens = run_concurrently(lambda manager: manager.get_token()['access_token'], *[(m,) for m in managers])
+
+        self.assertEqual(len(set(tokens)), 1, tokens)
+        self.assertEqual(self.paypal.requests['token'], 1)
+
+    def test_local_memo_avoids_cache_reads(self):
+        manager = self.manager()
+        token = manager.get_token()
+        caches['payments'].clear()
+
+        self.assertEqual(manager.get_token(), token)
+        self.assertEqual(self.paypal.requests['token'], 1)
+
+    def test_token_near_expiry_is_refreshed_in_background(self):
+        manager = self.manager(refresh_margin=60)
+        stale = {'access_token': 'OLD', 'token_type': 'Bearer', 'expires_at': time.time() + 30}
+        caches['payments'].set(manager.cache_key, stale)
+
+        self.assertEqual(manager.get_token()['access_token'], 'OLD')
+        deadline = time.monotonic() + 5
+        while manager._refreshing.is_set() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertNotEqual(caches['payments'].get(manager.cache_key)['access_token'], 'OLD')
+        self.assertEqual(self.paypal.requests['token'], 1)
+
+    def test_invalidate_drops_revoked_token(self):
+        manager = self.manager()
+        revoked = manager.get_token()['access_token']
+
+        manager.invalidate(revoked)
+
+        self.assertIsNone(manager.peek())
+        self.assertNotEqual(manager.get_token()['access_token'], revoked)
+        self.assertEqual(self.paypal.requests['token'], 2)
+
+    def test_managers_are_per_client_and_endpoint(self):
+        sandbox = get_token_manager('client-a', 'secret', 'sandbox')
+        self.assertIs(get_token_manager('client-a', 'secret', 'sandbox'), sandbox)
+        self.assertIsNot(get_token_manager('client-b', 'secret', 'sandbox'), sandbox)
@@ -0,0 +1,41 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from payments.tests.base import FakePayPalMixin
+from payments.transport import PooledTransport, get_transport, paypal_operation
+
+
+class PooledTransportTests(FakePayPalMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.transport = PooledTransport(timeouts={'lookup': (1.0, 2.0)}, default_timeout=7.0)
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            response = self.transport.request('POST', f'{self.paypal.url}/v1/oauth2/token', operation='token')
+            self.assertEqual(response.status_code, 200)
+
+        [pool] = self.transport.stats()['pools']
+        self.assertEqual(pool['connections_opened'], 1)
+        self.assertEqual(pool['requests'], 5)
+        self.assertEqual(self.transport.stats()['operations']['token']['calls'], 5)
+
+    def test_timeout_follows_current_operation(self):
+        with mock.patch.object(self.transport.session, 'request') as request:
+            request.return_value.status_code = 200
+            with paypal_operation('lookup'):
+                self.transport.request('GET', f'{self.paypal.url}/v1/payments/payment/PAYID-1')
+            self.transport.request('GET', f'{self.paypal.url}/v1/payments/payment/PAYID-1')
+
+        self.assertEqual([call.kwargs['timeout'] for call in request.call_args_list], [(1.0, 2.0), 7.0])
+        self.assertEqual(set(self.transport.stats()['operations']), {'lookup', 'other'})
+
+    def test_sdk_calls_go_through_the_pool(self):
+        created = self.service.create_payment(10, 'Test', None, None)
+        self.service.execute_payment(created['payment_id'], 'BUYER')
+
+        operations = get_transport().stats()['operations']
+        self.assertGreaterEqual(operations['create']['calls'], 1)
+        self.assertGreaterEqual(operations['execute']['calls'], 1)
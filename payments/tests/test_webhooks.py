@@ -0,0 +1,150 @@
+import base64
+import tempfile
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from payments.models import Payment, PaymentRefund, WebhookEvent
+from payments.webhooks import process_pending_events, record_event
+
+
+class WebhookSignatureTests(TestCase):
+    WEBHOOK_ID = 'WH-TEST-0001'
+
+    @classmethod
+    def setUpClass(cls):
+        # Certificat auto-signé local à la place du certificat PayPal (PAYPAL_WEBHOOK_CERT_PATH)
+        cls.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'messageverificationcerts.paypal.test')])
+        now = datetime.now(dt_timezone.utc)
+        certificate = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(cls.key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=1))
+            .sign(cls.key, hashes.SHA256())
+        )
+        cert_file = tempfile.NamedTemporaryFile(suffix='.pem')
+        cert_file.write(certificate.public_bytes(serialization.Encoding.PEM))
+        cert_file.flush()
+        cls.addClassCleanup(cert_file.close)
+        overrides = override_settings(PAYPAL_CONFIG={
+            **settings.PAYPAL_CONFIG,
+            'PAYPAL_WEBHOOK_ID': cls.WEBHOOK_ID,
+            'PAYPAL_WEBHOOK_CERT_PATH': cert_file.name,
+            'PAYPAL_WEBHOOK_TOLERANCE': 300,
+        })
+        overrides.enable()
+        cls.addClassCleanup(overrides.disable)
+        super().setUpClass()
+
+    def signed_headers(self, body, transmission_time=None):
+        transmission_id = str(uuid.uuid4())
+        transmission_time = (transmission_time or timezone.now()).isoformat()
+        message = f'{transmission_id}|{transmission_time}|{self.WEBHOOK_ID}|{zlib.crc32(body)}'
+        signature = self.key.sign(message.encode('utf-8'), padding.PKCS1v15(), hashes.SHA256())
+        return {
+            'HTTP_PAYPAL_TRANSMISSION_ID': transmission_id,
+            'HTTP_PAYPAL_TRANSMISSION_TIME': transmission_time,
+            'HTTP_PAYPAL_TRANSMISSION_SIG': base64.b64encode(signature).decode('ascii'),
+            'HTTP_PAYPAL_AUTH_ALGO': 'SHA256withRSA',
+            'HTTP_PAYPAL_CERT_URL': 'https://api.paypal.com/v1/notifications/certs/CERT-TEST',
+        }
+
+    def post(self, body, headers):
+        return self.client.post(reverse('paypal-webhook'), body, content_type='application/json', **headers)
+
+    def event_body(self, total='10.00'):
+        return (
+            '{"id": "WH-EVT-1", "event_type": "PAYMENT.SALE.COMPLETED", "resource_type": "sale", '
+            f'"resource": {{"id": "SALE-1", "parent_payment": "PAYID-1", "amount": {{"total": "{total}"}}}}}}'
+        ).encode('utf-8')
+
+    def test_valid_signature_is_recorded(self):
+        body = self.event_body()
+        response = self.post(body, self.signed_headers(body))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(WebhookEvent.objects.filter(event_id='WH-EVT-1').exists())
+
+    def test_tampered_body_is_rejected(self):
+        headers = self.signed_headers(self.event_body('10.00'))
+        response = self.post(self.event_body('9999.00'), headers)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_replay_outside_tolerance_is_rejected(self):
+        body = self.event_body()
+        response = self.post(body, self.signed_headers(body, timezone.now() - timedelta(hours=1)))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_non_object_body_is_rejected(self):
+        body = b'[{"id": "WH-EVT-1"}]'
+        response = self.post(body, self.signed_headers(body))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+
+class WebhookProcessingTests(TestCase):
+
+    def setUp(self):
+        self.payment = Payment.objects.create(payment_id='PAYID-1', amount=Decimal('10.00'), currency='EUR')
+        self.sequence = 0
+
+    def deliver(self, event_type, resource):
+        self.sequence += 1
+        event = {
+            'id': f'WH-EVT-{self.sequence}', 'event_type': event_type, 'resource_type': 'sale',
+            'resource': {'parent_payment': 'PAYID-1', **resource},
+        }
+        record_event(event)
+        return event
+
+    def test_sale_completed_then_late_denied(self):
+        self.deliver('PAYMENT.SALE.COMPLETED', {'id': 'SALE-1', 'state': 'completed'})
+        self.deliver('PAYMENT.SALE.DENIED', {'id': 'SALE-1', 'state': 'denied'})
+
+        self.assertEqual(process_pending_events(), 2)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.Status.COMPLETED)
+        self.assertEqual(self.payment.sale_id, 'SALE-1')
+        self.assertEqual(
+            list(WebhookEvent.objects.order_by('event_id').values_list('status', flat=True)),
+            [WebhookEvent.Status.PROCESSED, WebhookEvent.Status.IGNORED],
+        )
+
+    def test_redelivered_refund_is_counted_once(self):
+        Payment.objects.filter(pk=self.payment.pk).update(status=Payment.Status.COMPLETED)
+        refund = {'id': 'REFUND-1', 'sale_id': 'SALE-1', 'amount': {'total': '-4.00'}}
+        self.deliver('PAYMENT.SALE.REFUNDED', refund)
+        process_pending_events()
+        self.deliver('PAYMENT.SALE.REFUNDED', refund)
+        process_pending_events()
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.refunded_amount, Decimal('4.00'))
+        self.assertEqual(self.payment.status, Payment.Status.PARTIALLY_REFUNDED)
+        self.assertEqual(PaymentRefund.objects.filter(refund_id='REFUND-1').count(), 1)
+
+    def test_duplicate_delivery_is_stored_once_and_unknown_payment_ignored(self):
+        event = {'id': 'WH-DUP', 'event_type': 'PAYMENT.SALE.COMPLETED', 'resource': {'parent_payment': 'PAYID-X'}}
+        self.assertTrue(record_event(event)[1])
+        self.assertFalse(record_event(event)[1])
+
+        process_pending_events()
+        self.assertEqual(WebhookEvent.objects.get(event_id='WH-DUP').status, WebhookEvent.Status.IGNORED)
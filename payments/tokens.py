@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from payments.exceptions import PayPalAPIError
+from payments.transport import PooledApi, get_transport, paypal_endpoint
+
+logger = logging.getLogger(__name__)
+
+
+class TokenManager:
+    """Token OAuth PayPal partagé entre workers via le cache `payments`.
+
+    - mémo local par processus pour éviter un aller-retour cache par appel ;
+    - rafraîchissement en tâche de fond quand le token entre dans la marge d'expiration ;
+    - verrou single-flight (cache.add) : un seul worker interroge /v1/oauth2/token à la fois.
+    """
+
+    TOKEN_PATH = '/v1/oauth2/token'
+    LOCK_TIMEOUT = 30
+    WAIT_INTERVAL = 0.05
+
+    def __init__(self, client_id, client_secret, endpoint, refresh_margin=300, transport=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.endpoint = endpoint
+        self.refresh_margin = refresh_margin
+        self.transport = transport or get_transport()
+        # Un même client_id peut exister en sandbox et en live : tokens distincts
+        self.cache_key = f'paypal:token:{endpoint}:{client_id}'
+        self.lock_key = f'{self.cache_key}:lock'
+        self._local = None
+        self._local_lock = threading.Lock()
+        self._refreshing = threading.Event()
+
+    @property
+    def cache(self):
+        return caches['payments']
+
+    def _fetch(self):
+        response = self.transport.request(
+            'POST',
+            self.endpoint.rstrip('/') + self.TOKEN_PATH,
+            operation='token',
+            data={'grant_type': 'client_credentials'},
+            auth=(self.client_id, self.client_secret),
+            headers={'Accept': 'application/json'},
+        )
+        if response.status_code != 200:
+            raise PayPalAPIError(
+                "Impossible d'obtenir un token PayPal",
+                code='paypal_auth_failed',
+                params={'status': response.status_code},
+            )
+        data = response.json()
+        return {
+            'access_token': data['access_token'],
+            'token_type': data.get('token_type', 'Bearer'),
+            'expires_at': time.time() + int(data.get('expires_in', 0)),
+        }
+
+    def _store(self, token):
+        self.cache.set(self.cache_key, token, timeout=max(int(token['expires_at'] - time.time()), 1))
+        self._local = token
+
+    def _refresh(self, wait=True):
+        """Récupère un nouveau token si aucun autre worker ne le fait déjà."""
+        if self.cache.add(self.lock_key, 1, timeout=self.LOCK_TIMEOUT):
+            try:
+                token = self._fetch()
+                self._store(token)
+                logger.info("Token PayPal rafraîchi (expire dans %ds)", token['expires_at'] - time.time())
+                return token
+            finally:
+                self.cache.delete(self.lock_key)
+
+        if not wait:
+            return None
+        # Un autre worker rafraîchit : on attend qu'il publie le token
+        deadline = time.monotonic() + self.LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(self.WAIT_INTERVAL)
+            token = self.cache.get(self.cache_key)
+            if self._usable(token):
+                self._local = token
+                return token
+            if self.cache.get(self.lock_key) is None:
+                return self._refresh(wait=wait)
+        raise PayPalAPIError("Délai dépassé en attente du token PayPal", code='paypal_auth_timeout')
+
+    def _background_refresh(self):
+        try:
+            self._refresh(wait=False)
+        except Exception as e:
+            logger.warning("Rafraîchissement anticipé du token PayPal échoué: %s", e)
+        finally:
+            self._refreshing.clear()
+
+    @staticmethod
+    def _usable(token):
+        return token is not None and token['expires_at'] - time.time() > 5
+
+    def _needs_refresh(self, token):
+        return token['expires_at'] - time.time() < self.refresh_margin
+
+    def peek(self):
+        """Token du mémo local s'il est encore loin de l'expiration, sinon None (sans I/O)."""
+        token = self._local
+        if token is not None and not self._needs_refresh(token):
+            return token
+        return None
+
+    def get_token(self):
+        token = self.peek()
+        if token is not None:
+            return token
+
+        token = self.cache.get(self.cache_key)
+        if not self._usable(token):
+            with self._local_lock:
+                token = self.cache.get(self.cache_key)
+                if not self._usable(token):
+                    return self._refresh()
+
+        self._local = token
+        if self._needs_refresh(token) and not self._refreshing.is_set():
+            # Encore valide : on le sert et on en prépare un nouveau à côté
+            self._refreshing.set()
+            threading.Thread(target=self._background_refresh, daemon=True).start()
+        return token
+
+    def invalidate(self, access_token):
+        """Écarte un token refusé par PayPal (401), s'il est toujours celui en cache."""
+        cached = self.cache.get(self.cache_key)
+        if cached and cached['access_token'] == access_token:
+            self.cache.delete(self.cache_key)
+        if self._local and self._local['access_token'] == access_token:
+            self._local = None
+
+
+class CachedTokenApi(PooledApi):
+    """Api du SDK dont le token client_credentials vient du TokenManager partagé."""
+
+    def __init__(self, options=None, token_manager=None, **kwargs):
+        super().__init__(options, **kwargs)
+        self.token_manager = token_manager
+        self._issued_token = None
+
+    def get_token_hash(self, authorization_code=None, refresh_token=None, headers=None):
+        if authorization_code is not None or refresh_token is not None:
+            return super().get_token_hash(authorization_code, refresh_token, headers)
+
+        if self.token_hash is None and self._issued_token is not None:
+            # Le SDK vide token_hash après un 401 : le token est révoqué pour tous les workers
+            self.token_manager.invalidate(self._issued_token['access_token'])
+        self.token_hash = self.token_manager.get_token()
+        self._issued_token = self.token_hash
+        return self.token_hash
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_token_manager(client_id=None, client_secret=None, mode=None):
+    config = settings.PAYPAL_CONFIG
+    client_id = client_id or config['PAYPAL_CLIENT_ID']
+    endpoint = paypal_endpoint(mode)
+    with _managers_lock:
+        manager = _managers.get((client_id, endpoint))
+        if manager is None:
+            manager = TokenManager(
+                client_id=client_id,
+                client_secret=client_secret or config['PAYPAL_CLIENT_SECRET'],
+                endpoint=endpoint,
+                refresh_margin=config['PAYPAL_TOKEN_REFRESH_MARGIN'],
+            )
+            _managers[(client_id, endpoint)] = manager
+        elif client_secret and manager.client_secret != client_secret:
+            manager.client_secret = client_secret  # secret renouvelé pour le même client_id
+        return manager
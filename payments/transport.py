@@ -0,0 +1,148 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import paypalrestsdk
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from payments import metrics, resilience
+
+logger = logging.getLogger(__name__)
+
+# Opération PayPal en cours (create, execute, lookup, refund, token) : choisit les timeouts
+_current_operation = contextvars.ContextVar('paypal_operation', default=None)
+
+
+@contextmanager
+def paypal_operation(name):
+    token = _current_operation.set(name)
+    try:
+        yield
+    finally:
+        _current_operation.reset(token)
+
+
+def current_operation():
+    return _current_operation.get()
+
+
+def paypal_endpoint(mode=None):
+    """URL de base de l'API PayPal : PAYPAL_ENDPOINT si défini, sinon celle du mode (sandbox/live)."""
+    config = settings.PAYPAL_CONFIG
+    return config.get('PAYPAL_ENDPOINT') or paypalrestsdk.config.__endpoint_map__[mode or config['PAYPAL_MODE']]
+
+
+class PooledTransport:
+    """Session requests partagée : pool keep-alive dimensionné et timeouts par opération.
+
+    Les connexions TLS restent ouvertes dans le pool et sont réutilisées d'un
+    appel à l'autre, ce qui évite une poignée de main TCP + TLS par appel PayPal.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=20, pool_block=False, keep_alive=True,
+                 timeouts=None, default_timeout=30.0):
+        self.pool_maxsize = pool_maxsize
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+        self._counters = Counter()
+        self._durations = Counter()
+        self._lock = threading.Lock()
+
+    def timeout_for(self, operation):
+        return self.timeouts.get(operation, self.default_timeout)
+
+    def request(self, method, url, operation=None, **kwargs):
+        operation = operation or current_operation() or 'other'
+        kwargs.setdefault('timeout', self.timeout_for(operation))
+        start = time.perf_counter()
+        try:
+            with metrics.paypal_call(operation) as call:
+                response = self.session.request(method, url, **kwargs)
+                call.outcome = metrics.status_class(response.status_code)
+            return response
+        finally:
+            with self._lock:
+                self._counters[operation] += 1
+                self._durations[operation] += time.perf_counter() - start
+
+    def stats(self):
+        pools = []
+        manager = self.adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            idle = sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+            pools.append({
+                'host': f'{pool.scheme}://{pool.host}:{pool.port}',
+                'maxsize': self.pool_maxsize,
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+                'idle': idle,
+            })
+        with self._lock:
+            operations = {
+                name: {
+                    'calls': count,
+                    'avg_seconds': round(self._durations[name] / count, 4),
+                }
+                for name, count in self._counters.items()
+            }
+        return {'pools': pools, 'operations': operations}
+
+
+class PooledApi(paypalrestsdk.Api):
+    """Api du SDK qui passe par le PooledTransport au lieu de requests.request()."""
+
+    def __init__(self, options=None, transport=None, **kwargs):
+        super().__init__(options, **kwargs)
+        self.transport = transport or get_transport()
+
+    def http_call(self, url, method, **kwargs):
+        # GET, ou POST porteur d'un PayPal-Request-Id (ajouté par le SDK) : rejouable sans doublon
+        idempotent = method == 'GET' or 'PayPal-Request-Id' in (kwargs.get('headers') or {})
+        return resilience.call(
+            current_operation() or 'other',
+            lambda: self._http_call(url, method, **kwargs),
+            idempotent=idempotent,
+        )
+
+    def _http_call(self, url, method, **kwargs):
+        logger.info('Request[%s]: %s', method, url)
+        response = self.transport.request(method, url, proxies=self.proxies, **kwargs)
+        logger.info('Response[%d]: %s', response.status_code, response.reason)
+        return self.handle_response(response, response.content.decode('utf-8'))
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                config = settings.PAYPAL_CONFIG
+                _transport = PooledTransport(
+                    pool_connections=config['PAYPAL_POOL_CONNECTIONS'],
+                    pool_maxsize=config['PAYPAL_POOL_MAXSIZE'],
+                    pool_block=config['PAYPAL_POOL_BLOCK'],
+                    keep_alive=config['PAYPAL_KEEP_ALIVE'],
+                    timeouts=config['PAYPAL_TIMEOUTS'],
+                    default_timeout=config['PAYPAL_TIMEOUT'],
+                )
+    return _transport
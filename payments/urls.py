@@ -1,10 +1,19 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from payments.views import PaymentViewSet
+from payments.views import (
+    PaymentJobViewSet, PaymentViewSet, async_create_payment, async_execute_payment, async_payment_status,
+    async_refund_payment, paypal_webhook,
+)
 
 router = DefaultRouter()
 router.register(r'payments', PaymentViewSet)
+router.register(r'payment-jobs', PaymentJobViewSet, basename='payment-job')
 
 urlpatterns = [
+    path('api/async/payments/', async_create_payment, name='async-payment-create'),
+    path('api/async/payments/execute/', async_execute_payment, name='async-payment-execute'),
+    path('api/async/payments/<uuid:pk>/refund/', async_refund_payment, name='async-payment-refund'),
+    path('api/async/payments/<str:key>/status/', async_payment_status, name='async-payment-status'),
+    path('api/webhooks/paypal/', paypal_webhook, name='paypal-webhook'),
     path('api/', include(router.urls)),
 ]
\ No newline at end of file
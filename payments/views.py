@@ -1,33 +1,137 @@
 
-from rest_framework import viewsets, status
+import hmac
+import json
+import logging
+from contextlib import aclosing
+from datetime import datetime, time
+from time import monotonic
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from rest_framework import permissions, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from payments.async_services import AsyncPaymentService
+from payments import exports, jobs, merchants, metrics, replicas, resilience, rollups, status_cache, subscriptions
+from payments.idempotency import idempotent
+from payments.pagination import KeysetPagination
 from payments.services import PaymentService
-from payments.models import Payment, PaymentRefund
-from .serializers import PaymentSerializer, PaymentRefundSerializer
-from payments.exceptions import PaymentError
+from payments.transport import get_transport
+from payments.webhooks import record_event, verify_signature
+from payments.models import Payment, PaymentJob, PaymentRefund
+from .serializers import (
+    PaymentSerializer, PaymentListSerializer, PaymentRefundSerializer, PaymentJobSerializer, PaymentRollupSerializer
+)
+from payments.exceptions import PaymentError, PaymentValidationError, PayPalUnavailableError, WebhookVerificationError
+
+logger = logging.getLogger(__name__)
 
 
 class PaymentViewSet(viewsets.ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
+    pagination_class = KeysetPagination
     paypal_service = PaymentService()
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return PaymentListSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.filter(**self._list_filters()).only(*PaymentListSerializer.Meta.fields)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        with replicas.replica_reads(request):
+            return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, pk=None):
+        # Interrogé en boucle pendant l'approbation PayPal : servi par le cache de statut.
+        # `pk` accepte aussi le payment_id PayPal (PAYID-...).
+        with replicas.replica_reads(request):
+            data = status_cache.get_payment(pk)
+        if data is None:
+            return Response({'error': 'Paiement introuvable'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        status_cache.invalidate(serializer.instance.pk)
+
+    def perform_destroy(self, instance):
+        pk = instance.pk
+        super().perform_destroy(instance)
+        status_cache.invalidate(pk)
+
+    def _list_filters(self):
+        # Filtres alignés sur les index (status|currency, created_at, id)
+        params = self.request.query_params
+        filters = {}
+        payment_status = params.get('status')
+        if payment_status:
+            if payment_status not in Payment.Status.values:
+                raise ValidationError({'status': f'Statut inconnu: {payment_status}'})
+            filters['status'] = payment_status
+        currency = params.get('currency')
+        if currency:
+            filters['currency'] = currency.upper()
+        if params.get('merchant'):
+            filters['merchant__slug'] = params['merchant']
+        for param, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lt')):
+            if params.get(param):
+                filters[lookup] = _parse_moment(param, params[param])
+        return filters
+
+    def _wants_async(self, request):
+        prefer = request.headers.get('Prefer', '')
+        return settings.PAYMENTS_JOBS['ASYNC_BY_DEFAULT'] or 'respond-async' in prefer
+
+    def _accepted(self, job):
+        status_url = reverse('payment-job-detail', args=[job.pk], request=self.request)
+        return Response(
+            {'job_id': str(job.pk), 'status': job.status, 'status_url': status_url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': status_url}
+        )
     
+    @idempotent
     def create(self,request):
         try:
             amount = float(request.data.get('amount'))
             description = request.data.get('description', '')
+            merchant = merchants.get_merchant(request.data.get('merchant'))
+            if self._wants_async(request):
+                self.paypal_service._validate_payment(amount)
+                job = jobs.enqueue(PaymentJob.Kind.CREATE, {
+                    'amount': str(amount),
+                    'description': description,
+                    'merchant': merchant.slug if merchant else None,
+                })
+                return self._accepted(job)
             base_url = request.build_absolute_uri('/')[:-1]
             return_url = f'{base_url}/api/payments/execute/'
             cancel_url = f'{base_url}/api/payments/cancel/'
             payment = self.paypal_service.create_payment(
-                amount, description, return_url, cancel_url
+                amount, description, return_url, cancel_url, merchant=merchant
             )
             
             return Response(
                 payment, status=status.HTTP_200_OK
             )
+        except PayPalUnavailableError as e:
+            return _unavailable(e)
         except PaymentError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
@@ -35,33 +139,343 @@ class PaymentViewSet(viewsets.ModelViewSet):
 
 
     @action(detail=False, methods=['post'])
+    @idempotent
+    def batch(self, request):
+        specs = request.data.get('payments') if isinstance(request.data, dict) else request.data
+        if not isinstance(specs, list) or not specs or not all(isinstance(spec, dict) for spec in specs):
+            return Response({'error': 'Une liste de paiements est requise'}, status=status.HTTP_400_BAD_REQUEST)
+        max_items = settings.PAYPAL_CONFIG['PAYPAL_BATCH_MAX_ITEMS']
+        if len(specs) > max_items:
+            return Response(
+                {'error': f'Au plus {max_items} paiements par lot'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            merchant = merchants.get_merchant(request.data.get('merchant') if isinstance(request.data, dict) else None)
+            results = self.paypal_service.create_payments_batch(specs, merchant=merchant)
+        except PaymentError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response(
+            {'created': created, 'failed': len(results) - created, 'results': results},
+            status=status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        # ?output=csv|ndjson (le paramètre « format » est réservé par DRF), ?gzip=1
+        export_format = request.query_params.get('output', 'csv')
+        if export_format not in exports.FORMATS:
+            raise ValidationError({'output': f"Formats possibles: {', '.join(exports.FORMATS)}"})
+        compress = request.query_params.get('gzip') in ('1', 'true')
+
+        response = StreamingHttpResponse(
+            exports.stream_export(
+                export_format, compress, self._list_filters(), using=replicas.read_alias(request)
+            ),
+            content_type='application/gzip' if compress else exports.FORMATS[export_format],
+        )
+        filename = exports.export_filename(export_format, compress)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        # Lu dans PaymentDailyRollup et les deltas non repliés : ne parcourt jamais la table des paiements
+        params = request.query_params
+        group_by = [field for field in params.get('group_by', 'day,currency,status').split(',') if field]
+        unknown = set(group_by) - set(rollups.GROUP_FIELDS)
+        if unknown:
+            raise ValidationError({'group_by': f"Champs possibles: {', '.join(rollups.GROUP_FIELDS)}"})
+        filters = {}
+        for param, lookup in (('since', 'day__gte'), ('until', 'day__lt')):
+            if params.get(param):
+                day = parse_date(params[param])
+                if day is None:
+                    raise ValidationError({param: 'Date invalide (AAAA-MM-JJ)'})
+                filters[lookup] = day
+        if params.get('currency'):
+            filters['currency'] = params['currency'].upper()
+        if params.get('status'):
+            filters['status'] = params['status']
+        with replicas.replica_reads(request):
+            serializer = PaymentRollupSerializer(rollups.query(filters, group_by), many=True)
+            return Response({'results': serializer.data})
+
+    @action(detail=False, methods=['post'])
+    @idempotent
     def execute(self, request):
         try:
             payment_id = request.data.get('payment_id')
             payer_id = request.data.get('payer_id')
+            # Déjà sérialisé : le résultat est partagé entre les appels regroupés
             payment = self.paypal_service.execute_payment(payment_id, payer_id)
-            serializer = self.get_serializer(data=payment)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(payment, status=status.HTTP_201_CREATED)
+        except PayPalUnavailableError as e:
+            return _unavailable(e)
         except PaymentError as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['get'], url_path='transport-stats',
+            permission_classes=[permissions.IsAdminUser])
+    def transport_stats(self, request):
+        # Statistiques du pool HTTP PayPal et du cache de statut de ce processus, pour les dimensionner
+        return Response({
+            **get_transport().stats(), **resilience.stats(),
+            'status_cache': status_cache.stats(), 'merchant_apis': merchants.get_pool().stats(),
+            'replicas': replicas.stats(),
+        })
+
     @action(detail=True, methods=['post'])
+    @idempotent
     def refund(self, request, pk=None):
         try:
             payment = get_object_or_404(Payment, pk=pk)
-            amount = float(request.data.get('amount'))
+            amount = _parse_amount(request.data.get('amount'), required=False)
             reason = request.data.get('reason', '')
-            refund = self.paypal_service.refund_payment(payment, amount, reason)
-            serializer = PaymentRefundSerializer(data=refund)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            if self._wants_async(request):
+                job = jobs.enqueue(PaymentJob.Kind.REFUND, {
+                    'payment_id': payment.payment_id,
+                    'amount': str(amount) if amount else None,
+                    'reason': reason,
+                })
+                return self._accepted(job)
+            refund = self.paypal_service.refund_payment(payment.payment_id, amount, reason)
+            serializer = PaymentRefundSerializer(refund)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
+        except PayPalUnavailableError as e:
+            return _unavailable(e)
         except PaymentError as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(_error_body(e), status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
+
+
+def _unavailable(error):
+    # Disjoncteur ouvert : échec immédiat, le client sait quand réessayer
+    return Response(
+        {'error': str(error)},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(error.retry_after)}
+    )
+
+
+def _parse_moment(param, value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({param: 'Date invalide (AAAA-MM-JJ ou ISO 8601)'})
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class PaymentJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Suivi des jobs créés par les réponses 202 de PaymentViewSet."""
+    queryset = PaymentJob.objects.all()
+    serializer_class = PaymentJobSerializer
+
+
+# Vues asynchrones : à servir via config/asgi.py (ex. uvicorn config.asgi:application)
+# pour garder des centaines d'appels PayPal en vol par processus.
+
+async_payment_service = AsyncPaymentService()
+
+
+def _json_body(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except ValueError:
+        return {}
+
+
+def _parse_amount(value, required=True):
+    """Montant fini et strictement positif.
+
+    Absent ou vide : None si `required` est faux (remboursement du restant), erreur sinon.
+    Toute autre valeur illisible est refusée : une faute de frappe ne doit pas devenir
+    un remboursement total.
+    """
+    if value in (None, '') and not required:
+        return None
+    try:
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        amount = None
+    if amount is None or not amount.is_finite() or amount <= 0:
+        raise PaymentValidationError("Montant invalide", code='invalid_amount', params={'amount': str(value)})
+    return amount
+
+
+def _error_body(error):
+    body = {'error': str(error)}
+    if error.code:
+        body['code'] = error.code
+    return body
+
+
+def _async_unavailable(error):
+    # Même réponse que _unavailable() pour les vues DRF
+    response = JsonResponse({'error': str(error)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@csrf_exempt
+@require_POST
+async def async_create_payment(request):
+    data = _json_body(request)
+    try:
+        amount = _parse_amount(data.get('amount'))
+        merchant = await sync_to_async(merchants.get_merchant)(data.get('merchant'))
+        payment = await async_payment_service.create_payment(amount, data.get('description', ''), merchant=merchant)
+        return JsonResponse(payment, status=status.HTTP_200_OK)
+    except PayPalUnavailableError as e:
+        return _async_unavailable(e)
+    except PaymentError as e:
+        return JsonResponse(_error_body(e), status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+@require_POST
+async def async_execute_payment(request):
+    data = _json_body(request)
+    try:
+        payment = await async_payment_service.execute_payment(
+            data.get('payment_id'), data.get('payer_id')
+        )
+        return JsonResponse(payment, status=status.HTTP_200_OK)
+    except PayPalUnavailableError as e:
+        return _async_unavailable(e)
+    except PaymentError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+@require_POST
+async def async_refund_payment(request, pk):
+    data = _json_body(request)
+    payment = await Payment.objects.filter(pk=pk).afirst()
+    if payment is None:
+        return JsonResponse({'error': 'Paiement introuvable'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        refund = await async_payment_service.refund_payment(
+            payment.payment_id, _parse_amount(data.get('amount'), required=False), data.get('reason', '')
+        )
+        return JsonResponse(PaymentRefundSerializer(refund).data, status=status.HTTP_201_CREATED)
+    except PayPalUnavailableError as e:
+        return _async_unavailable(e)
+    except PaymentError as e:
+        return JsonResponse(_error_body(e), status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _sse(event, data=None, event_id=None):
+    lines = [f'event: {event}']
+    if event_id:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def _status_stream(payment, timeout):
+    config = settings.PAYMENTS_SUBSCRIPTIONS
+    yield f"retry: {config['SSE_RETRY_MS']}\n\n"
+    yield _sse('status', payment, payment['updated_at'])
+    if payment['status'] != Payment.Status.PENDING:
+        return
+    last_write = monotonic()
+    with subscriptions.subscribers.track(mode='sse'):
+        async with aclosing(subscriptions.watch(payment, timeout)) as changes:
+            async for current in changes:
+                if current is not None:
+                    yield _sse('status', current, current['updated_at'])
+                    last_write = monotonic()
+                    if current['status'] != Payment.Status.PENDING:
+                        return
+                elif monotonic() - last_write >= config['HEARTBEAT']:
+                    yield ': keep-alive\n\n'
+                    last_write = monotonic()
+    yield _sse('timeout')
+
+
+@require_GET
+async def async_payment_status(request, key):
+    """Attend que le paiement quitte PENDING, au lieu d'interroger GET /payments/{id}/ en boucle.
+
+    - `Accept: text/event-stream` : flux SSE, un événement `status` par changement,
+      fermé quand le statut n'est plus PENDING (ou après SSE_TIMEOUT, le client se reconnecte) ;
+    - sinon long-poll : répond dès que le statut diffère de `?status=` (par défaut pending)
+      ou après `?timeout=` secondes (au plus LONG_POLL_TIMEOUT) avec l'état courant.
+    """
+    config = settings.PAYMENTS_SUBSCRIPTIONS
+    payment = await subscriptions.get_payment(key)
+    if payment is None:
+        return JsonResponse({'error': 'Paiement introuvable'}, status=status.HTTP_404_NOT_FOUND)
+
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        response = StreamingHttpResponse(
+            _status_stream(payment, config['SSE_TIMEOUT']), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx : ne pas tamponner le flux
+        return response
+
+    seen = request.GET.get('status', Payment.Status.PENDING)
+    try:
+        timeout = min(float(request.GET.get('timeout', config['LONG_POLL_TIMEOUT'])), config['LONG_POLL_TIMEOUT'])
+    except ValueError:
+        return JsonResponse({'error': 'timeout invalide'}, status=status.HTTP_400_BAD_REQUEST)
+    if payment['status'] == seen and timeout > 0:
+        with subscriptions.subscribers.track(mode='long_poll'):
+            async with aclosing(subscriptions.watch(payment, timeout)) as changes:
+                async for current in changes:
+                    if current is not None:
+                        payment = current
+                        if payment['status'] != seen:
+                            break
+    return JsonResponse(payment, status=status.HTTP_200_OK)
+
+
+@csrf_exempt
+@require_POST
+def paypal_webhook(request):
+    # Vérification puis simple écriture dans la boîte de réception :
+    # l'application aux paiements se fait par lots (manage.py process_webhooks)
+    try:
+        verify_signature(request.headers, request.body)
+    except WebhookVerificationError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    event = _json_body(request)
+    if not isinstance(event, dict) or not event.get('id'):
+        return JsonResponse({'error': 'Événement invalide'}, status=status.HTTP_400_BAD_REQUEST)
+    record_event(event)
+    return JsonResponse({'status': 'received'}, status=status.HTTP_200_OK)
+
+
+def metrics_view(request):
+    # Séries du processus qui répond ; à collecter sur chaque worker
+    config = settings.PAYMENTS_METRICS
+    if not config['ENABLED']:
+        return HttpResponse(status=404)
+    if not config['TOKEN']:
+        # Sans jeton, les métriques ne sont servies qu'en développement
+        if not settings.DEBUG:
+            logger.error("/metrics activé sans PAYMENTS_METRICS_TOKEN : accès refusé")
+            return HttpResponse(status=403)
+    elif not hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f"Bearer {config['TOKEN']}".encode()
+    ):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
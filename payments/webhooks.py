@@ -0,0 +1,212 @@
+import base64
+import hashlib
+import logging
+import zlib
+from decimal import Decimal
+from urllib.parse import urlparse
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from payments import ledger, rollups, status_cache
+from payments.exceptions import WebhookVerificationError
+from payments.models import Payment, PaymentRefund, WebhookEvent
+from payments.transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_ALGORITHMS = {
+    'SHA256withRSA': hashes.SHA256(),
+    'SHA1withRSA': hashes.SHA1(),
+}
+
+
+def _load_certificate(cert_url):
+    """Certificat de signature PayPal : fichier local configuré, ou cert_url (hôte paypal.com) mis en cache."""
+    cert_path = settings.PAYPAL_CONFIG['PAYPAL_WEBHOOK_CERT_PATH']
+    if cert_path:
+        with open(cert_path, 'rb') as f:
+            return x509.load_pem_x509_certificate(f.read())
+
+    parsed = urlparse(cert_url or '')
+    if parsed.scheme != 'https' or not (parsed.hostname or '').endswith('.paypal.com'):
+        raise WebhookVerificationError("URL de certificat non autorisée", code='invalid_cert_url')
+
+    cache = caches['payments']
+    cache_key = f'paypal:webhook-cert:{hashlib.sha256(cert_url.encode()).hexdigest()}'
+    pem = cache.get(cache_key)
+    if pem is None:
+        response = get_transport().request('GET', cert_url, operation='lookup')
+        if response.status_code != 200:
+            raise WebhookVerificationError("Certificat PayPal inaccessible", code='cert_unavailable')
+        pem = response.content
+        cache.set(cache_key, pem, timeout=24 * 3600)
+    return x509.load_pem_x509_certificate(pem)
+
+
+def verify_signature(headers, body):
+    """Vérifie localement la signature d'un webhook PayPal (sans appel verify-webhook-signature).
+
+    `headers` : en-têtes HTTP de la requête, `body` : corps brut (bytes).
+    """
+    webhook_id = settings.PAYPAL_CONFIG['PAYPAL_WEBHOOK_ID']
+    if not webhook_id:
+        raise WebhookVerificationError("PAYPAL_WEBHOOK_ID n'est pas configuré", code='webhook_not_configured')
+
+    transmission_id = headers.get('Paypal-Transmission-Id')
+    transmission_time = headers.get('Paypal-Transmission-Time')
+    signature = headers.get('Paypal-Transmission-Sig')
+    algorithm = SIGNATURE_ALGORITHMS.get(headers.get('Paypal-Auth-Algo', 'SHA256withRSA'))
+    if not (transmission_id and transmission_time and signature and algorithm):
+        raise WebhookVerificationError("En-têtes de signature manquants", code='missing_headers')
+
+    certificate = _load_certificate(headers.get('Paypal-Cert-Url'))
+    expected = f'{transmission_id}|{transmission_time}|{webhook_id}|{zlib.crc32(body)}'
+    try:
+        certificate.public_key().verify(
+            base64.b64decode(signature), expected.encode('utf-8'), padding.PKCS1v15(), algorithm
+        )
+    except (InvalidSignature, ValueError):
+        raise WebhookVerificationError("Signature du webhook invalide", code='invalid_signature')
+
+    # Horodatage signé : une livraison capturée ne peut pas être rejouée hors de la fenêtre
+    try:
+        sent_at = parse_datetime(transmission_time)
+    except ValueError:
+        sent_at = None
+    tolerance = settings.PAYPAL_CONFIG['PAYPAL_WEBHOOK_TOLERANCE']
+    if sent_at is None or sent_at.tzinfo is None or abs((timezone.now() - sent_at).total_seconds()) > tolerance:
+        raise WebhookVerificationError("Webhook hors de la fenêtre de réception", code='stale_transmission')
+
+
+def record_event(event):
+    """Enregistre l'événement dans la boîte de réception ; les doublons PayPal sont ignorés."""
+    webhook_event, created = WebhookEvent.objects.get_or_create(
+        event_id=event['id'],
+        defaults={
+            'event_type': event.get('event_type', ''),
+            'resource_type': event.get('resource_type'),
+            'payload': event,
+        },
+    )
+    return webhook_event, created
+
+
+def _apply(event, payment, new_refunds):
+    """Applique un événement au paiement en mémoire. Renvoie False s'il ne nous concerne pas."""
+    resource = event.payload.get('resource', {})
+    event_type = event.event_type
+
+    if event_type == 'PAYMENT.SALE.COMPLETED':
+        payment.sale_id = resource.get('id')
+        if payment.status == Payment.Status.PENDING:
+            payment.status = Payment.Status.COMPLETED
+        return True
+
+    if event_type == 'PAYMENT.SALE.DENIED':
+        # Un DENIED tardif ou rejoué ne doit pas écraser un paiement déjà abouti ou remboursé
+        if payment.status != Payment.Status.PENDING:
+            return False
+        payment.sale_id = resource.get('id')
+        payment.status = Payment.Status.FAILED
+        payment.error_message = f'Vente refusée par PayPal ({resource.get("state")})'
+        return True
+
+    if event_type in ('PAYMENT.SALE.REFUNDED', 'PAYMENT.SALE.REVERSED'):
+        if resource.get('sale_id'):
+            payment.sale_id = resource['sale_id']
+        refund_id = resource.get('id')
+        if refund_id not in payment.known_refund_ids:
+            payment.known_refund_ids.add(refund_id)
+            amount = abs(Decimal(resource.get('amount', {}).get('total', '0')))
+            payment.refunded_amount += amount
+            new_refunds.append(PaymentRefund(
+                payment=payment,
+                refund_id=refund_id,
+                amount=amount,
+                reason=event_type,
+            ))
+        payment.status = ledger.refunded_status(payment.amount, payment.refunded_amount)
+        return True
+
+    return False
+
+
+def _payment_id_of(event):
+    resource = event.payload.get('resource', {})
+    return resource.get('parent_payment')
+
+
+def process_pending_events(batch_size=None):
+    """Traite un lot d'événements reçus : une requête de lecture, puis bulk_update/bulk_create.
+
+    Renvoie le nombre d'événements traités.
+    """
+    batch_size = batch_size or settings.PAYPAL_CONFIG['PAYPAL_WEBHOOK_BATCH_SIZE']
+    with transaction.atomic():
+        events = WebhookEvent.objects.filter(status=WebhookEvent.Status.RECEIVED).order_by('created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            events = events.select_for_update(skip_locked=True)
+        events = list(events[:batch_size])
+        if not events:
+            return 0
+
+        payment_ids = {_payment_id_of(event) for event in events} - {None}
+        payments = {}
+        # Verrou sur les paiements : refunded_amount est aussi modifié par les remboursements en cours
+        for payment in Payment.objects.select_for_update().filter(payment_id__in=payment_ids):
+            payment.known_refund_ids = set()
+            payment.loaded_status = payment.status
+            payments[payment.payment_id] = payment
+        by_pk = {payment.pk: payment for payment in payments.values()}
+        refunds = PaymentRefund.objects.filter(payment__in=by_pk).values_list('payment_id', 'refund_id')
+        for payment_pk, refund_id in refunds:
+            by_pk[payment_pk].known_refund_ids.add(refund_id)
+
+        touched = {}
+        new_refunds = []
+        now = timezone.now()
+        for event in events:
+            event.attempts += 1
+            event.processed_at = now
+            payment = payments.get(_payment_id_of(event))
+            if payment is None:
+                event.status = WebhookEvent.Status.IGNORED
+                continue
+            try:
+                applied = _apply(event, payment, new_refunds)
+            except Exception as e:
+                logger.error("Erreur de traitement du webhook %s: %s", event.event_id, e)
+                event.status = WebhookEvent.Status.FAILED
+                event.error_message = str(e)
+                continue
+            event.status = WebhookEvent.Status.PROCESSED if applied else WebhookEvent.Status.IGNORED
+            if applied:
+                touched[payment.pk] = payment
+
+        if touched:
+            for payment in touched.values():
+                payment.updated_at = now
+            Payment.objects.bulk_update(
+                touched.values(), ['status', 'sale_id', 'refunded_amount', 'error_message', 'updated_at']
+            )
+            rollups.record_status_changes(
+                [(payment, payment.loaded_status) for payment in touched.values()]
+            )
+            status_cache.invalidate(*touched)
+        if new_refunds:
+            rollups.record_refunds(PaymentRefund.objects.bulk_create(new_refunds))
+        for event in events:
+            event.updated_at = now
+        WebhookEvent.objects.bulk_update(
+            events, ['status', 'attempts', 'processed_at', 'error_message', 'updated_at']
+        )
+    logger.info("Webhooks traités: %d (paiements mis à jour: %d)", len(events), len(touched))
+    return len(events)